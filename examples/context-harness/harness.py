@@ -25,6 +25,13 @@ from typing import Any
 
 import anthropic
 
+# Shared token counter from the context-fundamentals skill, when
+# skills/context-fundamentals/scripts is on PYTHONPATH.
+try:
+    from token_counter import TokenCounter, get_default_counter
+except ImportError:
+    TokenCounter = None
+
 
 # --- Workspace ---
 
@@ -143,16 +150,24 @@ class ContextBudget:
     regardless of model's advertised window).
 
     Compaction triggers at 80% utilization.
+
+    Tokens are counted by `counter` (default: the shared memoized
+    TokenCounter, ~4 chars per token unless another backend is set).
     """
 
-    def __init__(self, budget: int = 25_000):
+    def __init__(self, budget: int = 25_000, counter: TokenCounter | None = None):
         self.budget = budget
         self.current = 0
         self.history: list[dict[str, int]] = []
+        if counter is None and TokenCounter is not None:
+            counter = get_default_counter()
+        self.counter = counter
 
     def estimate_tokens(self, text: str) -> int:
-        """Rough estimate: 1 token ~= 4 chars for English."""
-        return len(text) // 4
+        """Token count from the counter; 1 token ~= 4 chars without one."""
+        if self.counter is None:
+            return len(text) // 4
+        return self.counter.count(text)
 
     def track(self, role: str, content: str) -> int:
         tokens = self.estimate_tokens(content)
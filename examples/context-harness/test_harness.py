@@ -190,6 +190,19 @@ class TestContextBudget:
         assert budget.remaining == 0
 
 
+# --- Token Counting Tests ---
+
+
+class TestTokenCounting:
+    def test_budget_uses_pluggable_counter(self):
+        class WordCounter:
+            def count(self, text):
+                return len(text.split())
+
+        budget = ContextBudget(1000, counter=WordCounter())
+        assert budget.track("user", "one two three") == 3
+
+
 # --- Observation Masking Tests ---
 
 
@@ -11,25 +11,30 @@ model-specific tokenizers for other providers) for accurate token counts.
 from typing import Dict, List
 import hashlib
 
+try:
+    from token_counter import count_tokens
+except ImportError:
+    def count_tokens(text: str) -> int:
+        return len(text) // 4
+
 
 def estimate_token_count(text: str) -> int:
     """
     Estimate token count for text.
     
-    Uses approximation: ~4 characters per token for English.
+    Delegates to the shared, memoized counter in token_counter.py, which
+    defaults to ~4 characters per token for English.
     
-    WARNING: This is a rough estimate for demonstration purposes.
-    Production systems should use actual tokenizers:
-    - OpenAI: tiktoken library
-    - Anthropic: Model-specific tokenizers
-    - Other: Provider-specific tokenization
+    WARNING: The default is a rough estimate for demonstration purposes.
+    Production systems should plug in an actual tokenizer with
+    token_counter.set_default_counter (BPEBackend, TiktokenBackend).
     
     Actual tokenization varies by:
     - Model architecture
     - Content type (code vs prose)
     - Language (non-English typically has higher token/char ratio)
     """
-    return len(text) // 4
+    return count_tokens(text)
 
 
 def estimate_message_tokens(messages: list) -> int:
@@ -0,0 +1,52 @@
+"""
+Tests for the token counter.
+
+Run from this directory: python -m pytest -q test_token_counter.py
+"""
+
+import base64
+
+from token_counter import BPEBackend, HeuristicBackend, TokenCounter
+
+
+class TestTokenCounter:
+    def test_counts_are_memoized(self):
+        calls = []
+
+        def backend(text):
+            calls.append(text)
+            return len(text) // 4
+
+        counter = TokenCounter(backend)
+        text = "x" * 4000
+        assert counter.count(text) == counter.count(text) == 1000
+        assert len(calls) == 1
+        assert counter.stats == {"hits": 1, "misses": 1}
+
+    def test_heuristic_counts_are_not_cached(self):
+        counter = TokenCounter()
+        text = "x" * 4000
+        assert counter.count(text) == counter.count(text) == 1000
+        assert counter.stats == {"hits": 0, "misses": 0}
+
+    def test_heuristic_calibration(self):
+        backend = HeuristicBackend()
+        assert backend.calibrate([("x" * 30, 10), ("y" * 30, 10)]) == 3.0
+        assert backend.count("z" * 300) == 100
+
+    def test_running_count_for_appended_text(self):
+        running = TokenCounter().running()
+        running.append("x" * 400)
+        assert running.append("y" * 800) == 300
+
+
+class TestBPEBackend:
+    def test_counts_from_vocab_file(self, tmp_path):
+        tokens = [bytes([b]) for b in range(256)] + [b"he", b"ll", b"hell", b"hello"]
+        vocab = tmp_path / "vocab.tiktoken"
+        vocab.write_text("\n".join(
+            f"{base64.b64encode(t).decode()} {rank}" for rank, t in enumerate(tokens)))
+        backend = BPEBackend(str(vocab))
+        assert backend.count("hello") == 1
+        # "hello" + " help", which merges only to " ", "he", "l", "p"
+        assert backend.count("hello help") == 5
@@ -0,0 +1,225 @@
+"""
+Token Counting
+
+One token counter for the context scripts, instead of a `len(text) // 4`
+in every module. Counting is pluggable and memoized:
+
+- HeuristicBackend: characters per token, calibratable from samples with
+  known counts (default 4.0, the usual English approximation)
+- BPEBackend: byte-pair encoding from a local vocab file in tiktoken's
+  "<base64 token> <rank>" format, no network or extra packages needed
+- TiktokenBackend: the tiktoken library, when installed
+
+TokenCounter caches BPE and tiktoken counts by content hash, so
+re-counting the same system prompt, tool definition or file read is a
+dictionary lookup; the heuristic is cheaper than hashing and is counted
+directly. RunningCount tracks append-only text (message history, scratch
+files) by counting only what was appended.
+
+Usage:
+    from token_counter import count_tokens, set_default_counter
+    count_tokens("some text")
+    set_default_counter(TokenCounter(BPEBackend("cl100k_base.tiktoken")))
+"""
+
+import base64
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+
+# Backends
+
+class HeuristicBackend:
+    """Characters-per-token estimate."""
+
+    name = "heuristic"
+    cacheable = False  # O(1); hashing the text would cost more
+
+    def __init__(self, chars_per_token: float = 4.0):
+        if chars_per_token <= 0:
+            raise ValueError("chars_per_token must be positive")
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return int(len(text) // self.chars_per_token)
+
+    def calibrate(self, samples: List[Tuple[str, int]]) -> float:
+        """Fit chars_per_token to (text, true token count) samples."""
+        chars = sum(len(text) for text, _ in samples)
+        tokens = sum(count for _, count in samples)
+        if not chars or not tokens:
+            raise ValueError("Calibration needs non-empty samples")
+        self.chars_per_token = chars / tokens
+        return self.chars_per_token
+
+
+# Approximation of the cl100k pre-tokenizer using only the re module
+_PRETOKENIZE = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+"
+)
+
+
+class BPEBackend:
+    """Byte-level BPE with merge ranks read from a local vocab file.
+
+    Text is split into pre-tokens, and each pre-token's bytes are merged
+    pairwise, lowest rank first, until no adjacent pair is in the vocab.
+    """
+
+    name = "bpe"
+    cacheable = True
+
+    def __init__(self, vocab_path: str):
+        self.ranks: Dict[bytes, int] = {}
+        with open(vocab_path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    token, rank = line.split()
+                    self.ranks[base64.b64decode(token)] = int(rank)
+        self.name = f"bpe:{vocab_path}"
+
+    def count(self, text: str) -> int:
+        return sum(len(self._merge(piece.encode("utf-8")))
+                   for piece in _PRETOKENIZE.findall(text))
+
+    def _merge(self, piece: bytes) -> List[bytes]:
+        if piece in self.ranks:
+            return [piece]
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best, best_rank = None, None
+            for i in range(len(parts) - 1):
+                rank = self.ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best, best_rank = i, rank
+            if best is None:
+                break
+            parts[best:best + 2] = [parts[best] + parts[best + 1]]
+        return parts
+
+
+class TiktokenBackend:
+    """Exact counts from the tiktoken library (optional dependency)."""
+
+    cacheable = True
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        try:
+            import tiktoken
+        except ImportError as e:
+            raise ImportError("TiktokenBackend requires tiktoken: "
+                              "pip install tiktoken") from e
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken:{encoding}"
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+# Memoized counter
+
+class TokenCounter:
+    """Counts tokens with a backend, caching results by content hash.
+
+    `backend` is any object with count(text), or a plain function. The
+    cache is an LRU of `max_entries` 16-byte digests; texts shorter than
+    `min_cached_chars` are counted directly, as hashing them costs about
+    as much as counting. Backends with `cacheable = False` (the
+    heuristic) are never cached; others, plain functions included, are.
+    """
+
+    def __init__(self, backend: Union[object, Callable[[str], int]] = None,
+                 max_entries: int = 65536, min_cached_chars: int = 64):
+        if backend is None:
+            backend = HeuristicBackend()
+        elif not hasattr(backend, "count"):
+            backend = _FunctionBackend(backend)
+        self.backend = backend
+        self.cacheable = getattr(backend, "cacheable", True)
+        self.max_entries = max_entries
+        self.min_cached_chars = min_cached_chars
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if not self.cacheable or len(text) < self.min_cached_chars:
+            return self.backend.count(text)
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"),
+                              digest_size=16).digest()
+        count = self._cache.get(key)
+        if count is not None:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return count
+        self.stats["misses"] += 1
+        count = self.backend.count(text)
+        self._cache[key] = count
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return count
+
+    def running(self) -> "RunningCount":
+        """A running total for append-only text."""
+        return RunningCount(self)
+
+
+class RunningCount:
+    """Token total of append-only text, counting only appended chunks.
+
+    Exact for the heuristic up to per-chunk rounding; BPE merges across
+    a chunk boundary can make it differ from a full recount by a token.
+    """
+
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+        self.total = 0
+
+    def append(self, text: str) -> int:
+        """Count `text`; returns the new total."""
+        self.total += self.counter.count(text)
+        return self.total
+
+
+class _FunctionBackend:
+    def __init__(self, function: Callable[[str], int]):
+        self.count = function
+        self.name = getattr(function, "__name__", "function")
+
+
+# Process-wide default
+
+_default_counter: Optional[TokenCounter] = None
+
+
+def get_default_counter() -> TokenCounter:
+    """The shared counter used by count_tokens()."""
+    global _default_counter
+    if _default_counter is None:
+        _default_counter = TokenCounter()
+    return _default_counter
+
+
+def set_default_counter(counter: TokenCounter):
+    """Replace the shared counter, e.g. with a BPE or tiktoken backend."""
+    global _default_counter
+    _default_counter = counter
+
+
+def count_tokens(text: str) -> int:
+    """Token count of `text` with the shared counter."""
+    return get_default_counter().count(text)
+
+
+if __name__ == "__main__":
+    counter = get_default_counter()
+    sample = "The quick brown fox jumps over the lazy dog. " * 20
+    print(f"{counter.backend.name}: {counter.count(sample)} tokens")
+
+    # The heuristic is never cached; slower backends are
+    words = TokenCounter(lambda text: len(text.split()))
+    words.count(sample)
+    print(f"words: {words.count(sample)} tokens, cache stats: {words.stats}")
@@ -20,18 +20,32 @@ PRODUCTION NOTES:
   with actual inference infrastructure metrics.
 """
 
-from typing import List, Dict
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Iterable
 import hashlib
+import io
+import json
+import re
 import time
 
+# Token counting is shared with context-fundamentals (token_counter.py) when
+# its scripts directory is on PYTHONPATH; otherwise ~4 characters per token.
+try:
+    from token_counter import count_tokens
+except ImportError:
+    def count_tokens(text: str) -> int:
+        return len(text) // 4
+
 
 def estimate_token_count(text: str) -> int:
     """
     Estimate token count for text.
     
-    Uses approximation: ~4 characters per token for English.
+    Delegates to the shared, memoized token counter; its default backend
+    approximates ~4 characters per token for English.
     
-    WARNING: This is a rough estimate. Actual tokenization varies by:
+    WARNING: That default is a rough estimate. Actual tokenization varies by:
     - Model (GPT-5.2, Claude 4.5, Gemini 3 have different tokenizers)
     - Content type (code typically has higher token density)
     - Language (non-English may have 2-3x higher token/char ratio)
@@ -40,8 +54,12 @@ def estimate_token_count(text: str) -> int:
         import tiktoken
         enc = tiktoken.encoding_for_model("gpt-4")  # Use appropriate model
         token_count = len(enc.encode(text))
+    
+    or, for every caller at once:
+        from token_counter import TiktokenBackend, TokenCounter, set_default_counter
+        set_default_counter(TokenCounter(TiktokenBackend()))
     """
-    return len(text) // 4
+    return count_tokens(text)
 
 
 def estimate_message_tokens(messages: list) -> int:
@@ -109,26 +127,71 @@ def summarize_content(content: str, category: str, max_length: int = 500) -> str
         return summarize_general(content, max_length)
 
 
+# Patterns are compiled once and matched line by line. A metric key at
+# the end of a line takes its value from the next non-blank line, and a
+# decision or question marker also counts at the end of a line ("...?"),
+# where the text it introduces would be on the following lines.
+# Case-insensitive patterns are matched against the lowercased line,
+# which is several times faster than re.IGNORECASE.
+_METRIC_PATTERN = re.compile(r'(\w+):\s*([\d.,]+)')
+_METRIC_KEY_PATTERN = re.compile(r'(\w+):\s*$')
+_METRIC_VALUE_PATTERN = re.compile(r'\s*([\d.,]+)')
+_FINDING_PATTERN = re.compile(r'result|found|total|success|error|value')
+_DECISION_PATTERN = re.compile(
+    r'(?:decided|decision|chose|chosen)(?:[:\s]+[^.]+|[:\s]*$)')
+_QUESTION_PATTERN = re.compile(r'(?:\?|question)(?:[:\s]+[^.]+|[:\s]*$)')
+
+
 def summarize_tool_output(content: str, max_length: int = 500) -> str:
     """Summarize tool output."""
-    # Extract key metrics and findings
-    import re
-    
-    # Look for metrics (numbers with context)
-    metrics = re.findall(r'(\w+):\s*([\d.,]+)', content)
+    return summarize_tool_output_stream(io.StringIO(content), max_length)
+
+
+def summarize_tool_output_stream(lines: Iterable[str],
+                                 max_length: int = 500) -> str:
+    """
+    Summarize tool output from a line iterator or open file in one pass.
     
-    # Look for key findings (lines with important keywords)
-    keywords = ["result", "found", "total", "success", "error", "value"]
+    Metrics are kept only until they fill max_length and findings until
+    three are found, after which reading stops, so memory is bounded by
+    the longest line rather than the output size.
+    """
+    metrics = []
+    # Length of the rendered "Metrics: k=v, ..." part
+    metrics_length = len("Metrics: ") - 2
+    pending_key = None  # metric key that ended the previous line
     findings = []
-    for line in content.split('\n'):
-        if any(kw in line.lower() for kw in keywords):
+    for line in lines:
+        # Extract key metrics (numbers with context)
+        if metrics_length < max_length:
+            pairs, start = [], 0
+            if pending_key is not None:
+                carried = _METRIC_VALUE_PATTERN.match(line)
+                if carried:
+                    pairs.append((pending_key, carried.group(1)))
+                    start = carried.end()
+                if carried or line.strip():
+                    pending_key = None
+            for match in _METRIC_PATTERN.finditer(line, start):
+                pairs.append(match.groups())
+                start = match.end()
+            trailing = _METRIC_KEY_PATTERN.search(line, start)
+            if trailing:
+                pending_key = trailing.group(1)
+            for key, value in pairs:
+                metrics.append(f"{key}={value}")
+                metrics_length += len(metrics[-1]) + 2
+        # Key findings (lines with important keywords)
+        if len(findings) < 3 and _FINDING_PATTERN.search(line.lower()):
             findings.append(line.strip())
+        if metrics_length >= max_length and len(findings) >= 3:
+            break
     
     summary_parts = []
     if metrics:
-        summary_parts.append(f"Metrics: {', '.join([f'{k}={v}' for k, v in metrics])}")
+        summary_parts.append(f"Metrics: {', '.join(metrics)}")
     if findings:
-        summary_parts.append("Key findings: " + "; ".join(findings[:3]))
+        summary_parts.append("Key findings: " + "; ".join(findings))
     
     result = " | ".join(summary_parts) if summary_parts else "[Tool output summarized]"
     return result[:max_length]
@@ -136,17 +199,23 @@ def summarize_tool_output(content: str, max_length: int = 500) -> str:
 
 def summarize_conversation(content: str, max_length: int = 500) -> str:
     """Summarize conversational content."""
+    return summarize_conversation_stream(io.StringIO(content), max_length)
+
+
+def summarize_conversation_stream(lines: Iterable[str],
+                                  max_length: int = 500) -> str:
+    """Summarize a conversation transcript in one pass, keeping only counts."""
     # Identify key decisions and questions
-    import re
-    
-    decisions = re.findall(r'(?i)(?:decided|decision|chose|chosen)[:\s]+([^.]+)', content)
-    questions = re.findall(r'(?:\?|question)[:\s]+([^.]+)', content)
+    decisions = questions = 0
+    for line in lines:
+        decisions += len(_DECISION_PATTERN.findall(line.lower()))
+        questions += len(_QUESTION_PATTERN.findall(line))
     
     summary_parts = []
     if decisions:
-        summary_parts.append(f"Decisions: {len(decisions)} made")
+        summary_parts.append(f"Decisions: {decisions} made")
     if questions:
-        summary_parts.append(f"Questions: {len(questions)} raised")
+        summary_parts.append(f"Questions: {questions} raised")
     
     result = " | ".join(summary_parts) if summary_parts else "[Conversation summarized]"
     return result[:max_length]
@@ -154,16 +223,54 @@ def summarize_conversation(content: str, max_length: int = 500) -> str:
 
 def summarize_document(content: str, max_length: int = 500) -> str:
     """Summarize document content."""
+    return summarize_document_stream(io.StringIO(content), max_length)
+
+
+def summarize_document_stream(lines: Iterable[str],
+                              max_length: int = 500) -> str:
+    """
+    Summarize a document from its first paragraph.
+    
+    Reads only up to the first blank line, and at most max_length + 2
+    characters of it, which is enough to find the first two sentences.
+    """
     # Extract first paragraph as summary
-    paragraphs = content.split('\n\n')
-    if paragraphs:
-        first_para = paragraphs[0].strip()
-        # Truncate to first few sentences
-        sentences = first_para.split('. ')
-        if len(sentences) > 2:
-            first_para = '. '.join(sentences[:2]) + '.'
-        return first_para[:max_length]
-    return "[Document summarized]"
+    paragraph = []
+    length = 0
+    for line in lines:
+        if paragraph and line in ("\n", "\r\n", ""):
+            break
+        paragraph.append(line)
+        length += len(line)
+        if length > max_length + 2:
+            break
+    first_para = "".join(paragraph).strip()
+    
+    # Truncate to first few sentences
+    sentences = first_para.split('. ')
+    if len(sentences) > 2:
+        first_para = '. '.join(sentences[:2]) + '.'
+    return first_para[:max_length]
+
+
+def summarize_stream(lines: Iterable[str], category: str,
+                     max_length: int = 500) -> str:
+    """summarize_content for a line iterator or open file handle."""
+    if category == "tool_output":
+        return summarize_tool_output_stream(lines, max_length)
+    elif category == "conversation":
+        return summarize_conversation_stream(lines, max_length)
+    elif category == "retrieved_document":
+        return summarize_document_stream(lines, max_length)
+    else:
+        head = []
+        length = 0
+        for line in lines:
+            head.append(line)
+            length += len(line)
+            if length > max_length:
+                break
+        return summarize_general("".join(head), max_length)
 
 
 def summarize_general(content: str, max_length: int = 500) -> str:
@@ -174,36 +281,156 @@ def summarize_general(content: str, max_length: int = 500) -> str:
 # Observation Masking
 
 class ObservationStore:
-    def __init__(self, max_size=1000):
-        self.observations = {}
-        self.order = []
+    """
+    Holds full observations that were masked out of context.
+    
+    Entries are kept in an LRU (OrderedDict): retrieve() marks an entry as
+    recently used, and the least recently used entries are evicted in O(1)
+    once more than max_size entries or max_bytes of content are held.
+    The most recent entry is always kept, even one larger than max_bytes.
+    With spill_dir set, evicted entries are written there and retrieve()
+    still finds them, promoting them back into memory.
+    
+    Reference IDs are content hashes, so storing the same observation
+    again (a repeated file read or search) returns the same ID and only
+    bumps a reference count; release() drops a reference.
+    """
+    
+    def __init__(self, max_size=1000, max_bytes=64 * 1024 * 1024,
+                 spill_dir: str = None):
+        self.observations: "OrderedDict[str, dict]" = OrderedDict()
         self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.metrics = {"hits": 0, "disk_hits": 0, "misses": 0,
+                        "evictions": 0, "spills": 0,
+                        "stored": 0, "deduplicated": 0,
+                        "bytes_stored": 0, "bytes_deduplicated": 0}
     
     def store(self, content: str, metadata: dict = None) -> str:
-        """Store observation and return reference ID."""
+        """Store observation and return its content-addressed reference ID."""
         ref_id = self._generate_ref_id(content)
+        size = len(content.encode("utf-8"))
+        self.metrics["stored"] += 1
+        self.metrics["bytes_stored"] += size
         
-        self.observations[ref_id] = {
+        entry = self.observations.get(ref_id) or self._unspill(ref_id)
+        if entry is not None:
+            # Same content already held: one copy, one more reference
+            entry["refcount"] += 1
+            self.metrics["deduplicated"] += 1
+            self.metrics["bytes_deduplicated"] += size
+            self._admit(ref_id, entry)
+            return ref_id
+        
+        now = time.time()
+        self._admit(ref_id, {
             "content": content,
             "metadata": metadata or {},
-            "stored_at": time.time(),
-            "last_accessed": time.time()
-        }
-        self.order.append(ref_id)
-        
-        # Evict oldest if over limit
-        if len(self.order) > self.max_size:
-            oldest = self.order.pop(0)
-            del self.observations[oldest]
-        
+            "stored_at": now,
+            "last_accessed": now,
+            "size": size,
+            "refcount": 1
+        })
         return ref_id
     
+    def release(self, ref_id: str) -> int:
+        """Drop one reference; returns how many remain (0: deleted)."""
+        entry = self.observations.get(ref_id)
+        in_memory = entry is not None
+        if not in_memory:
+            entry = self._unspill(ref_id)
+            if entry is None:
+                return 0
+        entry["refcount"] -= 1
+        if entry["refcount"] > 0:
+            if not in_memory:
+                self._spill(ref_id, entry)
+            return entry["refcount"]
+        if in_memory:
+            del self.observations[ref_id]
+            self.bytes_used -= entry["size"]
+        return 0
+    
     def retrieve(self, ref_id: str) -> str:
-        """Retrieve observation by reference ID."""
-        if ref_id in self.observations:
-            self.observations[ref_id]["last_accessed"] = time.time()
-            return self.observations[ref_id]["content"]
-        return None
+        """Retrieve observation by reference ID (memory, then disk)."""
+        entry = self.observations.get(ref_id)
+        if entry is not None:
+            self.observations.move_to_end(ref_id)
+            self.metrics["hits"] += 1
+        else:
+            entry = self._unspill(ref_id)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["disk_hits"] += 1
+            self._admit(ref_id, entry)
+        entry["last_accessed"] = time.time()
+        return entry["content"]
+    
+    def get_metrics(self) -> dict:
+        """Hit, miss, eviction, spill and dedupe counts plus current usage.
+        
+        dedupe_ratio is bytes passed to store() per byte actually kept.
+        """
+        lookups = (self.metrics["hits"] + self.metrics["disk_hits"]
+                   + self.metrics["misses"])
+        unique_bytes = (self.metrics["bytes_stored"]
+                        - self.metrics["bytes_deduplicated"])
+        return {
+            **self.metrics,
+            "entries": len(self.observations),
+            "bytes_used": self.bytes_used,
+            "hit_rate": ((self.metrics["hits"] + self.metrics["disk_hits"])
+                         / lookups if lookups else 0.0),
+            "dedupe_ratio": (self.metrics["bytes_stored"] / unique_bytes
+                             if unique_bytes else 1.0)
+        }
+    
+    def _admit(self, ref_id: str, entry: dict):
+        """Insert as most recently used, then evict down to the budgets.
+        
+        The new entry itself is never evicted here, even if it alone is
+        over max_bytes, so the ref_id just handed out stays retrievable.
+        """
+        previous = self.observations.pop(ref_id, None)
+        if previous is not None:
+            self.bytes_used -= previous["size"]
+        self.observations[ref_id] = entry
+        self.bytes_used += entry["size"]
+        
+        while len(self.observations) > 1 and (
+                len(self.observations) > self.max_size
+                or self.bytes_used > self.max_bytes):
+            evicted_id, evicted = self.observations.popitem(last=False)
+            self.bytes_used -= evicted["size"]
+            self.metrics["evictions"] += 1
+            if self.spill_dir is not None:
+                self._spill(evicted_id, evicted)
+                self.metrics["spills"] += 1
+    
+    def _spill(self, ref_id: str, entry: dict):
+        """Write an entry to its file in spill_dir."""
+        with open(self._spill_file(ref_id), "w") as f:
+            json.dump(entry, f)
+    
+    def _unspill(self, ref_id: str) -> dict:
+        """Load (and remove) a spilled entry, or None."""
+        if self.spill_dir is None:
+            return None
+        path = self._spill_file(ref_id)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            entry = json.load(f)
+        path.unlink()
+        return entry
+    
+    def _spill_file(self, ref_id: str) -> Path:
+        return self.spill_dir / f"{ref_id}.json"
     
     def mask(self, content: str, max_length: int = 200) -> tuple:
         """
@@ -223,9 +450,8 @@ class ObservationStore:
         return masked, ref_id
     
     def _generate_ref_id(self, content: str) -> str:
-        """Generate unique reference ID."""
-        hash_input = f"{content[:100]}{time.time()}"
-        return hashlib.md5(hash_input.encode()).hexdigest()[:8]
+        """Content-addressed reference ID: a hash of the full content."""
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
     
     def _extract_key_point(self, content: str) -> str:
         """Extract key point from observation."""
@@ -321,7 +547,6 @@ def design_stable_prompt(template: str, dynamic_values: dict) -> str:
     result = template
     
     # Replace timestamps
-    import re
     date_pattern = r'\d{4}-\d{2}-\d{2}'
     result = re.sub(date_pattern, '[DATE_STABLE]', result)
     
@@ -0,0 +1,152 @@
+"""
+Tests for the compaction utilities.
+
+Run from this directory: python -m pytest -q test_compaction.py
+"""
+
+import io
+
+from compaction import (ObservationStore, summarize_conversation,
+                        summarize_conversation_stream, summarize_document,
+                        summarize_document_stream, summarize_stream,
+                        summarize_tool_output, summarize_tool_output_stream)
+
+
+class TestObservationEviction:
+    def test_evicts_least_recently_used(self):
+        store = ObservationStore(max_size=2)
+        a = store.store("observation a")
+        b = store.store("observation b")
+        store.retrieve(a)
+        c = store.store("observation c")
+        assert store.retrieve(b) is None
+        assert store.retrieve(a) == "observation a"
+        assert store.retrieve(c) == "observation c"
+
+    def test_evicts_down_to_byte_budget(self):
+        store = ObservationStore(max_bytes=25)
+        ids = [store.store(f"observation {i}") for i in range(3)]  # 13 bytes each
+        assert store.bytes_used == 13
+        assert store.retrieve(ids[0]) is None
+        assert store.retrieve(ids[2]) == "observation 2"
+
+    def test_keeps_observation_over_budget_just_stored(self):
+        store = ObservationStore(max_bytes=10)
+        small = store.store("tiny")
+        large = store.store("x" * 100)
+        assert store.retrieve(large) == "x" * 100
+        assert store.retrieve(small) is None
+        assert store.bytes_used == 100
+
+    def test_spilled_observations_reload_from_disk(self, tmp_path):
+        store = ObservationStore(max_size=1, spill_dir=str(tmp_path))
+        a = store.store("observation a")
+        b = store.store("observation b")
+        assert list(store.observations) == [b]
+        assert store.retrieve(a) == "observation a"
+        assert list(store.observations) == [a]
+        assert store.retrieve(b) == "observation b"
+        metrics = store.get_metrics()
+        assert metrics["disk_hits"] == 2
+        assert metrics["spills"] == 3
+        assert metrics["evictions"] == 3
+
+    def test_metrics(self):
+        store = ObservationStore(max_size=1)
+        a = store.store("observation a")
+        store.retrieve(a)
+        store.store("observation b")
+        store.retrieve(a)
+        metrics = store.get_metrics()
+        assert metrics["hits"] == 1
+        assert metrics["misses"] == 1
+        assert metrics["evictions"] == 1
+        assert metrics["hit_rate"] == 0.5
+        assert metrics["entries"] == 1
+        assert metrics["bytes_used"] == len("observation b")
+
+
+class TestObservationDeduplication:
+    def test_same_content_shares_one_entry(self):
+        store = ObservationStore()
+        first = store.store("same output", {"tool": "read"})
+        second = store.store("same output", {"tool": "read"})
+        assert first == second
+        assert len(store.observations) == 1
+        assert store.bytes_used == len("same output")
+        metrics = store.get_metrics()
+        assert metrics["deduplicated"] == 1
+        assert metrics["dedupe_ratio"] == 2.0
+
+    def test_release_drops_one_reference(self):
+        store = ObservationStore()
+        ref_id = store.store("same output")
+        store.store("same output")
+        assert store.release(ref_id) == 1
+        assert store.retrieve(ref_id) == "same output"
+        assert store.release(ref_id) == 0
+        assert store.retrieve(ref_id) is None
+        assert store.bytes_used == 0
+
+    def test_dedupes_against_spilled_entry(self, tmp_path):
+        store = ObservationStore(max_size=1, spill_dir=str(tmp_path))
+        a = store.store("observation a")
+        store.store("observation b")
+        assert store.store("observation a") == a
+        assert store.get_metrics()["deduplicated"] == 1
+        assert store.release(a) == 1
+        assert store.retrieve(a) == "observation a"
+
+    def test_release_of_spilled_entry_keeps_it_on_disk(self, tmp_path):
+        store = ObservationStore(max_size=1, spill_dir=str(tmp_path))
+        a = store.store("observation a")
+        store.store("observation a")
+        store.store("observation b")
+        assert store.release(a) == 1
+        assert a not in store.observations
+        assert store.retrieve(a) == "observation a"
+
+
+class TestStreamingSummarizers:
+    def test_metric_value_on_next_line(self):
+        summary = summarize_tool_output("latency:\n\n  12.5 ms\nrows: 3\n")
+        assert summary.startswith("Metrics: latency=12.5, rows=3")
+
+    def test_decisions_and_questions_at_line_end(self):
+        transcript = ("We decided:\nuse Postgres.\n"
+                      "Open question\nwho owns the migration?\n")
+        assert summarize_conversation(transcript) == (
+            "Decisions: 1 made | Questions: 2 raised")
+
+    def test_document_stops_at_first_paragraph(self):
+        text = "\nFirst line. Second line. Third line.\n\nNext paragraph."
+        assert summarize_document(text) == "First line. Second line."
+
+    def test_stream_matches_string(self, tmp_path):
+        content = ("status: ok\ntotal: 1,024\nerror rate:\n 0.5\n"
+                   "we decided to retry? question: when\n\nresult found\n")
+        path = tmp_path / "output.txt"
+        path.write_text(content)
+        for stream, summarize in (
+                (summarize_tool_output_stream, summarize_tool_output),
+                (summarize_conversation_stream, summarize_conversation),
+                (summarize_document_stream, summarize_document)):
+            with open(path) as f:
+                assert stream(f) == summarize(content)
+
+    def test_stops_reading_once_summary_is_full(self):
+        read = []
+
+        def lines():
+            for i in range(10_000):
+                read.append(i)
+                yield f"value: {i} result found\n"
+
+        summary = summarize_stream(lines(), "tool_output", max_length=100)
+        assert len(summary) <= 100
+        assert len(read) < 100
+
+    def test_general_summary_reads_only_the_head(self):
+        summary = summarize_stream(io.StringIO("x" * 50 + "\n" + "y" * 5000),
+                                   "other", max_length=60)
+        assert summary == "x" * 50 + "\n" + "y" * 9 + "..."
@@ -19,6 +19,14 @@ from pathlib import Path
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any
 
+# Token counts come from context-fundamentals/scripts/token_counter.py when
+# that directory is on PYTHONPATH; standalone, use ~4 characters per token.
+try:
+    from token_counter import count_tokens
+except ImportError:
+    def count_tokens(text: str) -> int:
+        return len(text) // 4
+
 
 # =============================================================================
 # Pattern 1: Scratch Pad Manager
@@ -39,8 +47,8 @@ class ScratchPadManager:
         self.token_threshold = token_threshold
     
     def estimate_tokens(self, content: str) -> int:
-        """Rough token estimate: ~4 characters per token."""
-        return len(content) // 4
+        """Token estimate from the shared counter (~4 characters per token)."""
+        return count_tokens(content)
     
     def should_offload(self, content: str) -> bool:
         """Determine if content exceeds threshold for offloading."""
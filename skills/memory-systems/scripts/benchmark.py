@@ -0,0 +1,324 @@
+"""
+Memory Store Benchmarks
+
+Measures how the reference memory store behaves as data grows.
+
+Usage:
+    python benchmark.py relationships --edges 1000000
+    python benchmark.py scale --sizes 10000 100000 1000000 --output run.json
+    python benchmark.py scale --sizes 10000 --compare run.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+from memory_store import (HashEmbeddingProvider, PropertyGraph,
+                          TemporalKnowledgeGraph, VectorStore)
+
+RELATION_TYPES = ["WORKS_ON", "LIVES_IN", "KNOWS", "OWNS",
+                  "USES", "MENTIONS", "DEPENDS_ON", "REPORTS_TO"]
+EPOCH = datetime(2024, 1, 1)
+RSS_SLACK_MB = 8.0
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p99 of latency samples, in milliseconds."""
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process, in MB.
+
+    Read from /proc, not ru_maxrss: the peak covers the whole process
+    lifetime, so later sections would inherit earlier sections' memory.
+    Falls back to the peak where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 if sys.platform != "darwin" else peak / 2 ** 20
+
+
+def timed(function, samples: int) -> Dict[str, float]:
+    """Latency percentiles of `samples` calls of function(i)."""
+    latencies = []
+    for i in range(samples):
+        start = time.perf_counter()
+        function(i)
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def synthetic_facts(n: int, seed: int = 0) -> Dict[str, list]:
+    """`n` facts over n / 10 entities, spread over two years."""
+    rng = np.random.default_rng(seed)
+    n_entities = max(1, n // 10)
+    entities = rng.integers(0, n_entities, n)
+    topics = rng.integers(0, 1000, n)
+    days = rng.integers(0, 730, n)
+    return {
+        "n_entities": n_entities,
+        "texts": [f"entity-{e} fact {i} about topic-{t}"
+                  for i, (e, t) in enumerate(zip(entities.tolist(),
+                                                 topics.tolist()))],
+        "metadatas": [{"entity": f"entity-{e}", "session_id": f"s{i % 100}",
+                       "valid_from": (EPOCH + timedelta(days=d)).isoformat()}
+                      for i, (e, d) in enumerate(zip(entities.tolist(),
+                                                     days.tolist()))],
+    }
+
+
+def bench_vector_store(facts: Dict[str, list], dimension: int,
+                       queries: int) -> Dict:
+    """Ingest throughput and search latency of VectorStore."""
+    n = len(facts["texts"])
+    rss_before = rss_mb()
+    store = VectorStore(dimension, embedder=HashEmbeddingProvider(dimension))
+    start = time.perf_counter()
+    store.add_many(facts["texts"], facts["metadatas"])
+    ingest_seconds = time.perf_counter() - start
+    
+    rng = random.Random(1)
+    probes = [rng.choice(facts["texts"]) for _ in range(queries)]
+    entities = [f"entity-{rng.randrange(facts['n_entities'])}"
+                for _ in range(queries)]
+    batch = probes[:32]
+    start = time.perf_counter()
+    store.search_many(batch, limit=10)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "ingest_docs_per_s": n / ingest_seconds,
+        "search": timed(lambda i: store.search(probes[i], limit=10), queries),
+        "search_entity_filter": timed(
+            lambda i: store.search(probes[i], limit=10,
+                                   filters={"entity": entities[i]}), queries),
+        "search_many_queries_per_s": len(batch) / batch_seconds,
+        "rss_delta_mb": rss_mb() - rss_before,
+    }
+
+
+def bench_graphs(facts: Dict[str, list], lookups: int) -> Dict:
+    """Relationship, traversal and temporal query latency."""
+    n = len(facts["texts"])
+    rng = np.random.default_rng(2)
+    sources = rng.integers(0, facts["n_entities"], n).tolist()
+    targets = rng.integers(0, facts["n_entities"], n).tolist()
+    types = rng.integers(0, len(RELATION_TYPES), n).tolist()
+    starts = rng.integers(0, 730, n).tolist()
+    lengths = rng.integers(1, 90, n).tolist()
+    
+    rss_before = rss_mb()
+    graph = TemporalKnowledgeGraph()
+    start = time.perf_counter()
+    node_ids = graph.get_or_create_nodes(
+        [f"entity-{i}" for i in range(facts["n_entities"])])
+    ids = list(node_ids.values())
+    for s, t, k, day, length in zip(sources, targets, types, starts, lengths):
+        graph.create_temporal_relationship(
+            ids[s], RELATION_TYPES[k], ids[t],
+            valid_from=EPOCH + timedelta(days=day),
+            valid_until=EPOCH + timedelta(days=day + length))
+    build_seconds = time.perf_counter() - start
+    
+    picks = random.Random(3)
+    nodes = [picks.choice(ids) for _ in range(lookups)]
+    moments = [EPOCH + timedelta(days=picks.randrange(730))
+               for _ in range(lookups)]
+    return {
+        "edges": n,
+        "build_edges_per_s": n / build_seconds,
+        "get_relationships": timed(
+            lambda i: graph.get_relationships(nodes[i]), lookups),
+        "traverse_2_hops": timed(
+            lambda i: graph.traverse(nodes[i], max_hops=2), lookups),
+        "query_at_time": timed(
+            lambda i: graph.query_at_time(
+                {"type": RELATION_TYPES[i % len(RELATION_TYPES)]},
+                moments[i]), lookups),
+        "query_time_range_7d": timed(
+            lambda i: graph.query_time_range(
+                {"type": RELATION_TYPES[i % len(RELATION_TYPES)]},
+                moments[i], moments[i] + timedelta(days=7)), lookups),
+        "rss_delta_mb": rss_mb() - rss_before,
+    }
+
+
+def bench_scale(sizes: List[int], dimension: int, queries: int,
+                lookups: int) -> Dict:
+    """Vector store and graph metrics at each data size."""
+    results = []
+    for size in sizes:
+        facts = synthetic_facts(size)
+        results.append({
+            "size": size,
+            "vector_store": bench_vector_store(facts, dimension, queries),
+            "graph": bench_graphs(facts, lookups),
+        })
+    return {
+        "benchmark": "scale",
+        "dimension": dimension,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Metrics that regressed beyond `tolerance` against the baseline.
+
+    Latencies (p50/p99) and RSS growth regress when they rise, throughputs
+    (*_per_s) when they fall. RSS growth within RSS_SLACK_MB is ignored as
+    allocator noise.
+    """
+    def metrics(run: Dict) -> Dict[str, float]:
+        flat = {}
+        for entry in run["results"]:
+            for section in ("vector_store", "graph"):
+                for metric, value in entry[section].items():
+                    key = f"{entry['size']}.{section}.{metric}"
+                    if isinstance(value, dict):
+                        for stat, ms in value.items():
+                            flat[f"{key}.{stat}"] = ms
+                    elif metric.endswith("_per_s") or metric == "rss_delta_mb":
+                        flat[key] = value
+        return flat
+    
+    before = metrics(baseline)
+    regressions = []
+    for key, value in metrics(result).items():
+        if key not in before:
+            continue
+        old = before[key]
+        if key.endswith("_per_s"):
+            if value < old * (1 - tolerance):
+                regressions.append(f"{key}: {old:.1f} -> {value:.1f} /s")
+        elif key.endswith("rss_delta_mb"):
+            if value > max(old, 0) * (1 + tolerance) + RSS_SLACK_MB:
+                regressions.append(f"{key}: {old:.1f} -> {value:.1f} MB")
+        elif value > old * (1 + tolerance):
+            regressions.append(f"{key}: {old:.3f} -> {value:.3f} ms")
+    return regressions
+
+
+def build_graph(n_nodes: int, n_edges: int, seed: int = 0) -> PropertyGraph:
+    """Random graph with `n_edges` edges over `n_nodes` entity nodes."""
+    rng = random.Random(seed)
+    graph = PropertyGraph()
+    node_ids = [graph.get_or_create_node(f"entity-{i}") for i in range(n_nodes)]
+    for _ in range(n_edges):
+        graph.create_relationship(rng.choice(node_ids), "RELATED_TO",
+                                  rng.choice(node_ids))
+    return graph
+
+
+def scan_relationships(graph: PropertyGraph, node_id: str) -> List[Dict]:
+    """Edge-scan lookup, as get_relationships worked before adjacency lists."""
+    return [edge for edge in graph.edges.values()
+            if edge["source"] == node_id or edge["target"] == node_id]
+
+
+def bench_relationships(n_edges: int, n_nodes: int, lookups: int,
+                        scan_lookups: int) -> Dict:
+    """Relationship lookup latency: adjacency index vs. full edge scan."""
+    start = time.perf_counter()
+    graph = build_graph(n_nodes, n_edges)
+    build_seconds = time.perf_counter() - start
+    
+    rng = random.Random(1)
+    node_ids = list(graph.nodes)
+    
+    indexed = []
+    for _ in range(lookups):
+        node_id = rng.choice(node_ids)
+        start = time.perf_counter()
+        graph.get_relationships(node_id)
+        indexed.append(time.perf_counter() - start)
+    
+    scanned = []
+    for _ in range(scan_lookups):
+        node_id = rng.choice(node_ids)
+        start = time.perf_counter()
+        scan_relationships(graph, node_id)
+        scanned.append(time.perf_counter() - start)
+    
+    return {
+        "benchmark": "relationships",
+        "edges": n_edges,
+        "nodes": n_nodes,
+        "build_edges_per_s": n_edges / build_seconds,
+        "adjacency": percentiles(indexed),
+        "edge_scan": percentiles(scanned),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Memory store benchmarks",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    
+    relationships = subparsers.add_parser(
+        "relationships", help="get_relationships latency")
+    relationships.add_argument("--edges", type=int, default=1_000_000)
+    relationships.add_argument("--nodes", type=int, default=100_000)
+    relationships.add_argument("--lookups", type=int, default=10_000)
+    relationships.add_argument("--scan-lookups", type=int, default=5)
+    
+    scale = subparsers.add_parser(
+        "scale", help="ingest, search, graph and temporal metrics by size")
+    scale.add_argument("--sizes", type=int, nargs="+",
+                       default=[10_000, 100_000, 1_000_000])
+    scale.add_argument("--dimension", type=int, default=256)
+    scale.add_argument("--queries", type=int, default=200)
+    scale.add_argument("--lookups", type=int, default=1_000)
+    scale.add_argument("--output", help="also write the JSON result here")
+    scale.add_argument("--compare", help="baseline JSON; exit 1 on regression")
+    scale.add_argument("--tolerance", type=float, default=0.25,
+                       help="allowed relative change against the baseline")
+    
+    args = parser.parse_args()
+    if args.benchmark == "relationships":
+        result = bench_relationships(args.edges, args.nodes, args.lookups,
+                                     args.scan_lookups)
+    else:
+        result = bench_scale(args.sizes, args.dimension, args.queries,
+                             args.lookups)
+    print(json.dumps(result, indent=2))
+    
+    if getattr(args, "output", None):
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if getattr(args, "compare", None):
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,77 +5,435 @@ This module provides utilities for implementing memory systems.
 """
 
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Tuple, Union
+import asyncio
+import bisect
 import json
+import functools
 import hashlib
-from datetime import datetime
+import itertools
+import mmap
+import os
+import pickle
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from multiprocessing import shared_memory
+from pathlib import Path
 
 
+# Embedding Providers
+
+class EmbeddingProvider:
+    """Interface for embedding models: a batch of texts in, one row each out.
+
+    `name` identifies the model and its configuration; caches key on it
+    so swapping models never serves stale vectors.
+    """
+
+    name = "provider"
+    dimension = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashEmbeddingProvider(EmbeddingProvider):
+    """Deterministic pseudo-embeddings for demonstration.
+
+    Seeds from a stable content hash (not Python's salted hash()), so the
+    same text maps to the same vector in every process. In production,
+    replace with an actual embedding model.
+    """
+
+    def __init__(self, dimension: int = 768):
+        self.dimension = dimension
+        self.name = f"hash-{dimension}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(
+                hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+            out[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        return out
+
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """Content-hash-keyed cache in front of another provider.
+
+    Tier 1 is an in-memory LRU bounded by `max_bytes` of vector data.
+    Tier 2, when `disk_path` is set, holds one .npy file per text and is
+    consulted on memory misses and filled on every model call. Only texts
+    missing from both tiers reach the wrapped provider, in one batch.
+    The cache is safe to share between threads; provider calls and disk
+    reads run outside its lock. Disk files are written atomically, so
+    several processes may share one disk_path.
+    """
+
+    def __init__(self, provider: EmbeddingProvider,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 disk_path: Optional[str] = None):
+        self.provider = provider
+        self.dimension = provider.dimension
+        self.name = provider.name
+        self.max_bytes = max_bytes
+        self.disk_path = Path(disk_path) if disk_path else None
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        missing: Dict[str, List[int]] = {}
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    out[i] = vector
+        
+        # Disk tier, read outside the lock so file I/O does not serialize
+        # other threads' lookups
+        if missing and self.disk_path is not None:
+            for key in list(missing):
+                vector = self._disk_lookup(key)
+                if vector is not None:
+                    out[missing.pop(key)] = vector
+                    with self._lock:
+                        self._remember(key, vector)
+                        self.stats["disk_hits"] += 1
+        
+        if missing:
+            with self._lock:
+                self.stats["misses"] += len(missing)
+            positions = list(missing.values())
+            vectors = self.provider.embed([texts[p[0]] for p in positions])
+            for key, p, vector in zip(missing, positions, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                out[p] = vector
+                with self._lock:
+                    self._remember(key, vector)
+                if self.disk_path is not None:
+                    self._disk_store(key, vector)
+        return out
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.name}\0{text}".encode()).hexdigest()
+
+    def _disk_lookup(self, key: str) -> Optional[np.ndarray]:
+        try:
+            return np.load(self._disk_file(key))
+        except FileNotFoundError:
+            return None
+
+    def _disk_store(self, key: str, vector: np.ndarray):
+        """Write a vector file atomically: other threads and processes
+        sharing disk_path see either no file or a complete one."""
+        file = self._disk_file(key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        staging = file.with_name(
+            f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(staging, "wb") as f:
+            np.save(f, vector)
+        os.replace(staging, file)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Insert into the memory LRU, evicting least recently used entries."""
+        if vector.nbytes > self.max_bytes:
+            return
+        if key in self._memory:  # filled meanwhile by another thread
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _disk_file(self, key: str) -> Path:
+        return self.disk_path / key[:2] / f"{key}.npy"
+
+
+# Vector Storage
+
 class VectorStore:
-    """Simple vector store with metadata indexing."""
+    """Vector store with metadata indexing.
+
+    Embeddings are kept unit-normalized in one contiguous float32 matrix
+    that grows geometrically, so a search is a single matrix-vector
+    product followed by partial top-k selection.
+
+    Metadata keys listed in `indexed_keys` (plus "entity" and the month
+    bucket of "valid_from", exposed as "time_bucket") get inverted posting
+    lists of row ids. Filters on those keys are resolved by intersecting
+    postings before any vector is scored. Time windows (`since`, `until`,
+    `as_of`) select the month buckets they overlap, then check the exact
+    validity times of those rows only.
+
+    With a `quantizer` the store scores compressed codes instead. The
+    float32 matrix is then kept only when `rerank` > 0, in which case the
+    best `limit * rerank` approximate hits are re-scored exactly.
+
+    Every document gets a stable id that survives compaction; row indices
+    do not. delete() only tombstones a row, which searches then skip, and
+    compact() rewrites the store without tombstoned rows. With
+    `auto_compact` > 0 that happens once this fraction of rows is dead.
+
+    An optional `keyword_index` (BM25Index) indexes the added texts for
+    keyword_search().
+    """
     
-    def __init__(self, dimension: int = 768):
+    TIME_BUCKET_KEY = "time_bucket"
+    
+    def __init__(self, dimension: int = 768, initial_capacity: int = 1024,
+                 index: Optional["IVFIndex"] = None,
+                 indexed_keys: Tuple[str, ...] = ("session_id", "entity"),
+                 quantizer: Optional[Union["ScalarQuantizer",
+                                           "ProductQuantizer"]] = None,
+                 rerank: int = 0,
+                 embedder: Optional[EmbeddingProvider] = None,
+                 auto_compact: float = 0.0,
+                 keyword_index: Optional["BM25Index"] = None):
+        if quantizer is not None and quantizer.dimension != dimension:
+            raise ValueError(
+                f"Quantizer dimension {quantizer.dimension} != {dimension}")
+        if embedder is not None and embedder.dimension != dimension:
+            raise ValueError(
+                f"Embedder dimension {embedder.dimension} != {dimension}")
         self.dimension = dimension
-        self.vectors: List[np.ndarray] = []
+        self.embedder = embedder or CachedEmbeddingProvider(
+            HashEmbeddingProvider(dimension))
+        self.index = index
+        self.keyword_index = keyword_index
+        self.quantizer = quantizer
+        self.rerank = rerank
+        self._keep_vectors = quantizer is None or rerank > 0
+        capacity = max(1, initial_capacity) if self._keep_vectors else 0
+        self._matrix = np.zeros((capacity, dimension), dtype=np.float32)
+        self._count = 0
         self.metadata: List[Dict] = []
-        self.entity_index: Dict[str, List[int]] = {}
-        self.time_index: Dict[str, List[int]] = {}
+        # Stable document id per row (ascending) and tombstones
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self._deleted = np.zeros(0, dtype=bool)
+        self._n_deleted = 0
+        self._next_id = 0
+        self.auto_compact = auto_compact
+        # Validity per row in epoch seconds: start (NaN if unknown), end
+        self._valid_from = np.zeros(0, dtype=np.float64)
+        self._valid_until = np.zeros(0, dtype=np.float64)
+        # key -> value -> ascending row ids
+        self.postings: Dict[str, Dict[Any, List[int]]] = {
+            key: {} for key in indexed_keys
+        }
+        self.entity_index: Dict[str, List[int]] = self.postings.setdefault(
+            "entity", {})
+        self.time_index: Dict[str, List[int]] = self.postings.setdefault(
+            self.TIME_BUCKET_KEY, {})
+        self._posting_arrays: Dict[Tuple[str, Any], np.ndarray] = {}
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """Normalized embeddings for all stored documents.
+
+        A view of the float32 matrix, or a decoded copy when only
+        quantized codes are kept.
+        """
+        if not self._keep_vectors:
+            return self.quantizer.decode(np.arange(self._count))
+        return self._matrix[:self._count]
+    
+    def __len__(self) -> int:
+        return self._count - self._n_deleted
     
     def add(self, text: str, metadata: Dict[str, Any] = None) -> int:
         """Add document to store."""
-        metadata = metadata or {}
-        embedding = self._embed(text)
-        index = len(self.vectors)
-
-        self.vectors.append(embedding)
-        self.metadata.append(metadata)
+        return self.add_many([text], [metadata or {}])[0]
+    
+    def add_many(self, texts: List[str],
+                 metadatas: List[Dict[str, Any]] = None,
+                 batch_size: int = 1024,
+                 embeddings: Optional[np.ndarray] = None) -> List[int]:
+        """Add documents in batches; returns their document ids.
 
-        # Index by entity
-        if "entity" in metadata:
-            entity = metadata["entity"]
-            if entity not in self.entity_index:
-                self.entity_index[entity] = []
-            self.entity_index[entity].append(index)
+        Each batch is embedded in one provider call (unless `embeddings`
+        were computed up front), normalized as a block and written into
+        the matrix with a single slice assignment.
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        if len(metadatas) != len(texts):
+            raise ValueError("texts and metadatas must have the same length")
+        
+        first = self._count
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            if embeddings is None:
+                vectors = self.embedder.embed(batch).astype(np.float32)
+            else:
+                vectors = np.array(embeddings[start:start + batch_size],
+                                   dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8
+            
+            lo, hi = self._count, self._count + len(batch)
+            if self._keep_vectors:
+                self._ensure_capacity(hi)
+                self._matrix[lo:hi] = vectors
+            self._count = hi
+            self.doc_ids = _grow(self.doc_ids, lo, hi)
+            self.doc_ids[lo:hi] = np.arange(self._next_id,
+                                            self._next_id + len(batch))
+            self._next_id += len(batch)
+            self._deleted = _grow(self._deleted, lo, hi)
+            self._deleted[lo:hi] = False
+            if self.quantizer is not None:
+                self.quantizer.add(vectors)
+            if self.index is not None:
+                self.index.add(np.arange(lo, hi), vectors)
+            if self.keyword_index is not None:
+                self.keyword_index.add(np.arange(lo, hi), batch)
         
-        # Index by time
-        if "valid_from" in metadata:
-            time_key = self._time_key(metadata["valid_from"])
-            if time_key not in self.time_index:
-                self.time_index[time_key] = []
-            self.time_index[time_key].append(index)
+        # Index by entity, time bucket and the other indexed keys
+        self._valid_from = _grow(self._valid_from, first, self._count)
+        self._valid_until = _grow(self._valid_until, first, self._count)
+        for index, metadata in enumerate(metadatas, start=first):
+            metadata = metadata or {}
+            self.metadata.append(metadata)
+            for key, value in self._index_values(metadata).items():
+                self.postings[key].setdefault(value, []).append(index)
+            self._valid_from[index], self._valid_until[index] = \
+                self._validity(metadata)
         
-        return index
+        return self.doc_ids[first:self._count].tolist()
     
     def search(self, query: str, limit: int = 5, 
-               filters: Dict[str, Any] = None) -> List[Dict]:
-        """Search for similar documents."""
-        query_embedding = self._embed(query)
+               filters: Dict[str, Any] = None,
+               exact: bool = False,
+               since: Union[datetime, str] = None,
+               until: Union[datetime, str] = None,
+               as_of: Union[datetime, str] = None) -> List[Dict]:
+        """Search for similar documents.
+
+        With an ANN index attached, only the index's candidate rows are
+        scored; pass exact=True to force a brute-force scan. `since` and
+        `until` bound "valid_from"; `as_of` keeps documents valid at that
+        moment (started by then and not yet ended by "valid_until").
+        """
+        if self._count == 0 or limit <= 0:
+            return []
+        query_embedding = self._normalize(self._embed(query))
         
-        scores = []
-        for i, vec in enumerate(self.vectors):
-            score = np.dot(query_embedding, vec) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(vec) + 1e-8
-            )
-            
-            # Apply filters
-            if filters and not self._matches_filters(self.metadata[i], filters):
-                score = -1
-            
-            scores.append((i, score))
+        # Pre-filter through the posting lists, before scoring
+        rows = self._select_rows(filters, since, until, as_of)
+        if rows is not None and len(rows) == 0:
+            return []
         
-        scores.sort(key=lambda x: x[1], reverse=True)
+        if self.index is not None and not exact:
+            rows = self._candidate_rows(query_embedding, rows)
+        return self._rank(query_embedding, rows, limit)
+    
+    def search_many(self, queries: List[str], limit: int = 5,
+                    filters: Dict[str, Any] = None, exact: bool = False,
+                    block_size: int = 65536,
+                    since: Union[datetime, str] = None,
+                    until: Union[datetime, str] = None,
+                    as_of: Union[datetime, str] = None) -> List[List[Dict]]:
+        """Search for several queries at once; one result list per query.
+
+        All queries are embedded in one provider call. On the float32
+        path the matrix is scored against the whole query block with one
+        matrix-matrix product per `block_size` rows, keeping a running
+        row-wise top-k. IVF candidates and quantized codes differ per
+        query, so those are ranked query by query on the shared embeddings.
+        """
+        if not queries:
+            return []
+        if self._count == 0 or limit <= 0:
+            return [[] for _ in queries]
+        embeddings = self.embedder.embed(list(queries)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-8
         
-        results = []
-        for idx, score in scores[:limit]:
-            if score > 0:
-                results.append({
-                    "index": idx,
-                    "score": score,
-                    "text": self.metadata[idx].get("text", ""),
-                    "metadata": self.metadata[idx]
-                })
+        rows = self._select_rows(filters, since, until, as_of)
+        if rows is not None and len(rows) == 0:
+            return [[] for _ in queries]
         
-        return results
+        if self.quantizer is not None or (self.index is not None
+                                          and not exact):
+            return [self._rank(q, rows if exact or self.index is None
+                               else self._candidate_rows(q, rows), limit)
+                    for q in embeddings]
+        
+        n_queries = len(embeddings)
+        best_ids = np.empty((n_queries, 0), dtype=np.int64)
+        best_scores = np.empty((n_queries, 0), dtype=np.float32)
+        total = self._count if rows is None else len(rows)
+        for start in range(0, total, block_size):
+            stop = min(start + block_size, total)
+            if rows is None:
+                block = np.arange(start, stop)
+                scores = embeddings @ self._matrix[start:stop].T
+            else:
+                block = rows[start:stop]
+                scores = embeddings @ self._matrix[block].T
+            if self._n_deleted:
+                scores[:, self._deleted[block]] = -np.inf
+            ids = np.concatenate(
+                [best_ids, np.broadcast_to(block, scores.shape)], axis=1)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            top = self._top_k_rows(scores, limit)
+            best_ids = np.take_along_axis(ids, top, axis=1)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+        
+        return [self._results(ids, scores)
+                for ids, scores in zip(best_ids, best_scores)]
+    
+    def keyword_search(self, query: str, limit: int = 5,
+                       filters: Dict[str, Any] = None,
+                       since: Union[datetime, str] = None,
+                       until: Union[datetime, str] = None,
+                       as_of: Union[datetime, str] = None) -> List[Dict]:
+        """BM25 search over document text; needs a keyword_index."""
+        if self.keyword_index is None:
+            raise ValueError("VectorStore has no keyword_index")
+        if self._count == 0 or limit <= 0:
+            return []
+        rows = self._select_rows(filters, since, until, as_of)
+        if rows is not None and len(rows) == 0:
+            return []
+        exclude = self._deleted[:self._count] if self._n_deleted else None
+        ids, scores = self.keyword_index.search(query, limit, rows, exclude)
+        return [{
+            "index": idx,
+            "id": int(self.doc_ids[idx]),
+            "score": score,
+            "text": self.metadata[idx].get("text", ""),
+            "metadata": self.metadata[idx]
+        } for idx, score in zip(ids.tolist(), scores.tolist())]
+    
+    def recall_at_k(self, queries: List[str], k: int = 10,
+                    filters: Dict[str, Any] = None) -> float:
+        """Mean recall@k of the ANN path measured against exact search."""
+        if not queries:
+            return 1.0
+        total = 0.0
+        for query in queries:
+            truth = {r["index"] for r in
+                     self.search(query, k, filters, exact=True)}
+            if not truth:
+                total += 1.0
+                continue
+            found = {r["index"] for r in self.search(query, k, filters)}
+            total += len(truth & found) / len(truth)
+        return total / len(queries)
     
     def search_by_entity(self, entity: str, query: str = "", 
                          limit: int = 5) -> List[Dict]:
@@ -86,34 +444,556 @@ class VectorStore:
             return []
         
         if query:
-            query_embedding = self._embed(query)
-            scored = []
-            for i in indices:
-                vec = self.vectors[i]
-                score = np.dot(query_embedding, vec) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(vec) + 1e-8
-                )
-                scored.append((i, score, self.metadata[i]))
-            
-            scored.sort(key=lambda x: x[1], reverse=True)
-            return [{"index": i, "score": s, "metadata": m} 
-                    for i, s, m in scored[:limit]]
+            query_embedding = self._normalize(self._embed(query))
+            rows = self._posting_array("entity", entity)
+            ids, scores = self._top_rows(query_embedding, rows, limit)
+            return [{"index": int(i), "id": int(self.doc_ids[i]),
+                     "score": float(s), "metadata": self.metadata[i]}
+                    for i, s in zip(ids, scores)]
+        else:
+            live = (i for i in indices if not self._deleted[i])
+            return [{"index": i, "id": int(self.doc_ids[i]), "score": 1.0,
+                     "metadata": self.metadata[i]}
+                    for i in itertools.islice(live, limit)]
+    
+    def row_of(self, doc_id: int) -> int:
+        """Current row of a live document; raises KeyError otherwise."""
+        ids = self.doc_ids[:self._count]
+        row = int(np.searchsorted(ids, doc_id))
+        if row == self._count or ids[row] != doc_id or self._deleted[row]:
+            raise KeyError(doc_id)
+        return row
+    
+    def get(self, doc_id: int) -> Dict[str, Any]:
+        """A copy of a live document's metadata, to edit and pass to update()."""
+        return dict(self.metadata[self.row_of(doc_id)])
+    
+    def delete(self, doc_id: int):
+        """Tombstone a document; it is dropped at the next compact()."""
+        self._deleted[self.row_of(doc_id)] = True
+        self._n_deleted += 1
+        if (self.auto_compact
+                and self._n_deleted >= self.auto_compact * self._count):
+            self.compact()
+    
+    def update(self, doc_id: int, metadata: Dict[str, Any]):
+        """Replace a document's metadata in place, re-indexing its postings.
+
+        The embedding is unchanged; to change the text, delete and re-add.
+        The store keeps a copy, so later edits to `metadata` cannot drift
+        from the posting lists.
+        """
+        row = self.row_of(doc_id)
+        metadata = dict(metadata)
+        old = self._index_values(self.metadata[row])
+        new = self._index_values(metadata)
+        for key in set(old) | set(new):
+            if key in old and key in new and old[key] == new[key]:
+                continue
+            if key in old:
+                posting = self.postings[key][old[key]]
+                del posting[bisect.bisect_left(posting, row)]
+                if not posting:
+                    del self.postings[key][old[key]]
+                self._posting_arrays.pop((key, old[key]), None)
+            if key in new:
+                bisect.insort(self.postings[key].setdefault(new[key], []), row)
+                self._posting_arrays.pop((key, new[key]), None)
+        self.metadata[row] = metadata
+        self._valid_from[row], self._valid_until[row] = \
+            self._validity(metadata)
+    
+    def compact(self, drop_rows=()) -> np.ndarray:
+        """Remove tombstoned rows (and `drop_rows`), renumbering in place.
+
+        Rewrites the vector matrix, metadata, posting lists, quantizer
+        codes and IVF cells; document ids are kept. Returns the old -> new
+        row map, with -1 for dropped rows; row indices held elsewhere must
+        be remapped with it.
+        """
+        keep = ~self._deleted[:self._count]
+        keep[np.asarray(list(drop_rows), dtype=np.int64)] = False
+        kept = np.flatnonzero(keep)
+        remap = np.full(self._count, -1, dtype=np.int64)
+        remap[kept] = np.arange(len(kept))
+        
+        if self._keep_vectors:
+            self._matrix = np.ascontiguousarray(self._matrix[kept])
+            self._matrix = _grow(self._matrix, len(kept), len(kept))
+        self.metadata = [self.metadata[i] for i in kept.tolist()]
+        for values in self.postings.values():
+            for value in list(values):
+                rows = remap[np.asarray(values[value], dtype=np.int64)]
+                rows = rows[rows >= 0]
+                if len(rows):
+                    values[value] = rows.tolist()
+                else:
+                    del values[value]
+        self._posting_arrays = {}
+        if self.quantizer is not None:
+            self.quantizer.take(kept)
+        if self.index is not None:
+            self.index.remap(remap)
+        if self.keyword_index is not None:
+            self.keyword_index.remap(remap)
+        self.doc_ids = np.ascontiguousarray(self.doc_ids[kept])
+        self._valid_from = np.ascontiguousarray(self._valid_from[kept])
+        self._valid_until = np.ascontiguousarray(self._valid_until[kept])
+        self._deleted = np.zeros(len(kept), dtype=bool)
+        self._n_deleted = 0
+        self._count = len(kept)
+        return remap
+    
+    # Persistence
+    #
+    # A saved store is a directory:
+    #   manifest.json          format version, dimension, count, index config
+    #   vectors.npy            normalized float32 matrix, memory-mappable
+    #   metadata.jsonl         one JSON record per row
+    #   metadata.offsets.npy   byte offset of each record (count + 1 entries)
+    #   doc_ids.npy            stable document id of each row
+    #   tombstones.npy         deleted flag of each row
+    #   validity.npy           valid_from / valid_until epoch seconds per row
+    #   postings.json          [key, value, start, stop] per posting list
+    #   postings.npy           all posting row ids, concatenated
+    #   ivf.npz                IVF centroids and per-row cell (if indexed)
+    #   quantizer.<name>.npy   quantizer codes and codebooks (if quantized)
+    #   bm25.json, bm25.npz    keyword index terms and postings (if any)
+    
+    FORMAT_VERSION = 1
+    
+    def save(self, path: str):
+        """Write the store to directory `path` in the memory-mappable format.
+
+        The files are written to a sibling staging directory that is then
+        swapped in; the previous directory is renamed aside rather than
+        overwritten, since a store loaded from it may still be reading its
+        memory-mapped files (including this one, saved back to its path).
+        """
+        directory = Path(path)
+        staging = directory.with_name(directory.name + ".tmp")
+        retired = directory.with_name(directory.name + ".old")
+        for stale in (staging, retired):
+            if stale.exists():
+                shutil.rmtree(stale)
+        self._write(staging)
+        if directory.exists():
+            directory.rename(retired)
+        staging.rename(directory)
+        if retired.exists():
+            shutil.rmtree(retired)
+    
+    def _write(self, root: Path):
+        """Write the store's files into a new directory `root`."""
+        root.mkdir(parents=True)
+        
+        np.save(root / "vectors.npy",
+                np.ascontiguousarray(self._matrix[:self._count]))
+        
+        offsets = np.zeros(self._count + 1, dtype=np.int64)
+        with open(root / "metadata.jsonl", "wb") as f:
+            for i in range(self._count):
+                line = json.dumps(self.metadata[i], default=str).encode() + b"\n"
+                f.write(line)
+                offsets[i + 1] = offsets[i] + len(line)
+        np.save(root / "metadata.offsets.npy", offsets)
+        np.save(root / "doc_ids.npy", self.doc_ids[:self._count])
+        np.save(root / "tombstones.npy", self._deleted[:self._count])
+        np.save(root / "validity.npy", np.stack(
+            [self._valid_from[:self._count], self._valid_until[:self._count]],
+            axis=1))
+        
+        sections, chunks, start = [], [], 0
+        for key, values in self.postings.items():
+            for value, rows in values.items():
+                sections.append([key, value, start, start + len(rows)])
+                chunks.append(np.asarray(rows, dtype=np.int64))
+                start += len(rows)
+        with open(root / "postings.json", "w") as f:
+            json.dump(sections, f, default=str)
+        np.save(root / "postings.npy", np.concatenate(chunks) if chunks
+                else np.empty(0, dtype=np.int64))
+        
+        index_config = None
+        if self.index is not None:
+            index_config = {
+                "n_lists": self.index.n_lists,
+                "nprobe": self.index.nprobe,
+                "min_train_size": self.index.min_train_size,
+                "kmeans_iters": self.index.kmeans_iters,
+                "seed": self.index.seed,
+            }
+            centroids = (self.index.centroids if self.index.is_trained
+                         else np.empty((0, self.dimension), dtype=np.float32))
+            np.savez(root / "ivf.npz", centroids=centroids,
+                     cells=self.index.cell_assignments(self._count))
+        
+        quantizer_config = None
+        if self.quantizer is not None:
+            quantizer_config = self.quantizer.config()
+            for name, array in self.quantizer.state().items():
+                np.save(root / f"quantizer.{name}.npy", array)
+        
+        keyword_config = None
+        if self.keyword_index is not None:
+            keyword_config = self.keyword_index.config()
+            sections, arrays = self.keyword_index.state()
+            with open(root / "bm25.json", "w") as f:
+                json.dump(sections, f)
+            np.savez(root / "bm25.npz", **arrays)
+        
+        with open(root / "manifest.json", "w") as f:
+            json.dump({
+                "format": self.FORMAT_VERSION,
+                "dimension": self.dimension,
+                "count": self._count,
+                "next_id": self._next_id,
+                "auto_compact": self.auto_compact,
+                "indexed_keys": list(self.postings),
+                "index": index_config,
+                "quantizer": quantizer_config,
+                "rerank": self.rerank,
+                "keyword_index": keyword_config,
+            }, f, indent=2)
+    
+    @classmethod
+    def load(cls, path: str, mmap: bool = True,
+             embedder: Optional[EmbeddingProvider] = None) -> "VectorStore":
+        """Open a store written by save().
+
+        Embedders are not persisted; pass the one the store was built with.
+
+        With mmap=True the vector matrix is mapped read-only, so loading is
+        independent of store size and worker processes share the page
+        cache; metadata records are parsed on first access. The first add()
+        copies the matrix into private memory.
+        """
+        root = Path(path)
+        with open(root / "manifest.json") as f:
+            manifest = json.load(f)
+        if manifest["format"] != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported store format: {manifest['format']}")
+        
+        mmap_mode = "r" if mmap else None
+        index = None
+        if manifest["index"] is not None:
+            index = IVFIndex(**manifest["index"])
+        quantizer = None
+        if manifest["quantizer"] is not None:
+            config = dict(manifest["quantizer"])
+            quantizer = QUANTIZERS[config.pop("kind")](**config)
+            quantizer.restore({
+                name: np.load(file, mmap_mode=mmap_mode)
+                for name, file in ((f.name.split(".")[1], f) for f in
+                                   root.glob("quantizer.*.npy"))
+            })
+        store = cls(manifest["dimension"], initial_capacity=1, index=index,
+                    indexed_keys=tuple(manifest["indexed_keys"]),
+                    quantizer=quantizer, rerank=manifest["rerank"],
+                    embedder=embedder,
+                    auto_compact=manifest.get("auto_compact", 0.0))
+        if manifest.get("keyword_index") is not None:
+            store.keyword_index = BM25Index(**manifest["keyword_index"])
+            with open(root / "bm25.json") as f:
+                sections = json.load(f)
+            store.keyword_index.restore(sections, np.load(root / "bm25.npz"))
+        
+        count = manifest["count"]
+        if count and store._keep_vectors:
+            store._matrix = np.load(root / "vectors.npy", mmap_mode=mmap_mode)
+        store._count = count
+        if (root / "doc_ids.npy").exists():
+            store.doc_ids = np.load(root / "doc_ids.npy")
+            store._deleted = np.load(root / "tombstones.npy")
+        else:  # written before document ids existed
+            store.doc_ids = np.arange(count, dtype=np.int64)
+            store._deleted = np.zeros(count, dtype=bool)
+        store._n_deleted = int(store._deleted.sum())
+        store._next_id = manifest.get("next_id", count)
+        
+        offsets = np.load(root / "metadata.offsets.npy")
+        records = _JsonLinesRecords(root / "metadata.jsonl", offsets)
+        store.metadata = records if mmap else list(records)
+        if (root / "validity.npy").exists():
+            validity = np.load(root / "validity.npy")
+            store._valid_from = np.ascontiguousarray(validity[:, 0])
+            store._valid_until = np.ascontiguousarray(validity[:, 1])
+        else:  # written before validity times were kept
+            validity = [store._validity(record) for record in records]
+            store._valid_from = np.array([v[0] for v in validity], dtype=np.float64)
+            store._valid_until = np.array([v[1] for v in validity], dtype=np.float64)
+        
+        with open(root / "postings.json") as f:
+            sections = json.load(f)
+        rows = np.load(root / "postings.npy")
+        for key, value, start, stop in sections:
+            store.postings.setdefault(key, {})[value] = rows[start:stop].tolist()
+        
+        if index is not None:
+            ivf = np.load(root / "ivf.npz")
+            if len(ivf["centroids"]):
+                index.restore(ivf["centroids"], ivf["cells"])
+            elif count:
+                rows = np.arange(count)
+                index.add(rows, store._row_vectors(rows))
+        
+        return store
+    
+    def _index_values(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Posting-list keys and values a metadata record is indexed under."""
+        values = {}
+        for key in self.postings:
+            if key == self.TIME_BUCKET_KEY:
+                if "valid_from" in metadata:
+                    values[key] = self._time_key(metadata["valid_from"])
+            elif key in metadata:
+                try:
+                    hash(metadata[key])
+                except TypeError:
+                    continue
+                values[key] = metadata[key]
+        return values
+    
+    def _posting_array(self, key: str, value: Any) -> np.ndarray:
+        """Row ids for key == value as an array, extended only by new rows."""
+        posting = self.postings[key].get(value, [])
+        cached = self._posting_arrays.get((key, value))
+        if cached is None or len(cached) != len(posting):
+            if cached is None or len(cached) > len(posting):
+                cached = np.array(posting, dtype=np.int64)
+            else:
+                tail = np.array(posting[len(cached):], dtype=np.int64)
+                cached = np.concatenate([cached, tail])
+            self._posting_arrays[(key, value)] = cached
+        return cached
+    
+    def _select_rows(self, filters: Optional[Dict[str, Any]], since=None,
+                     until=None, as_of=None) -> Optional[np.ndarray]:
+        """Candidate rows for filters and a time window (None: all rows)."""
+        rows = self._filter_rows(filters) if filters else None
+        if since is None and until is None and as_of is None:
+            return rows
+        if rows is not None and len(rows) == 0:
+            return rows
+        window = self._time_rows(since, until, as_of)
+        if rows is None:
+            return window
+        return np.intersect1d(rows, window, assume_unique=True)
+    
+    def _time_rows(self, since=None, until=None, as_of=None) -> np.ndarray:
+        """Ascending rows whose validity matches the window.
+
+        Only the month buckets overlapping the window are read (widened
+        by a day either side for time zone offsets), so the cost follows
+        the window rather than the history.
+        """
+        lo = -np.inf if since is None else self._to_epoch(since)
+        hi = np.inf if until is None else self._to_epoch(until)
+        if as_of is not None:
+            moment = self._to_epoch(as_of)
+            hi = min(hi, moment)
+        first = self._bucket_bound(lo - 86400)
+        last = self._bucket_bound(hi + 86400)
+        buckets = [self._posting_array(self.TIME_BUCKET_KEY, bucket)
+                   for bucket in self.time_index
+                   if (first is None or bucket >= first)
+                   and (last is None or bucket <= last)]
+        if not buckets:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(buckets))
+        starts = self._valid_from[rows]
+        keep = (starts >= lo) & (starts <= hi)
+        if as_of is not None:
+            keep &= self._valid_until[rows] > moment
+        return rows[keep]
+    
+    def _filter_rows(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Ascending row ids matching all filters.
+
+        Indexed keys intersect their posting lists, smallest first; only
+        the survivors are checked against unindexed keys.
+        """
+        matched = []
+        residual = {}
+        for key, value in filters.items():
+            if key not in self.postings:
+                residual[key] = value
+                continue
+            values = value if isinstance(value, list) else [value]
+            try:
+                arrays = [self._posting_array(key, v) for v in values]
+            except TypeError:
+                residual[key] = value
+                continue
+            if len(arrays) == 1:
+                matched.append(arrays[0])
+            else:
+                matched.append(np.unique(np.concatenate(
+                    arrays or [np.empty(0, dtype=np.int64)])))
+        
+        rows = None
+        for posting in sorted(matched, key=len):
+            rows = posting if rows is None else np.intersect1d(
+                rows, posting, assume_unique=True)
+            if len(rows) == 0:
+                return rows
+        
+        if residual:
+            pool = range(self._count) if rows is None else rows.tolist()
+            rows = np.array(
+                [i for i in pool
+                 if self._matches_filters(self.metadata[i], residual)],
+                dtype=np.int64
+            )
+        return rows
+    
+    def _rank(self, query_embedding: np.ndarray, rows: Optional[np.ndarray],
+              limit: int) -> List[Dict]:
+        """Score candidate rows (all rows if None) and return the top hits."""
+        ids, scores = self._top_rows(query_embedding, rows, limit)
+        return self._results(ids, scores)
+    
+    def _results(self, ids: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        """Result records for ranked rows, stopping at non-positive scores."""
+        results = []
+        for idx, score in zip(ids.tolist(), scores.tolist()):
+            if score <= 0:
+                break
+            results.append({
+                "index": idx,
+                "id": int(self.doc_ids[idx]),
+                "score": score,
+                "text": self.metadata[idx].get("text", ""),
+                "metadata": self.metadata[idx]
+            })
+        
+        return results
+    
+    def _candidate_rows(self, query_embedding: np.ndarray,
+                        rows: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Restrict rows (all rows if None) to the IVF index's candidates."""
+        candidates = self.index.candidates(query_embedding)
+        # A small filtered set is cheaper to score exactly than to probe
+        if candidates is not None and (rows is None
+                                       or len(rows) > len(candidates)):
+            rows = candidates if rows is None else np.intersect1d(
+                rows, candidates, assume_unique=True)
+        return rows
+    
+    def _top_rows(self, query_embedding: np.ndarray,
+                  rows: Optional[np.ndarray],
+                  limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Row ids and scores of the best `limit` live candidates, best first."""
+        scores = self._score(query_embedding, rows)
+        if self._n_deleted:
+            dead = self._deleted[:self._count] if rows is None \
+                else self._deleted[rows]
+            scores = np.where(dead, -np.inf, scores)
+        if self.quantizer is not None and self.rerank and self._keep_vectors:
+            # Re-score an approximate shortlist against the exact vectors
+            shortlist = self._top_k(scores, limit * self.rerank)
+            shortlist = shortlist[np.isfinite(scores[shortlist])]
+            rows = shortlist if rows is None else rows[shortlist]
+            scores = self._matrix[rows] @ query_embedding
+        top = self._top_k(scores, limit)
+        top = top[np.isfinite(scores[top])]
+        ids = top if rows is None else rows[top]
+        return ids, scores[top]
+    
+    def _score(self, query_embedding: np.ndarray,
+               rows: Optional[np.ndarray]) -> np.ndarray:
+        """Similarity of the query to rows (all rows if None)."""
+        if self.quantizer is not None:
+            return self.quantizer.scores(query_embedding, rows)
+        if rows is None:
+            return self.vectors @ query_embedding
+        return self._matrix[rows] @ query_embedding
+    
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Float32 vectors for rows, decoded if only codes are kept."""
+        if self._keep_vectors:
+            return self._matrix[rows]
+        return self.quantizer.decode(rows)
+    
+    def _ensure_capacity(self, required: int):
+        """Grow the vector matrix geometrically to hold `required` rows."""
+        self._matrix = _grow(self._matrix, self._count, required)
+    
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        """Return a unit-length float32 copy so dot products are cosines."""
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-8)
+    
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first, without a full sort."""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+    
+    @staticmethod
+    def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+        """Row-wise _top_k: column indices of each row's k best, best first."""
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return np.empty((len(scores), 0), dtype=np.int64)
+        if k < scores.shape[1]:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
         else:
-            return [{"index": i, "score": 1.0, "metadata": self.metadata[i]} 
-                    for i in indices[:limit]]
+            candidates = np.tile(np.arange(k), (len(scores), 1))
+        order = np.argsort(-np.take_along_axis(scores, candidates, axis=1),
+                           axis=1, kind="stable")
+        return np.take_along_axis(candidates, order, axis=1)
     
     def _embed(self, text: str) -> np.ndarray:
         """Generate embedding for text."""
-        # In production, use actual embedding model
-        np.random.seed(hash(text) % (2**32))
-        return np.random.randn(self.dimension)
+        return self.embedder.embed([text])[0]
+    
+    def _validity(self, metadata: Dict) -> Tuple[float, float]:
+        """(valid_from, valid_until) of a record in epoch seconds."""
+        try:
+            start = self._to_epoch(metadata["valid_from"])
+        except (KeyError, TypeError, ValueError):
+            start = np.nan
+        try:
+            end = self._to_epoch(metadata.get("valid_until"))
+        except (TypeError, ValueError):
+            end = np.inf
+        return start, end
+    
+    @staticmethod
+    def _to_epoch(moment: Union[datetime, str, None]) -> float:
+        """Epoch seconds of a datetime or ISO string (None: +inf)."""
+        if isinstance(moment, str):
+            moment = datetime.fromisoformat(moment)
+        return _epoch_seconds(moment)
     
     def _time_key(self, timestamp: Any) -> str:
         """Create time key for indexing."""
+        if isinstance(timestamp, str):
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except ValueError:
+                return timestamp
         if isinstance(timestamp, datetime):
             return timestamp.strftime("%Y-%m")
         return str(timestamp)
     
+    def _bucket_bound(self, seconds: float) -> Optional[str]:
+        """Time key of epoch `seconds`, or None (no bound) when infinite
+        or outside the datetime range, as for datetime.min / max bounds."""
+        try:
+            return self._time_key(
+                datetime(1970, 1, 1) + timedelta(seconds=seconds))
+        except OverflowError:
+            return None
+    
     def _matches_filters(self, metadata: Dict, filters: Dict) -> bool:
         """Check if metadata matches filters."""
         for key, value in filters.items():
@@ -127,8 +1007,1045 @@ class VectorStore:
         return True
 
 
+class PartitionedVectorStore:
+    """VectorStores partitioned by one metadata key, e.g. session_id.
+
+    Each partition is an independent VectorStore with its own posting
+    lists and indexes, so a search routed to one partition (a filter on
+    `partition_key`) costs the same however large the other partitions
+    grow. At most `max_resident` partitions stay in memory: the least
+    recently used one is saved under `path` (if it changed) and reloaded
+    memory-mapped on next use. Without a `path` nothing is evicted.
+
+    Document ids are unique within a partition; results carry their
+    "partition".
+    """
+    
+    def __init__(self, path: Optional[str] = None,
+                 partition_key: str = "session_id",
+                 max_resident: int = 64,
+                 factory: Optional[Callable[[], VectorStore]] = None,
+                 embedder: Optional[EmbeddingProvider] = None,
+                 dimension: int = 768):
+        self.path = Path(path) if path else None
+        self.partition_key = partition_key
+        self.max_resident = max_resident
+        # One embedder (and embedding cache) shared by all partitions
+        self.embedder = embedder or CachedEmbeddingProvider(
+            HashEmbeddingProvider(dimension))
+        self.factory = factory or (
+            lambda: VectorStore(self.embedder.dimension, embedder=self.embedder))
+        self._resident: "OrderedDict[Any, VectorStore]" = OrderedDict()
+        self._lock = threading.RLock()  # concurrent readers share the LRU
+        self._dirty = set()
+        self._saved: Dict[Any, int] = {}  # saved partition -> live documents
+        if self.path is not None and (self.path / "partitions.json").exists():
+            with open(self.path / "partitions.json") as f:
+                self._saved = {key: count for key, count in json.load(f)}
+    
+    def __len__(self) -> int:
+        return (sum(len(store) for store in self._resident.values())
+                + sum(count for key, count in self._saved.items()
+                      if key not in self._resident))
+    
+    def keys(self) -> List[Any]:
+        """All partition keys, resident or saved."""
+        with self._lock:
+            return list(dict.fromkeys([*self._resident, *self._saved]))
+    
+    def resident_keys(self) -> List[Any]:
+        """Keys of the partitions currently in memory, oldest use first."""
+        with self._lock:
+            return list(self._resident)
+    
+    def partition(self, key: Any, create: bool = True) -> Optional[VectorStore]:
+        """The partition for `key`, loaded or created on demand."""
+        with self._lock:
+            store = self._resident.get(key)
+            if store is not None:
+                self._resident.move_to_end(key)
+                return store
+            if key in self._saved:
+                store = VectorStore.load(str(self._directory(key)),
+                                         embedder=self.embedder)
+            elif create:
+                store = self.factory()
+            else:
+                return None
+            self._resident[key] = store
+            self._evict()
+            return store
+    
+    def mark_dirty(self, key: Any):
+        """Record that a partition changed outside this class's methods."""
+        self._dirty.add(key)
+    
+    def add(self, text: str, metadata: Dict[str, Any] = None) -> int:
+        """Add document to its partition."""
+        return self.add_many([text], [metadata or {}])[0]
+    
+    def add_many(self, texts: List[str],
+                 metadatas: List[Dict[str, Any]] = None,
+                 batch_size: int = 1024,
+                 embeddings: Optional[np.ndarray] = None) -> List[int]:
+        """Add documents, grouped by partition; returns their document ids."""
+        metadatas = metadatas or [{} for _ in texts]
+        if len(metadatas) != len(texts):
+            raise ValueError("texts and metadatas must have the same length")
+        groups: Dict[Any, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault((metadata or {}).get(self.partition_key),
+                              []).append(i)
+        
+        ids = [0] * len(texts)
+        for key, positions in groups.items():
+            store = self.partition(key)
+            added = store.add_many(
+                [texts[i] for i in positions],
+                [metadatas[i] for i in positions], batch_size=batch_size,
+                embeddings=None if embeddings is None else embeddings[positions])
+            for i, doc_id in zip(positions, added):
+                ids[i] = doc_id
+            self._dirty.add(key)
+        return ids
+    
+    def search(self, query: str, limit: int = 5,
+               filters: Dict[str, Any] = None,
+               exact: bool = False, **window) -> List[Dict]:
+        """Search the partitions selected by filters (all if unfiltered).
+
+        `window` takes VectorStore.search's since / until / as_of.
+        """
+        return self._fan_out("search", filters, limit, query,
+                             exact=exact, **window)
+    
+    def keyword_search(self, query: str, limit: int = 5,
+                       filters: Dict[str, Any] = None,
+                       **window) -> List[Dict]:
+        """BM25 search over the partitions selected by filters."""
+        return self._fan_out("keyword_search", filters, limit, query,
+                             **window)
+    
+    def search_by_entity(self, entity: str, query: str = "",
+                         limit: int = 5,
+                         keys: Optional[List[Any]] = None) -> List[Dict]:
+        """Search within an entity in the partitions `keys`.
+
+        Defaults to the resident partitions, since loading every saved
+        partition on each call would cycle the whole LRU; pass keys() to
+        search them all.
+        """
+        return self._fan_out("search_by_entity", None, limit, entity,
+                             query=query, keys=(self.resident_keys()
+                                                if keys is None else keys))
+    
+    def delete(self, key: Any, doc_id: int):
+        """Tombstone a document of partition `key`."""
+        self.partition(key).delete(doc_id)
+        self._dirty.add(key)
+    
+    def update(self, key: Any, doc_id: int, metadata: Dict[str, Any]):
+        """Replace the metadata of a document of partition `key`."""
+        self.partition(key).update(doc_id, metadata)
+        self._dirty.add(key)
+    
+    def flush(self):
+        """Save every changed resident partition (requires a path)."""
+        if self.path is None:
+            raise ValueError("PartitionedVectorStore has no path")
+        for key in list(self._dirty):
+            if key in self._resident:
+                self._save(key, self._resident[key])
+        self._write_catalog()
+    
+    def _fan_out(self, method: str, filters: Optional[Dict[str, Any]],
+                 limit: int, *args, keys: Optional[List[Any]] = None,
+                 **kwargs) -> List[Dict]:
+        """Run a search on each selected partition and merge by score.
+
+        Partitions are selected by a filter on partition_key, else by
+        `keys`, else all partitions are searched.
+        """
+        filters = dict(filters or {})
+        if self.partition_key in filters:
+            value = filters.pop(self.partition_key)
+            keys = value if isinstance(value, list) else [value]
+        elif keys is None:
+            keys = self.keys()
+        if filters:
+            kwargs["filters"] = filters
+        
+        results = []
+        for key in keys:
+            store = self.partition(key, create=False)
+            if store is None:
+                continue
+            for result in getattr(store, method)(*args, limit=limit, **kwargs):
+                result["partition"] = key
+                results.append(result)
+        if len(keys) > 1:
+            results.sort(key=lambda r: -r["score"])
+        return results[:limit]
+    
+    def _evict(self):
+        """Save and drop least recently used partitions over max_resident."""
+        if self.path is None:
+            return
+        evicted = False
+        while len(self._resident) > self.max_resident:
+            key, store = self._resident.popitem(last=False)
+            if key in self._dirty:
+                self._save(key, store)
+                evicted = True
+        if evicted:
+            self._write_catalog()
+    
+    def _save(self, key: Any, store: VectorStore):
+        """Save a partition; VectorStore.save swaps the directory in."""
+        store.save(str(self._directory(key)))
+        self._saved[key] = len(store)
+        self._dirty.discard(key)
+    
+    def _write_catalog(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        staging = self.path / "partitions.json.tmp"
+        with open(staging, "w") as f:
+            json.dump([[key, count] for key, count in self._saved.items()], f)
+        os.replace(staging, self.path / "partitions.json")
+    
+    def _directory(self, key: Any) -> Path:
+        digest = hashlib.sha256(json.dumps(key, default=str).encode())
+        return self.path / digest.hexdigest()[:16]
+
+
+# Shared-memory view of the vectors in each search worker process
+_shard_state: Dict[str, Any] = {}
+
+
+def _attach_shards(name: str, dead_name: str, count: int, dimension: int):
+    """Worker initializer: map the shared matrix and tombstones."""
+    shm = shared_memory.SharedMemory(name=name)
+    dead_shm = shared_memory.SharedMemory(name=dead_name)
+    _shard_state["buffers"] = (shm, dead_shm)
+    _shard_state["matrix"] = np.ndarray((count, dimension), dtype=np.float32,
+                                        buffer=shm.buf)
+    _shard_state["dead"] = np.ndarray((count,), dtype=bool,
+                                      buffer=dead_shm.buf)
+
+
+def _search_shard(lo: int, hi: int, queries: np.ndarray, limit: int,
+                  rows: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top-k of one shard (rows lo:hi, or the given rows)."""
+    matrix, dead = _shard_state["matrix"], _shard_state["dead"]
+    if rows is None:
+        rows = np.arange(lo, hi)
+        scores = queries @ matrix[lo:hi].T
+    else:
+        scores = queries @ matrix[rows].T
+    scores[:, dead[rows]] = -np.inf
+    top = VectorStore._top_k_rows(scores, limit)
+    return rows[top], np.take_along_axis(scores, top, axis=1)
+
+
+class ShardedSearcher:
+    """Exact search fanned out over worker processes.
+
+    The store's float32 matrix is copied once into a
+    multiprocessing.shared_memory block that every worker maps, so no
+    vectors are pickled per query. Each query block is split into
+    `n_shards` row ranges, searched in parallel, and the per-shard
+    top-k lists are merged. Concurrent callers (threads) share the pool.
+
+    The searcher sees a snapshot of the store: rows added later are not
+    searched and rows deleted later are dropped only at merge time. Call
+    refresh() after adds, and always after compaction.
+    """
+    
+    def __init__(self, store: VectorStore, n_shards: Optional[int] = None,
+                 mp_context=None):
+        if not store._keep_vectors:
+            raise ValueError("ShardedSearcher needs the float32 vectors")
+        self.store = store
+        self.n_shards = n_shards or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._buffers: List[shared_memory.SharedMemory] = []
+        self._count = 0
+        self._bounds: List[Tuple[int, int]] = []
+        self.refresh()
+    
+    def refresh(self):
+        """Re-snapshot the store into shared memory and restart the workers."""
+        self.close()
+        store = self.store
+        count, dimension = store._count, store.dimension
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(1, count * dimension * 4))
+        dead_shm = shared_memory.SharedMemory(create=True, size=max(1, count))
+        self._buffers = [shm, dead_shm]
+        np.ndarray((count, dimension), dtype=np.float32,
+                   buffer=shm.buf)[:] = store._matrix[:count]
+        np.ndarray((count,), dtype=bool,
+                   buffer=dead_shm.buf)[:] = store._deleted[:count]
+        self._count = count
+        edges = np.linspace(0, count, self.n_shards + 1).astype(int).tolist()
+        self._bounds = [(lo, hi) for lo, hi in zip(edges, edges[1:]) if hi > lo]
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_shards, mp_context=self.mp_context,
+            initializer=_attach_shards,
+            initargs=(shm.name, dead_shm.name, count, dimension))
+    
+    def search(self, query: str, limit: int = 5,
+               filters: Dict[str, Any] = None) -> List[Dict]:
+        """Search for similar documents across all shards."""
+        return self.search_many([query], limit, filters)[0]
+    
+    def search_many(self, queries: List[str], limit: int = 5,
+                    filters: Dict[str, Any] = None) -> List[List[Dict]]:
+        """Search several queries at once; one result list per query."""
+        if not queries:
+            return []
+        store = self.store
+        if self._count == 0 or limit <= 0:
+            return [[] for _ in queries]
+        embeddings = store.embedder.embed(list(queries)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-8
+        rows = store._filter_rows(filters) if filters else None
+        if rows is not None:
+            rows = rows[rows < self._count]
+        
+        futures = []
+        for lo, hi in self._bounds:
+            shard_rows = None
+            if rows is not None:
+                shard_rows = rows[np.searchsorted(rows, lo):
+                                  np.searchsorted(rows, hi)]
+                if len(shard_rows) == 0:
+                    continue
+            futures.append(self._executor.submit(
+                _search_shard, lo, hi, embeddings, limit, shard_rows))
+        if not futures:
+            return [[] for _ in queries]
+        
+        parts = [future.result() for future in futures]
+        ids = np.concatenate([part[0] for part in parts], axis=1)
+        scores = np.concatenate([part[1] for part in parts], axis=1)
+        if store._n_deleted:
+            scores[store._deleted[ids]] = -np.inf
+        top = VectorStore._top_k_rows(scores, limit)
+        ids = np.take_along_axis(ids, top, axis=1)
+        scores = np.take_along_axis(scores, top, axis=1)
+        return [store._results(row_ids, row_scores)
+                for row_ids, row_scores in zip(ids, scores)]
+    
+    def close(self):
+        """Stop the workers and release the shared memory."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for buffer in self._buffers:
+            buffer.close()
+            buffer.unlink()
+        self._buffers = []
+    
+    def __enter__(self) -> "ShardedSearcher":
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index in pure NumPy.
+
+    A spherical k-means coarse quantizer partitions normalized vectors into
+    `n_lists` cells. A query only scores members of its `nprobe` closest
+    cells, trading a little recall for sub-linear search. Rows added before
+    `min_train_size` vectors exist are held back and the store searches
+    them exactly; the quantizer trains itself once enough data arrives.
+    """
+
+    def __init__(self, n_lists: int = 256, nprobe: int = 8,
+                 min_train_size: int = None, kmeans_iters: int = 10,
+                 seed: int = 0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size or n_lists * 16
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}
+        self._pending: List[int] = []
+        self._pending_vectors: List[np.ndarray] = []
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """Assign new rows to cells; `vectors[i]` is the vector of `rows[i]`."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not self.is_trained:
+            self._pending.extend(rows.tolist())
+            self._pending_vectors.append(np.asarray(vectors, dtype=np.float32))
+            if len(self._pending) >= self.min_train_size:
+                self.train(np.vstack(self._pending_vectors),
+                           np.array(self._pending, dtype=np.int64))
+            return
+        self._assign(rows, vectors)
+
+    def train(self, vectors: np.ndarray, rows: np.ndarray = None):
+        """(Re)train the quantizer on `vectors` and reassign their rows.
+
+        `rows` defaults to 0..len(vectors)-1, i.e. a full store matrix.
+        """
+        n = len(vectors)
+        if n == 0:
+            return
+        rng = np.random.default_rng(self.seed)
+        n_lists = min(self.n_lists, n)
+        sample_size = min(n, n_lists * 64)
+        sample = vectors[rng.choice(n, sample_size, replace=False)]
+        
+        self.centroids = _kmeans(sample, n_lists, self.kmeans_iters, rng,
+                                 spherical=True)
+        self._lists = [[] for _ in range(n_lists)]
+        self._list_arrays = {}
+        self._pending = []
+        self._pending_vectors = []
+        self._assign(np.arange(n) if rows is None else rows, vectors)
+
+    def cell_assignments(self, count: int) -> np.ndarray:
+        """Cell id of each of the first `count` rows; -1 if unassigned."""
+        cells = np.full(count, -1, dtype=np.int64)
+        for cell, members in enumerate(self._lists):
+            cells[members] = cell
+        return cells
+
+    def restore(self, centroids: np.ndarray, cells: np.ndarray):
+        """Rebuild a trained index from centroids and cell_assignments()."""
+        self.centroids = centroids
+        self._list_arrays = {}
+        order = np.argsort(cells, kind="stable")
+        bounds = np.searchsorted(cells[order], np.arange(len(centroids) + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]].tolist()
+                       for c in range(len(centroids))]
+        self._pending = []
+        self._pending_vectors = []
+
+    def remap(self, remap: np.ndarray):
+        """Renumber rows after VectorStore.compact (-1 drops a row)."""
+        keep = [i for i, row in enumerate(self._pending) if remap[row] >= 0]
+        self._pending = [int(remap[self._pending[i]]) for i in keep]
+        self._pending_vectors = (
+            [np.vstack(self._pending_vectors)[keep]] if self._pending_vectors
+            else []
+        )
+        for cell, members in enumerate(self._lists):
+            rows = remap[np.asarray(members, dtype=np.int64)]
+            self._lists[cell] = rows[rows >= 0].tolist()
+        self._list_arrays = {}
+
+    def candidates(self, query_embedding: np.ndarray) -> Optional[np.ndarray]:
+        """Rows in the `nprobe` cells nearest the query, or None if untrained."""
+        if not self.is_trained:
+            return None
+        cell_scores = self.centroids @ query_embedding
+        nprobe = min(self.nprobe, len(cell_scores))
+        cells = np.argpartition(-cell_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._list_array(int(c)) for c in cells])
+
+    def _assign(self, rows: np.ndarray, vectors: np.ndarray,
+                block_size: int = 65536):
+        """Append rows to their nearest cell, in blocks to bound memory."""
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            block_vectors = vectors[start:start + block_size]
+            cells = np.argmax(block_vectors @ self.centroids.T, axis=1)
+            for row, cell in zip(block.tolist(), cells.tolist()):
+                self._lists[cell].append(row)
+                self._list_arrays.pop(cell, None)
+
+    def _list_array(self, cell: int) -> np.ndarray:
+        """Cached array view of one cell's members."""
+        if cell not in self._list_arrays:
+            self._list_arrays[cell] = np.array(self._lists[cell], dtype=np.int64)
+        return self._list_arrays[cell]
+
+
+def _kmeans(data: np.ndarray, k: int, iters: int, rng: np.random.Generator,
+            spherical: bool = False) -> np.ndarray:
+    """Lloyd's k-means; spherical mode clusters by cosine on unit vectors."""
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iters):
+        if spherical:
+            assign = np.argmax(data @ centroids.T, axis=1)
+        else:
+            distances = (np.sum(centroids ** 2, axis=1)[None, :]
+                         - 2 * data @ centroids.T)
+            assign = np.argmin(distances, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+            counts[empty] = 1
+        if spherical:
+            centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-8)
+        else:
+            centroids = sums / counts[:, None]
+    return centroids.astype(np.float32)
+
+
+def _grow(array: np.ndarray, count: int, required: int) -> np.ndarray:
+    """Return `array` with room for `required` rows, doubling as needed.
+
+    Read-only (memory-mapped) arrays are copied into private memory.
+    """
+    capacity = len(array)
+    if required <= capacity and array.flags.writeable:
+        return array
+    capacity = max(capacity, 1)
+    while capacity < required:
+        capacity *= 2
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:count] = array[:count]
+    return grown
+
+
+class ScalarQuantizer:
+    """Scalar int8 quantization with one scale per vector.
+
+    Each unit vector is stored as int8 codes plus a float32 scale, roughly
+    4x smaller than float32 (8x smaller than float64). Scoring is
+    asymmetric: the float32 query is dotted with the codes block by block,
+    so the full matrix is never decoded.
+    """
+
+    kind = "int8"
+
+    def __init__(self, dimension: int, block_size: int = 65536):
+        self.dimension = dimension
+        self.block_size = block_size
+        self.codes = np.zeros((0, dimension), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self._count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._count * (self.dimension + 4)
+
+    def add(self, vectors: np.ndarray):
+        """Encode and append vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        
+        n = self._count + len(vectors)
+        self.codes = _grow(self.codes, self._count, n)
+        self.scales = _grow(self.scales, self._count, n)
+        self.codes[self._count:n] = codes
+        self.scales[self._count:n] = scales
+        self._count = n
+
+    def scores(self, query_embedding: np.ndarray,
+               rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products of the query with rows (all if None)."""
+        rows = np.arange(self._count) if rows is None else rows
+        out = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            out[start:start + len(block)] = (
+                self.codes[block].astype(np.float32) @ query_embedding
+            ) * self.scales[block]
+        return out
+
+    def decode(self, rows: np.ndarray) -> np.ndarray:
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+    def take(self, rows: np.ndarray):
+        """Keep only `rows`, in order (used by compaction)."""
+        self.codes = np.ascontiguousarray(self.codes[rows])
+        self.scales = np.ascontiguousarray(self.scales[rows])
+        self._count = len(rows)
+
+    def config(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "dimension": self.dimension,
+                "block_size": self.block_size}
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codes": self.codes[:self._count],
+                "scales": self.scales[:self._count]}
+
+    def restore(self, state: Dict[str, np.ndarray]):
+        self.codes = state["codes"]
+        self.scales = state["scales"]
+        self._count = len(self.scales)
+
+
+class ProductQuantizer:
+    """Product quantization: one byte per subvector.
+
+    The vector is split into `n_subvectors` slices, each replaced by the id
+    of its nearest centroid in a per-slice codebook of `n_centroids`
+    entries. At the default of 8 dimensions per slice a 768-d vector costs
+    96 bytes (32x smaller than float32). Queries are scored with
+    asymmetric distance computation: a (slices x centroids) lookup table
+    of query-centroid dot products, summed over each row's codes.
+
+    Vectors added before `min_train_size` exist are kept as float32 and
+    scored exactly; the codebooks then train and encode them.
+    """
+
+    kind = "pq"
+
+    def __init__(self, dimension: int, n_subvectors: int = None,
+                 n_centroids: int = 256, min_train_size: int = None,
+                 kmeans_iters: int = 10, seed: int = 0,
+                 block_size: int = 65536):
+        n_subvectors = n_subvectors or max(1, dimension // 8)
+        if dimension % n_subvectors:
+            raise ValueError(
+                f"dimension {dimension} is not divisible by "
+                f"n_subvectors {n_subvectors}")
+        if not 1 < n_centroids <= 256:
+            raise ValueError("n_centroids must be in 2..256 for uint8 codes")
+        self.dimension = dimension
+        self.n_subvectors = n_subvectors
+        self.sub_dim = dimension // n_subvectors
+        self.n_centroids = n_centroids
+        self.min_train_size = min_train_size or n_centroids * 16
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.block_size = block_size
+        self.codebooks: Optional[np.ndarray] = None  # (m, k, sub_dim)
+        self.codes = np.zeros((0, n_subvectors), dtype=np.uint8)
+        self._count = 0
+        self._pending = np.zeros((0, dimension), dtype=np.float32)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def nbytes(self) -> int:
+        if not self.is_trained:
+            return self._count * self.dimension * 4
+        return self._count * self.n_subvectors + self.codebooks.nbytes
+
+    def add(self, vectors: np.ndarray):
+        """Encode and append vectors, training first if enough have arrived."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = self._count + len(vectors)
+        if not self.is_trained:
+            self._pending = _grow(self._pending, self._count, n)
+            self._pending[self._count:n] = vectors
+            self._count = n
+            if n >= self.min_train_size:
+                self.train(self._pending[:n])
+            return
+        self.codes = _grow(self.codes, self._count, n)
+        self.codes[self._count:n] = self._encode(vectors)
+        self._count = n
+
+    def train(self, vectors: np.ndarray):
+        """Train codebooks on `vectors` and make them the encoded rows."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        k = min(self.n_centroids, len(vectors))
+        sample = vectors[rng.choice(len(vectors),
+                                    min(len(vectors), k * 64), replace=False)]
+        self.codebooks = np.stack([
+            _kmeans(sample[:, s * self.sub_dim:(s + 1) * self.sub_dim],
+                    k, self.kmeans_iters, rng)
+            for s in range(self.n_subvectors)
+        ])
+        self.codes = self._encode(vectors)
+        self._count = len(vectors)
+        self._pending = np.zeros((0, self.dimension), dtype=np.float32)
+
+    def scores(self, query_embedding: np.ndarray,
+               rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products of the query with rows (all if None)."""
+        rows = np.arange(self._count) if rows is None else rows
+        if not self.is_trained:
+            return self._pending[rows] @ query_embedding
+        # lut[s, c] = <query slice s, centroid c of codebook s>
+        lut = np.einsum("skd,sd->sk", self.codebooks,
+                        query_embedding.reshape(self.n_subvectors, self.sub_dim))
+        slices = np.arange(self.n_subvectors)
+        out = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            out[start:start + len(block)] = lut[slices, self.codes[block]].sum(axis=1)
+        return out
+
+    def decode(self, rows: np.ndarray) -> np.ndarray:
+        if not self.is_trained:
+            return self._pending[rows]
+        slices = np.arange(self.n_subvectors)
+        return self.codebooks[slices, self.codes[rows]].reshape(
+            len(rows), self.dimension)
+
+    def take(self, rows: np.ndarray):
+        """Keep only `rows`, in order (used by compaction)."""
+        if self.is_trained:
+            self.codes = np.ascontiguousarray(self.codes[rows])
+        else:
+            self._pending = np.ascontiguousarray(self._pending[rows])
+        self._count = len(rows)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest-centroid id per slice, in blocks to bound memory."""
+        codes = np.empty((len(vectors), self.n_subvectors), dtype=np.uint8)
+        norms = np.sum(self.codebooks ** 2, axis=2)
+        for start in range(0, len(vectors), self.block_size):
+            block = vectors[start:start + self.block_size]
+            for s in range(self.n_subvectors):
+                sub = block[:, s * self.sub_dim:(s + 1) * self.sub_dim]
+                distances = norms[s][None, :] - 2 * sub @ self.codebooks[s].T
+                codes[start:start + len(block), s] = np.argmin(distances, axis=1)
+        return codes
+
+    def config(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "dimension": self.dimension,
+                "n_subvectors": self.n_subvectors,
+                "n_centroids": self.n_centroids,
+                "min_train_size": self.min_train_size,
+                "kmeans_iters": self.kmeans_iters, "seed": self.seed,
+                "block_size": self.block_size}
+
+    def state(self) -> Dict[str, np.ndarray]:
+        if not self.is_trained:
+            return {"pending": self._pending[:self._count]}
+        return {"codebooks": self.codebooks, "codes": self.codes[:self._count]}
+
+    def restore(self, state: Dict[str, np.ndarray]):
+        if "codebooks" in state:
+            self.codebooks = np.asarray(state["codebooks"])
+            self.codes = state["codes"]
+            self._count = len(self.codes)
+        else:
+            self._pending = state["pending"]
+            self._count = len(self._pending)
+
+
+QUANTIZERS = {cls.kind: cls for cls in (ScalarQuantizer, ProductQuantizer)}
+
+
+# Compound identifiers (file names, error codes, dotted paths) are kept
+# whole and also split into their word parts.
+_TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/:]\w+)*")
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercased BM25 terms of `text`."""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = _WORD_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 keyword index over document text, updated on every add.
+
+    Each term keeps an append-only posting list of (row, term frequency),
+    so a query only touches the postings of its own terms. Scores are
+    accumulated with a single bincount over the concatenated postings.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[int]] = {}
+        self.frequencies: Dict[str, List[int]] = {}
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self._count = 0
+        self._total_length = 0
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, rows: np.ndarray, texts: List[str]):
+        """Index texts under their rows (ascending, after existing rows)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self.doc_lengths = _grow(self.doc_lengths, self._count,
+                                 int(rows[-1]) + 1)
+        for row, text in zip(rows.tolist(), texts):
+            tokens = _tokenize(text)
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self.postings.setdefault(token, []).append(row)
+                self.frequencies.setdefault(token, []).append(tf)
+            self.doc_lengths[row] = len(tokens)
+            self._total_length += len(tokens)
+        self._count = int(rows[-1]) + 1
+
+    def search(self, query: str, limit: int,
+               rows: Optional[np.ndarray] = None,
+               exclude: Optional[np.ndarray] = None
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and BM25 scores of the best `limit` matches, best first.
+
+        `rows` restricts matches to a candidate set; `exclude` is a
+        boolean mask of rows to skip (e.g. tombstones).
+        """
+        terms = [t for t in dict.fromkeys(_tokenize(query))
+                 if t in self.postings]
+        if not terms or not self._count:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        avg_length = self._total_length / self._count or 1.0
+        hit_rows, weights = [], []
+        for term in terms:
+            posting, tf = self._term_arrays(term)
+            idf = np.log1p((self._count - len(posting) + 0.5)
+                           / (len(posting) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b
+                              * self.doc_lengths[posting] / avg_length)
+            hit_rows.append(posting)
+            weights.append(idf * tf * (self.k1 + 1) / (tf + norm))
+
+        matched, inverse = np.unique(np.concatenate(hit_rows),
+                                     return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        keep = np.ones(len(matched), dtype=bool)
+        if rows is not None:
+            keep &= np.isin(matched, rows, assume_unique=True)
+        if exclude is not None:
+            keep &= ~exclude[matched]
+        matched, scores = matched[keep], scores[keep]
+        top = VectorStore._top_k(scores, limit)
+        return matched[top], scores[top]
+
+    def remap(self, remap: np.ndarray):
+        """Renumber rows after compaction; rows mapped to -1 are dropped."""
+        kept = np.flatnonzero(remap[:self._count] >= 0)
+        for term in list(self.postings):
+            posting = np.asarray(self.postings[term], dtype=np.int64)
+            tf = np.asarray(self.frequencies[term], dtype=np.int64)
+            new = remap[posting]
+            alive = new >= 0
+            if alive.any():
+                self.postings[term] = new[alive].tolist()
+                self.frequencies[term] = tf[alive].tolist()
+            else:
+                del self.postings[term]
+                del self.frequencies[term]
+        self.doc_lengths = np.ascontiguousarray(self.doc_lengths[kept])
+        self._count = len(kept)
+        self._total_length = int(self.doc_lengths.sum())
+        self._arrays = {}
+
+    def config(self) -> Dict[str, Any]:
+        return {"k1": self.k1, "b": self.b}
+
+    def state(self) -> Tuple[List, Dict[str, np.ndarray]]:
+        """Term sections [term, start, stop] and the concatenated arrays."""
+        sections, rows, tfs, start = [], [], [], 0
+        for term, posting in self.postings.items():
+            sections.append([term, start, start + len(posting)])
+            rows.append(np.asarray(posting, dtype=np.int64))
+            tfs.append(np.asarray(self.frequencies[term], dtype=np.int32))
+            start += len(posting)
+        empty = [np.empty(0, dtype=np.int64)]
+        return sections, {
+            "rows": np.concatenate(rows or empty),
+            "tfs": np.concatenate(tfs or empty).astype(np.int32),
+            "doc_lengths": self.doc_lengths[:self._count],
+        }
+
+    def restore(self, sections: List, arrays: Dict[str, np.ndarray]):
+        rows, tfs = arrays["rows"], arrays["tfs"]
+        for term, start, stop in sections:
+            self.postings[term] = rows[start:stop].tolist()
+            self.frequencies[term] = tfs[start:stop].tolist()
+        self.doc_lengths = np.array(arrays["doc_lengths"], dtype=np.int32)
+        self._count = len(self.doc_lengths)
+        self._total_length = int(self.doc_lengths.sum())
+        self._arrays = {}
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Posting rows and frequencies of a term, rebuilt when it grows."""
+        posting = self.postings[term]
+        cached = self._arrays.get(term)
+        if cached is None or len(cached[0]) != len(posting):
+            cached = (np.array(posting, dtype=np.int64),
+                      np.array(self.frequencies[term], dtype=np.float64))
+            self._arrays[term] = cached
+        return cached
+
+
+class _JsonLinesRecords:
+    """List-like view of a JSON-lines file, parsing records on first access.
+
+    Records live in a read-only memory map addressed by byte offsets;
+    parsed and replaced records are cached, appended ones are kept in RAM.
+    """
+
+    def __init__(self, path: Path, offsets: np.ndarray):
+        self._offsets = offsets
+        self._size = len(offsets) - 1
+        self._map = None
+        if self._size > 0:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._cache: Dict[int, Dict] = {}
+        self._appended: List[Dict] = []
+
+    def __len__(self) -> int:
+        return self._size + len(self._appended)
+
+    def __getitem__(self, i: int) -> Dict:
+        i = self._position(i)
+        if i >= self._size:
+            return self._appended[i - self._size]
+        if i not in self._cache:
+            start, stop = self._offsets[i], self._offsets[i + 1]
+            self._cache[i] = json.loads(self._map[start:stop])
+        return self._cache[i]
+
+    def __setitem__(self, i: int, record: Dict):
+        i = self._position(i)
+        if i >= self._size:
+            self._appended[i - self._size] = record
+        else:
+            self._cache[i] = record
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, record: Dict):
+        self._appended.append(record)
+
+    def _position(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("record index out of range")
+        return int(i)
+
+
+class GraphJournal:
+    """Append-only write-ahead log plus compacted snapshots for a graph.
+
+    Layout of the journal directory:
+      wal.jsonl      one JSON mutation record per line, each with an "lsn"
+      snapshot.pkl   pickled graph state and the last lsn it contains
+
+    Every mutation is appended (and flushed, optionally fsynced) before
+    it is applied. checkpoint() writes a fresh snapshot atomically and
+    truncates the log, and it runs automatically every `checkpoint_every`
+    records. Recovery loads the snapshot and replays only log records
+    newer than it, ignoring a torn final line left by a crash.
+
+    Records must be JSON-serializable, and the graph applies them as
+    decoded from the log (tuples become lists), so the recovered state
+    is the same whether or not a checkpoint happened. snapshot.pkl is
+    unpickled on recovery: only open journal directories you trust.
+    """
+
+    def __init__(self, path: str, fsync: bool = False,
+                 checkpoint_every: int = 100_000):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.wal_path = self.path / "wal.jsonl"
+        self.snapshot_path = self.path / "snapshot.pkl"
+        self.fsync = fsync
+        self.checkpoint_every = checkpoint_every
+        self.lsn = 0
+        self._since_checkpoint = 0
+        self._wal = None
+
+    def recover(self, graph: "PropertyGraph"):
+        """Load the snapshot into `graph`, then replay the log tail."""
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+            graph._restore_state(snapshot["state"])
+            self.lsn = snapshot["lsn"]
+        
+        valid_bytes = 0
+        if self.wal_path.exists():
+            with open(self.wal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete record")
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # torn write at the tail
+                    valid_bytes += len(line)
+                    if record["lsn"] > self.lsn:
+                        graph._apply(record)
+                        self.lsn = record["lsn"]
+                        self._since_checkpoint += 1
+        self._wal = open(self.wal_path, "ab")
+        self._wal.truncate(valid_bytes)  # drop any torn tail before appending
+
+    @property
+    def checkpoint_due(self) -> bool:
+        return self._since_checkpoint >= self.checkpoint_every
+
+    def append(self, record: Dict) -> Dict:
+        """Durably log one mutation record (before it is applied).
+
+        Returns the record as replay will decode it; raises ValueError if
+        it is not JSON-serializable (e.g. a datetime property).
+        """
+        try:
+            line = json.dumps({**record, "lsn": self.lsn + 1})
+        except TypeError as e:
+            raise ValueError(f"Graph record is not JSON-serializable: {e}") from e
+        self.lsn += 1
+        self._wal.write(line.encode() + b"\n")
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+        self._since_checkpoint += 1
+        return json.loads(line)
+
+    def checkpoint(self, graph: "PropertyGraph"):
+        """Snapshot the full graph state and start an empty log."""
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"lsn": self.lsn, "state": graph._snapshot_state()},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        
+        # Records up to self.lsn are in the snapshot; recovery skips them
+        # even if the truncation below does not happen.
+        self._wal.close()
+        self._wal = open(self.wal_path, "wb")
+        self._since_checkpoint = 0
+
+    def close(self):
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+
 class PropertyGraph:
-    """Simple property graph storage."""
+    """Simple property graph storage.
+
+    Every mutation is expressed as a record applied by `_apply`, so an
+    attached GraphJournal can log it and replay it on recovery.
+    """
 
     def __init__(self):
         self.nodes: Dict[str, Dict] = {}
@@ -136,6 +2053,38 @@ class PropertyGraph:
         self.entity_registry: Dict[str, str] = {}  # name -> node_id
         self.node_index: Dict[str, List[str]] = {}  # label -> node_ids
         self.edge_index: Dict[str, List[str]] = {}  # type -> edge_ids
+        self.outgoing: Dict[str, List[str]] = {}  # node_id -> edge_ids
+        self.incoming: Dict[str, List[str]] = {}  # node_id -> edge_ids
+        self.journal: Optional[GraphJournal] = None
+        self._sequence = itertools.count()  # disambiguates same-tick ids
+
+    @classmethod
+    def open(cls, path: str, **journal_options) -> "PropertyGraph":
+        """Recover a durable graph from `path` (created if missing)."""
+        graph = cls()
+        journal = GraphJournal(path, **journal_options)
+        journal.recover(graph)
+        graph.journal = journal
+        return graph
+
+    def checkpoint(self):
+        """Write a compacted snapshot and truncate the write-ahead log."""
+        if self.journal is not None:
+            self.journal.checkpoint(self)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def get_or_create_nodes(self, names: List[str],
+                            label: str = "Entity") -> Dict[str, str]:
+        """Resolve many entity names at once, creating the missing nodes."""
+        node_ids = {}
+        for name in names:
+            if name not in node_ids:
+                node_ids[name] = self.get_or_create_node(name, label)
+        return node_ids
 
     def get_or_create_node(self, name: str, label: str = "Entity",
                            properties: Dict = None) -> str:
@@ -144,42 +2093,52 @@ class PropertyGraph:
         if name in self.entity_registry:
             node_id = self.entity_registry[name]
             if properties:
-                self.nodes[node_id]["properties"].update(properties)
+                self._commit({"op": "update_node", "id": node_id,
+                              "properties": properties})
             return node_id
-        node_id = self.create_node(label, {**(properties or {}), "name": name})
-        self.entity_registry[name] = node_id
-        return node_id
+        return self.create_node(label, {**(properties or {}), "name": name},
+                                register=name)
+
+    def create_node(self, label: str, properties: Dict = None,
+                    register: str = None) -> str:
+        """Create node with label and properties.
 
-    def create_node(self, label: str, properties: Dict = None) -> str:
-        """Create node with label and properties."""
-        import time
-        node_id = hashlib.md5(f"{label}{time.time()}".encode()).hexdigest()[:16]
+        `register` records the node in entity_registry under that name.
+        """
+        node_id = hashlib.md5(
+            f"{label}{time.time()}{next(self._sequence)}".encode()
+        ).hexdigest()[:16]
         
-        self.nodes[node_id] = {
+        self._commit({"op": "add_node", "register": register, "node": {
             "id": node_id,
             "label": label,
             "properties": properties or {},
             "created_at": time.time()
-        }
-        
-        if label not in self.node_index:
-            self.node_index[label] = []
-        self.node_index[label].append(node_id)
+        }})
         
         return node_id
     
     def create_relationship(self, source_id: str, rel_type: str, 
                            target_id: str, properties: Dict = None) -> str:
         """Create directed relationship between nodes."""
-        import time
+        edge = self._new_edge(source_id, rel_type, target_id, properties)
+        self._commit({"op": "add_edge", "edge": edge})
+        return edge["id"]
+    
+    def _new_edge(self, source_id: str, rel_type: str, target_id: str,
+                  properties: Dict = None) -> Dict:
+        """Validate endpoints and build (but do not store) an edge record."""
         if source_id not in self.nodes:
             raise ValueError(f"Unknown source node: {source_id}")
         if target_id not in self.nodes:
             raise ValueError(f"Unknown target node: {target_id}")
         
-        edge_id = hashlib.md5(f"{source_id}{rel_type}{target_id}{time.time()}".encode()).hexdigest()[:16]
+        edge_id = hashlib.md5(
+            f"{source_id}{rel_type}{target_id}{time.time()}"
+            f"{next(self._sequence)}".encode()
+        ).hexdigest()[:16]
         
-        self.edges[edge_id] = {
+        return {
             "id": edge_id,
             "source": source_id,
             "target": target_id,
@@ -187,12 +2146,54 @@ class PropertyGraph:
             "properties": properties or {},
             "created_at": time.time()
         }
+    
+    def _commit(self, record: Dict):
+        """Log a mutation record (if journaled), then apply it."""
+        if self.journal is not None:
+            record = self.journal.append(record)
+        self._apply(record)
+        if self.journal is not None and self.journal.checkpoint_due:
+            self.journal.checkpoint(self)
+    
+    def _apply(self, record: Dict):
+        """Apply one mutation record; shared by live writes and replay."""
+        op = record["op"]
+        if op == "add_node":
+            self._add_node(record["node"], record.get("register"))
+        elif op == "add_edge":
+            self._add_edge(record["edge"])
+        elif op == "update_node":
+            self.nodes[record["id"]]["properties"].update(record["properties"])
+        else:
+            raise ValueError(f"Unknown graph mutation: {op}")
+    
+    def _add_node(self, node: Dict, register: str = None):
+        node_id = node["id"]
+        self.nodes[node_id] = node
         
-        if rel_type not in self.edge_index:
-            self.edge_index[rel_type] = []
-        self.edge_index[rel_type].append(edge_id)
+        if node["label"] not in self.node_index:
+            self.node_index[node["label"]] = []
+        self.node_index[node["label"]].append(node_id)
+        if register is not None:
+            self.entity_registry[register] = node_id
+    
+    def _add_edge(self, edge: Dict):
+        edge_id = edge["id"]
+        self.edges[edge_id] = edge
         
-        return edge_id
+        if edge["type"] not in self.edge_index:
+            self.edge_index[edge["type"]] = []
+        self.edge_index[edge["type"]].append(edge_id)
+        self.outgoing.setdefault(edge["source"], []).append(edge_id)
+        self.incoming.setdefault(edge["target"], []).append(edge_id)
+    
+    def _snapshot_state(self) -> Dict[str, Any]:
+        """Picklable graph state (everything but the journal and counter)."""
+        return {key: value for key, value in vars(self).items()
+                if key not in ("journal", "_sequence")}
+    
+    def _restore_state(self, state: Dict[str, Any]):
+        vars(self).update(state)
     
     def query(self, pattern: Dict) -> List[Dict]:
         """Query graph with simple pattern matching."""
@@ -202,45 +2203,54 @@ class PropertyGraph:
         if "type" in pattern:
             edge_ids = self.edge_index.get(pattern["type"], [])
             for eid in edge_ids:
-                edge = self.edges[eid]
-                source = self.nodes.get(edge["source"], {})
-                target = self.nodes.get(edge["target"], {})
-                
-                # Match source label
-                if "source_label" in pattern:
-                    if source.get("label") != pattern["source_label"]:
-                        continue
-                
-                # Match target label
-                if "target_label" in pattern:
-                    if target.get("label") != pattern["target_label"]:
-                        continue
-                
-                results.append({
-                    "source": source,
-                    "edge": edge,
-                    "target": target
-                })
+                result = self._match_edge(eid, pattern)
+                if result is not None:
+                    results.append(result)
         
         return results
     
+    def _match_edge(self, edge_id: str, pattern: Dict) -> Optional[Dict]:
+        """Source/edge/target triple if the edge's endpoints match pattern."""
+        edge = self.edges[edge_id]
+        source = self.nodes.get(edge["source"], {})
+        target = self.nodes.get(edge["target"], {})
+        
+        # Match source label
+        if "source_label" in pattern:
+            if source.get("label") != pattern["source_label"]:
+                return None
+        
+        # Match target label
+        if "target_label" in pattern:
+            if target.get("label") != pattern["target_label"]:
+                return None
+        
+        return {
+            "source": source,
+            "edge": edge,
+            "target": target
+        }
+    
     def get_node(self, node_id: str) -> Optional[Dict]:
         """Get node by ID."""
         return self.nodes.get(node_id)
     
     def get_relationships(self, node_id: str, 
                           direction: str = "both") -> List[Dict]:
-        """Get relationships for a node."""
+        """Get relationships for a node, in O(degree) via adjacency lists."""
         relationships = []
         
-        for edge in self.edges.values():
-            if direction in ["outgoing", "both"] and edge["source"] == node_id:
+        if direction in ["outgoing", "both"]:
+            for edge_id in self.outgoing.get(node_id, []):
+                edge = self.edges[edge_id]
                 relationships.append({
                     "edge": edge,
                     "target": self.nodes.get(edge["target"]),
                     "direction": "outgoing"
                 })
-            if direction in ["incoming", "both"] and edge["target"] == node_id:
+        if direction in ["incoming", "both"]:
+            for edge_id in self.incoming.get(node_id, []):
+                edge = self.edges[edge_id]
                 relationships.append({
                     "edge": edge,
                     "source": self.nodes.get(edge["source"]),
@@ -248,10 +2258,449 @@ class PropertyGraph:
                 })
         
         return relationships
+    
+    def traverse(self, start_ids: Union[str, List[str]], max_hops: int = 2,
+                 edge_types: List[str] = None, direction: str = "both",
+                 max_nodes: int = 100, edge_filter=None) -> Dict:
+        """Breadth-first k-hop neighbourhood around the start nodes.
+
+        Expands one frontier per hop over the adjacency lists, following
+        only edges whose type is in `edge_types` (all if None) and that
+        pass `edge_filter(edge)`. Stops admitting new nodes once
+        `max_nodes` are in the subgraph. Returns the deduplicated
+        subgraph: {"nodes": {id: node}, "edges": {id: edge},
+        "depth": {node_id: hops from the nearest start node}}.
+        """
+        if isinstance(start_ids, str):
+            start_ids = [start_ids]
+        types = set(edge_types) if edge_types else None
+        
+        depth: Dict[str, int] = {}
+        for node_id in start_ids:
+            if node_id in self.nodes and len(depth) < max_nodes:
+                depth[node_id] = 0
+        edges: Dict[str, Dict] = {}
+        
+        frontier = list(depth)
+        for hop in range(1, max_hops + 1):
+            next_frontier = []
+            for node_id in frontier:
+                for edge_id, neighbor in self._neighbors(node_id, direction):
+                    edge = self.edges[edge_id]
+                    if types is not None and edge["type"] not in types:
+                        continue
+                    if edge_filter is not None and not edge_filter(edge):
+                        continue
+                    if neighbor not in depth:
+                        if len(depth) >= max_nodes:
+                            continue
+                        depth[neighbor] = hop
+                        next_frontier.append(neighbor)
+                    edges[edge_id] = edge
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        
+        return {
+            "nodes": {node_id: self.nodes[node_id] for node_id in depth},
+            "edges": edges,
+            "depth": depth
+        }
+    
+    def _neighbors(self, node_id: str, direction: str):
+        """(edge_id, neighbour node_id) pairs from the adjacency lists."""
+        if direction in ["outgoing", "both"]:
+            for edge_id in self.outgoing.get(node_id, []):
+                yield edge_id, self.edges[edge_id]["target"]
+        if direction in ["incoming", "both"]:
+            for edge_id in self.incoming.get(node_id, []):
+                yield edge_id, self.edges[edge_id]["source"]
+
+
+class CompactGraph:
+    """Columnar property graph with dense integer ids, for large graphs.
+
+    Nodes and edges are rows of small-int NumPy columns (label code,
+    source, target, type code) instead of dicts keyed by md5 strings, so
+    an edge costs ~10 bytes plus any properties. Properties live in sparse
+    side tables, and names resolve through one name -> id dict.
+
+    Adjacency is stored as CSR (per-node offsets into edge ids sorted by
+    endpoint) for the bulk of the edges. Edges added since the last
+    rebuild sit in a small per-node tail that is folded into the CSR once
+    it exceeds max(merge_threshold, edges / 16), keeping appends
+    amortized O(1) and neighbour scans contiguous.
+
+    CompactGraph is standalone: it has no temporal validity and no
+    journal, so IntegratedMemorySystem keeps its TemporalKnowledgeGraph.
+    Use from_graph() to snapshot a graph for large read-only traversals.
+    """
+
+    def __init__(self, initial_capacity: int = 1024,
+                 merge_threshold: int = 4096):
+        capacity = max(1, initial_capacity)
+        self.merge_threshold = merge_threshold
+        # Code tables
+        self.labels: List[str] = []
+        self.types: List[str] = []
+        self._label_codes: Dict[str, int] = {}
+        self._type_codes: Dict[str, int] = {}
+        # Node columns
+        self.node_count = 0
+        self.node_labels = np.zeros(capacity, dtype=np.int16)
+        self.names: List[Optional[str]] = []
+        self.entity_registry: Dict[str, int] = {}  # name -> node id
+        self.node_properties: Dict[int, Dict] = {}
+        # Edge columns
+        self.edge_count = 0
+        self.sources = np.zeros(capacity, dtype=np.int32)
+        self.targets = np.zeros(capacity, dtype=np.int32)
+        self.edge_types = np.zeros(capacity, dtype=np.int16)
+        self.edge_properties: Dict[int, Dict] = {}
+        # CSR adjacency over the first _csr_edges edges, plus the tail
+        self._csr_edges = 0
+        self._out_offsets = np.zeros(1, dtype=np.int64)
+        self._out_edges = np.empty(0, dtype=np.int32)
+        self._in_offsets = np.zeros(1, dtype=np.int64)
+        self._in_edges = np.empty(0, dtype=np.int32)
+        self._tail_out: Dict[int, List[int]] = {}
+        self._tail_in: Dict[int, List[int]] = {}
+
+    @classmethod
+    def from_graph(cls, graph: PropertyGraph) -> "CompactGraph":
+        """Convert a dict-based PropertyGraph; returns the compact graph.
+
+        Node and edge string ids are not kept; registered names are.
+        """
+        compact = cls(initial_capacity=max(len(graph.nodes), len(graph.edges)))
+        names = {node_id: name for name, node_id in graph.entity_registry.items()}
+        ids = {}
+        for node_id, node in graph.nodes.items():
+            properties = {key: value for key, value in node["properties"].items()
+                          if not (key == "name" and node_id in names)}
+            ids[node_id] = compact.create_node(node["label"], properties,
+                                               name=names.get(node_id))
+        for edge in graph.edges.values():
+            compact.create_relationship(ids[edge["source"]], edge["type"],
+                                        ids[edge["target"]], edge["properties"])
+        return compact
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the NumPy columns and CSR arrays."""
+        arrays = (self.node_labels, self.sources, self.targets,
+                  self.edge_types, self._out_offsets, self._out_edges,
+                  self._in_offsets, self._in_edges)
+        return sum(array.nbytes for array in arrays)
+
+    def get_or_create_nodes(self, names: List[str],
+                            label: str = "Entity") -> Dict[str, int]:
+        """Resolve many entity names at once, creating the missing nodes."""
+        return {name: self.get_or_create_node(name, label) for name in names}
+
+    def get_or_create_node(self, name: str, label: str = "Entity",
+                           properties: Dict = None) -> int:
+        """Get existing node by name, or create a new one."""
+        node_id = self.entity_registry.get(name)
+        if node_id is None:
+            return self.create_node(label, properties, name=name)
+        if properties:
+            self.node_properties.setdefault(node_id, {}).update(properties)
+        return node_id
+
+    def create_node(self, label: str, properties: Dict = None,
+                    name: str = None) -> int:
+        """Create a node; `name` registers it in entity_registry."""
+        node_id = self.node_count
+        self.node_labels = _grow(self.node_labels, node_id, node_id + 1)
+        self.node_labels[node_id] = self._code(label, self.labels,
+                                               self._label_codes)
+        self.names.append(name)
+        if name is not None:
+            self.entity_registry[name] = node_id
+        if properties:
+            self.node_properties[node_id] = dict(properties)
+        self.node_count += 1
+        return node_id
+
+    def create_relationship(self, source_id: int, rel_type: str,
+                            target_id: int, properties: Dict = None) -> int:
+        """Create directed relationship between nodes; returns its edge id."""
+        for node_id in (source_id, target_id):
+            if not 0 <= node_id < self.node_count:
+                raise ValueError(f"Unknown node: {node_id}")
+        edge_id = self.edge_count
+        for name in ("sources", "targets", "edge_types"):
+            setattr(self, name, _grow(getattr(self, name), edge_id, edge_id + 1))
+        self.sources[edge_id] = source_id
+        self.targets[edge_id] = target_id
+        self.edge_types[edge_id] = self._code(rel_type, self.types,
+                                              self._type_codes)
+        if properties:
+            self.edge_properties[edge_id] = dict(properties)
+        self.edge_count += 1
+        
+        self._tail_out.setdefault(source_id, []).append(edge_id)
+        self._tail_in.setdefault(target_id, []).append(edge_id)
+        if (self.edge_count - self._csr_edges
+                > max(self.merge_threshold, self.edge_count // 16)):
+            self._build_csr()
+        return edge_id
+
+    def get_node(self, node_id: int) -> Optional[Dict]:
+        """Node as a dict (materialized on demand)."""
+        if not 0 <= node_id < self.node_count:
+            return None
+        properties = dict(self.node_properties.get(node_id, {}))
+        if self.names[node_id] is not None:
+            properties["name"] = self.names[node_id]
+        return {"id": node_id,
+                "label": self.labels[self.node_labels[node_id]],
+                "properties": properties}
+
+    def get_edge(self, edge_id: int) -> Dict:
+        """Edge as a dict (materialized on demand)."""
+        return {"id": edge_id,
+                "source": int(self.sources[edge_id]),
+                "target": int(self.targets[edge_id]),
+                "type": self.types[self.edge_types[edge_id]],
+                "properties": dict(self.edge_properties.get(edge_id, {}))}
+
+    def get_relationships(self, node_id: int,
+                          direction: str = "both") -> List[Dict]:
+        """Relationships of a node, in the PropertyGraph result format."""
+        relationships = []
+        if direction in ["outgoing", "both"]:
+            for edge_id in self.edges_of([node_id], "outgoing").tolist():
+                relationships.append({
+                    "edge": self.get_edge(edge_id),
+                    "target": self.get_node(int(self.targets[edge_id])),
+                    "direction": "outgoing"
+                })
+        if direction in ["incoming", "both"]:
+            for edge_id in self.edges_of([node_id], "incoming").tolist():
+                relationships.append({
+                    "edge": self.get_edge(edge_id),
+                    "source": self.get_node(int(self.sources[edge_id])),
+                    "direction": "incoming"
+                })
+        return relationships
+
+    def query(self, pattern: Dict) -> np.ndarray:
+        """Edge ids matching "type" and optional source/target labels."""
+        if "type" not in pattern or pattern["type"] not in self._type_codes:
+            return np.empty(0, dtype=np.int64)
+        edges = np.flatnonzero(self.edge_types[:self.edge_count]
+                               == self._type_codes[pattern["type"]])
+        for key, endpoints in (("source_label", self.sources),
+                               ("target_label", self.targets)):
+            if key in pattern:
+                code = self._label_codes.get(pattern[key], -1)
+                edges = edges[self.node_labels[endpoints[edges]] == code]
+        return edges
+
+    def edges_of(self, node_ids, direction: str = "outgoing") -> np.ndarray:
+        """Ids of the edges leaving ("outgoing") or entering ("incoming")
+        the given nodes, gathered from the CSR ranges and the tail."""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if direction == "outgoing":
+            offsets, edges, tail = self._out_offsets, self._out_edges, self._tail_out
+        else:
+            offsets, edges, tail = self._in_offsets, self._in_edges, self._tail_in
+        indexed = node_ids[node_ids < len(offsets) - 1]
+        starts, stops = offsets[indexed], offsets[indexed + 1]
+        lengths = stops - starts
+        # Concatenate the ranges starts[i]:stops[i] without a Python loop
+        positions = (np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                     + np.arange(lengths.sum()))
+        parts = [edges[positions]]
+        if tail:
+            parts.extend(np.asarray(tail[node], dtype=np.int32)
+                         for node in node_ids.tolist() if node in tail)
+        return np.concatenate(parts).astype(np.int64)
+
+    def traverse(self, start_ids, max_hops: int = 2,
+                 edge_types: List[str] = None, direction: str = "both",
+                 max_nodes: int = 100) -> Dict[str, np.ndarray]:
+        """Breadth-first k-hop neighbourhood, one vectorized step per hop.
+
+        Same semantics as PropertyGraph.traverse, returned as arrays:
+        {"nodes": node ids, "depth": hops per node, "edges": edge ids}.
+        """
+        start = np.unique(np.atleast_1d(np.asarray(start_ids, dtype=np.int64)))
+        start = start[(start >= 0) & (start < self.node_count)][:max_nodes]
+        # Visited ids as a sorted array: the cost follows the neighbourhood
+        # size, not node_count
+        visited = start
+        nodes, depths, edges = [start], [np.zeros(len(start), dtype=np.int32)], []
+        codes = None
+        if edge_types:
+            codes = [self._type_codes[t] for t in edge_types
+                     if t in self._type_codes]
+        admitted = len(start)
+        
+        frontier = start
+        for hop in range(1, max_hops + 1):
+            edge_parts, neighbor_parts = [], []
+            if direction in ["outgoing", "both"]:
+                out = self.edges_of(frontier, "outgoing")
+                edge_parts.append(out)
+                neighbor_parts.append(self.targets[out])
+            if direction in ["incoming", "both"]:
+                inc = self.edges_of(frontier, "incoming")
+                edge_parts.append(inc)
+                neighbor_parts.append(self.sources[inc])
+            hop_edges = np.concatenate(edge_parts)
+            neighbors = np.concatenate(neighbor_parts).astype(np.int64)
+            if codes is not None:
+                keep = np.isin(self.edge_types[hop_edges], codes)
+                hop_edges, neighbors = hop_edges[keep], neighbors[keep]
+            
+            # Admit unseen neighbours in discovery order, up to max_nodes
+            unseen = ~np.isin(neighbors, visited)
+            new, first = np.unique(neighbors[unseen], return_index=True)
+            new = new[np.argsort(first)][:max(0, max_nodes - admitted)]
+            admitted += len(new)
+            visited = np.union1d(visited, new)
+            edges.append(hop_edges[np.isin(neighbors, visited)])
+            if not len(new):
+                break
+            nodes.append(new)
+            depths.append(np.full(len(new), hop, dtype=np.int32))
+            frontier = new
+        
+        return {"nodes": np.concatenate(nodes), "depth": np.concatenate(depths),
+                "edges": np.unique(np.concatenate(edges)) if edges
+                else np.empty(0, dtype=np.int64)}
+
+    def _build_csr(self):
+        """Rebuild CSR adjacency over all edges and clear the tail."""
+        count = self.edge_count
+        for endpoints, name in ((self.sources, "out"), (self.targets, "in")):
+            keys = endpoints[:count]
+            order = np.argsort(keys, kind="stable").astype(np.int32)
+            offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys, minlength=self.node_count),
+                      out=offsets[1:])
+            setattr(self, f"_{name}_offsets", offsets)
+            setattr(self, f"_{name}_edges", order)
+        self._csr_edges = count
+        self._tail_out = {}
+        self._tail_in = {}
+
+    @staticmethod
+    def _code(value: str, table: List[str], codes: Dict[str, int]) -> int:
+        """Small-int code of a label or type, assigned on first use."""
+        code = codes.get(value)
+        if code is None:
+            if len(table) >= np.iinfo(np.int16).max:
+                raise ValueError("Too many distinct labels or types")
+            code = codes[value] = len(table)
+            table.append(value)
+        return code
+
+
+class IntervalIndex:
+    """Validity intervals of one relationship type as sorted endpoint arrays.
+
+    Bounds are epoch seconds (open-ended intervals end at +inf). Intervals
+    are kept in arrays sorted by start; a point or range query binary-
+    searches the start bound and filters that prefix's ends in one
+    vectorized pass, so no timestamp is parsed at query time. New
+    intervals land in a small unsorted tail that is merged into the
+    arrays once it outgrows sqrt(n) (and `merge_threshold`).
+
+    This is not a stabbing structure: a query costs O(log n + p + tail),
+    where p counts the intervals starting by the query bound. For a
+    "now" query p is every interval of the type, so it is O(n) (a NumPy
+    comparison per interval, with the tail checked in Python).
+    """
+
+    def __init__(self, merge_threshold: int = 1024):
+        self.merge_threshold = merge_threshold
+        self._starts = np.empty(0, dtype=np.float64)
+        self._ends = np.empty(0, dtype=np.float64)
+        self._ids = np.empty(0, dtype=object)
+        self._tail: Dict[str, List[float]] = {}  # edge_id -> [start, end]
+
+    def __len__(self) -> int:
+        return len(self._starts) + len(self._tail)
+
+    def add(self, edge_id: str, start: float, end: float):
+        self._tail[edge_id] = [start, end]
+        if len(self._tail) >= max(self.merge_threshold,
+                                  int(len(self._starts) ** 0.5)):
+            self._merge()
+
+    def set_end(self, edge_id: str, start: float, end: float):
+        """Move the end bound of an existing interval."""
+        if edge_id in self._tail:
+            self._tail[edge_id][1] = end
+            return
+        lo = np.searchsorted(self._starts, start, side="left")
+        hi = np.searchsorted(self._starts, start, side="right")
+        for row in range(lo, hi):
+            if self._ids[row] == edge_id:
+                self._ends[row] = end
+                return
+        raise KeyError(edge_id)
+
+    def at(self, t: float) -> List[str]:
+        """Edges valid at t: start <= t < end."""
+        return self._select(t, lambda ends: ends > t)
+
+    def overlapping(self, start: float, end: float) -> List[str]:
+        """Edges whose interval intersects [start, end]."""
+        return self._select(end, lambda ends: ends >= start)
+
+    def _select(self, start_max: float, end_ok) -> List[str]:
+        prefix = np.searchsorted(self._starts, start_max, side="right")
+        mask = end_ok(self._ends[:prefix])
+        selected = self._ids[:prefix][mask].tolist()
+        selected.extend(
+            edge_id for edge_id, (s, e) in self._tail.items()
+            if s <= start_max and end_ok(e)
+        )
+        return selected
+
+    def _merge(self):
+        """Fold the tail into the sorted arrays with one O(n) insert."""
+        tail = sorted(self._tail.items(), key=lambda item: item[1][0])
+        starts = np.array([bounds[0] for _, bounds in tail])
+        ends = np.array([bounds[1] for _, bounds in tail])
+        ids = np.empty(len(tail), dtype=object)
+        ids[:] = [edge_id for edge_id, _ in tail]
+        positions = np.searchsorted(self._starts, starts, side="right")
+        self._starts = np.insert(self._starts, positions, starts)
+        self._ends = np.insert(self._ends, positions, ends)
+        self._ids = np.insert(self._ids, positions, ids)
+        self._tail = {}
+
+
+def _epoch_seconds(moment: Optional[datetime]) -> float:
+    """Seconds since 1970-01-01 UTC (naive times are taken as UTC).
+
+    None means open-ended and maps to +inf.
+    """
+    if moment is None:
+        return float("inf")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - datetime(1970, 1, 1)).total_seconds()
 
 
 class TemporalKnowledgeGraph(PropertyGraph):
-    """Property graph with temporal validity for facts."""
+    """Property graph with temporal validity for facts.
+
+    Each relationship type has an IntervalIndex over numeric validity
+    bounds, so point-in-time and range queries avoid a full pattern scan.
+    Relationships created without validity are valid from the epoch on.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.interval_index: Dict[str, IntervalIndex] = {}  # type -> intervals
+        self.validity: Dict[str, Tuple[float, float]] = {}  # edge_id -> bounds
     
     def create_temporal_relationship(
         self, 
@@ -263,131 +2712,364 @@ class TemporalKnowledgeGraph(PropertyGraph):
         properties: Dict = None
     ) -> str:
         """Create relationship with temporal validity."""
-        edge_id = super().create_relationship(
-            source_id, rel_type, target_id, properties
-        )
+        edge = self._new_edge(source_id, rel_type, target_id, properties)
         
         # Add temporal properties
-        self.edges[edge_id]["valid_from"] = valid_from.isoformat()
-        self.edges[edge_id]["valid_until"] = (
-            valid_until.isoformat() if valid_until else None
-        )
+        edge["valid_from"] = valid_from.isoformat()
+        edge["valid_until"] = valid_until.isoformat() if valid_until else None
+        self._commit({"op": "add_edge", "edge": edge})
         
-        return edge_id
+        return edge["id"]
+    
+    def close_relationship(self, edge_id: str, valid_until: datetime):
+        """End an edge's validity (invalidate, don't delete)."""
+        if edge_id not in self.edges:
+            raise ValueError(f"Unknown edge: {edge_id}")
+        self._commit({"op": "close_edge", "id": edge_id,
+                      "valid_until": valid_until.isoformat()})
     
     def query_at_time(self, query: Dict, query_time: datetime) -> List[Dict]:
         """Query graph state at specific time."""
-        results = []
-        
-        # Get base query results
-        base_results = self.query(query)
-        
-        for result in base_results:
-            edge = result["edge"]
-            valid_from = datetime.fromisoformat(edge.get("valid_from", "1970-01-01"))
-            valid_until = edge.get("valid_until")
-            
-            # Check temporal validity
-            if valid_from <= query_time:
-                if valid_until is None or datetime.fromisoformat(valid_until) > query_time:
-                    results.append({
-                        **result,
-                        "valid_from": valid_from,
-                        "valid_until": valid_until
-                    })
-        
-        return results
+        intervals = self.interval_index.get(query.get("type"))
+        if intervals is None:
+            return []
+        return self._temporal_results(
+            intervals.at(_epoch_seconds(query_time)), query
+        )
     
     def query_time_range(self, query: Dict, 
                          start_time: datetime, 
                          end_time: datetime) -> List[Dict]:
         """Query facts valid during time range."""
-        results = []
-        
-        base_results = self.query(query)
-        
-        for result in base_results:
-            edge = result["edge"]
-            valid_from = datetime.fromisoformat(edge.get("valid_from", "1970-01-01"))
-            valid_until = edge.get("valid_until")
-            
-            # Check if overlaps with query range
-            until_dt = datetime.fromisoformat(valid_until) if valid_until else datetime.max
+        intervals = self.interval_index.get(query.get("type"))
+        if intervals is None:
+            return []
+        return self._temporal_results(
+            intervals.overlapping(_epoch_seconds(start_time),
+                                  _epoch_seconds(end_time)),
+            query
+        )
+    
+    def traverse(self, start_ids: Union[str, List[str]], max_hops: int = 2,
+                 edge_types: List[str] = None, direction: str = "both",
+                 max_nodes: int = 100, edge_filter=None,
+                 at_time: Optional[datetime] = None) -> Dict:
+        """k-hop traversal; with `at_time`, only edges valid then are followed."""
+        if at_time is not None:
+            t = _epoch_seconds(at_time)
+            user_filter = edge_filter
             
-            if until_dt >= start_time and valid_from <= end_time:
-                results.append({
-                    **result,
-                    "valid_from": valid_from,
-                    "valid_until": valid_until
-                })
+            def edge_filter(edge):
+                start, end = self.validity[edge["id"]]
+                if not start <= t < end:
+                    return False
+                return user_filter is None or user_filter(edge)
         
+        return super().traverse(start_ids, max_hops, edge_types, direction,
+                                max_nodes, edge_filter)
+    
+    def _apply(self, record: Dict):
+        if record["op"] == "close_edge":
+            edge = self.edges[record["id"]]
+            edge["valid_until"] = record["valid_until"]
+            start, _ = self.validity[edge["id"]]
+            end = _epoch_seconds(datetime.fromisoformat(record["valid_until"]))
+            self.validity[edge["id"]] = (start, end)
+            self._intervals(edge["type"]).set_end(edge["id"], start, end)
+        else:
+            super()._apply(record)
+    
+    def _add_edge(self, edge: Dict):
+        """Store the edge and index its validity (epoch onwards if unset)."""
+        super()._add_edge(edge)
+        start, end = 0.0, float("inf")
+        if edge.get("valid_from"):
+            start = _epoch_seconds(datetime.fromisoformat(edge["valid_from"]))
+        if edge.get("valid_until"):
+            end = _epoch_seconds(datetime.fromisoformat(edge["valid_until"]))
+        self.validity[edge["id"]] = (start, end)
+        self._intervals(edge["type"]).add(edge["id"], start, end)
+    
+    def _intervals(self, rel_type: str) -> IntervalIndex:
+        if rel_type not in self.interval_index:
+            self.interval_index[rel_type] = IntervalIndex()
+        return self.interval_index[rel_type]
+    
+    def _temporal_results(self, edge_ids: List[str],
+                          query: Dict) -> List[Dict]:
+        """Label-match the index hits and attach their validity."""
+        results = []
+        for edge_id in edge_ids:
+            result = self._match_edge(edge_id, query)
+            if result is None:
+                continue
+            edge = result["edge"]
+            results.append({
+                **result,
+                "valid_from": datetime.fromisoformat(
+                    edge.get("valid_from", "1970-01-01")),
+                "valid_until": edge.get("valid_until")
+            })
         return results
 
 
 # Memory System Integration
 
+class MemoryArchive:
+    """Cold storage for facts consolidated out of the hot vector store.
+
+    Records are appended to a JSON-lines file when `path` is set, or kept
+    in memory otherwise. Nothing is deleted: archived facts stay available
+    for audits and temporal questions.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else None
+        self.records: List[Dict] = []
+        self.count = 0
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def archive(self, records: List[Dict]):
+        self.count += len(records)
+        if self.path is None:
+            self.records.extend(records)
+            return
+        with open(self.path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def __iter__(self):
+        if self.path is None:
+            yield from self.records
+        elif self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    yield json.loads(line)
+
+
 class IntegratedMemorySystem:
     """Integrated memory system combining vector store and graph."""
     
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.graph = TemporalKnowledgeGraph()
+    def __init__(self, vector_index: Optional[IVFIndex] = None,
+                 graph_path: Optional[str] = None,
+                 archive_path: Optional[str] = None,
+                 exclusive_relationships: Tuple[str, ...] = (),
+                 duplicate_threshold: float = 0.95,
+                 consolidate_every: int = 0,
+                 keyword_index: bool = False,
+                 partition_sessions: bool = False,
+                 partition_path: Optional[str] = None,
+                 max_resident_sessions: int = 64):
+        self.keyword_index = keyword_index
+        # Partitioning (implied by a partition_path) gives each session its
+        # own VectorStore; cold sessions are evicted to partition_path.
+        if partition_sessions or partition_path:
+            if vector_index is not None:
+                raise ValueError("vector_index cannot be shared by partitions")
+            embedder = CachedEmbeddingProvider(HashEmbeddingProvider(768))
+            self.vector_store = PartitionedVectorStore(
+                partition_path, max_resident=max_resident_sessions,
+                embedder=embedder,
+                factory=lambda: VectorStore(
+                    embedder=embedder,
+                    keyword_index=BM25Index() if keyword_index else None))
+        else:
+            self.vector_store = VectorStore(
+                index=vector_index,
+                keyword_index=BM25Index() if keyword_index else None)
+        # A graph_path makes the graph durable (write-ahead log + snapshots)
+        self.graph = (TemporalKnowledgeGraph.open(graph_path) if graph_path
+                      else TemporalKnowledgeGraph())
         self.session_id: str = ""
+        
+        # Consolidation settings. Exclusive relationship types (e.g.
+        # LIVES_AT) hold one current target per source, so a newer edge
+        # supersedes older open ones. consolidate_every > 0 consolidates
+        # automatically once that many facts arrived since the last run.
+        self.archive = MemoryArchive(archive_path)
+        self.exclusive_relationships = set(exclusive_relationships)
+        self.duplicate_threshold = duplicate_threshold
+        self.consolidate_every = consolidate_every
+        self._pending_facts = 0  # facts stored since the last run
+        # partition (None if unpartitioned) -> first unconsolidated doc id
+        self._consolidated_ids: Dict[Any, int] = {}
+        self._consolidated_edges: Dict[str, int] = {}  # type -> edges seen
     
     def start_session(self, session_id: str):
         """Start a new memory session."""
         self.session_id = session_id
     
+    def flush(self):
+        """Save changed session partitions and checkpoint a durable graph.
+
+        Without a flush, partitions still in memory are lost on restart
+        (only evicted ones have been saved).
+        """
+        store = self.vector_store
+        if isinstance(store, PartitionedVectorStore) and store.path is not None:
+            store.flush()
+        self.graph.checkpoint()
+    
+    def close(self):
+        """Flush, then release the graph's write-ahead log."""
+        self.flush()
+        self.graph.close()
+    
     def store_fact(self, fact: str, entity: str,
                    timestamp: datetime = None,
-                   relationships: List[Dict] = None):
+                   relationships: List[Dict] = None,
+                   session_id: str = None):
         """Store a fact with entity and relationships."""
-        # Store in vector store
-        self.vector_store.add(fact, {
-            "text": fact,
+        self.store_facts([{
+            "fact": fact,
             "entity": entity,
-            "valid_from": (timestamp or datetime.now()).isoformat(),
-            "session_id": self.session_id
-        })
-
-        # Get or create entity node (uses registry for identity)
-        entity_node_id = self.graph.get_or_create_node(entity)
-
-        # Create relationships
-        if relationships:
-            for rel in relationships:
-                target_node_id = self.graph.get_or_create_node(rel["target"])
-                self.graph.create_relationship(
-                    entity_node_id,
+            "timestamp": timestamp,
+            "relationships": relationships
+        }], session_id=session_id)
+    
+    def store_facts(self, facts: List[Dict],
+                    batch_size: int = 1024,
+                    session_id: str = None,
+                    embeddings: Optional[np.ndarray] = None) -> List[int]:
+        """Store many facts in one pass; returns their vector store ids.
+
+        Each item takes the store_fact arguments as keys: "fact", "entity"
+        and optionally "timestamp" and "relationships". Facts are embedded
+        in batches, and each distinct entity is resolved in the registry
+        once rather than once per fact. `session_id` defaults to the
+        current session; `embeddings` may be computed in advance.
+        """
+        if session_id is None:
+            session_id = self.session_id
+        now = datetime.now()
+        indices = self.vector_store.add_many(
+            [item["fact"] for item in facts],
+            [{
+                "text": item["fact"],
+                "entity": item["entity"],
+                "valid_from": (item.get("timestamp") or now).isoformat(),
+                "session_id": session_id
+            } for item in facts],
+            batch_size=batch_size,
+            embeddings=embeddings
+        )
+
+        # Get or create entity nodes (uses registry for identity)
+        names = [item["entity"] for item in facts]
+        for item in facts:
+            names.extend(rel["target"] for rel in item.get("relationships") or [])
+        node_ids = self.graph.get_or_create_nodes(names)
+
+        # Create relationships, valid from the fact's timestamp
+        for item in facts:
+            for rel in item.get("relationships") or []:
+                self.graph.create_temporal_relationship(
+                    node_ids[item["entity"]],
                     rel["type"],
-                    target_node_id,
+                    node_ids[rel["target"]],
+                    valid_from=item.get("timestamp") or now,
                     properties=rel.get("properties", {})
                 )
+        
+        self._pending_facts += len(facts)
+        if (self.consolidate_every
+                and self._pending_facts >= self.consolidate_every):
+            self.consolidate()
+        
+        return indices
     
     def retrieve_memories(self, query: str, 
                           entity_filter: str = None,
                           time_filter: Dict = None,
-                          limit: int = 5) -> List[Dict]:
-        """Retrieve memories matching query."""
-        # Vector search
-        filters = {"session_id": self.session_id}
+                          limit: int = 5,
+                          mode: str = "vector",
+                          rrf_k: int = 60,
+                          session_id: str = None,
+                          timings: Optional[Dict[str, float]] = None
+                          ) -> List[Dict]:
+        """Retrieve memories matching query.
+
+        mode is "vector" (cosine scores), or, for a system built with
+        keyword_index=True, "keyword" (BM25) or "hybrid", which fuses both
+        rankings with reciprocal rank fusion: score = sum 1 / (rrf_k + rank),
+        and may return keyword hits with no vector similarity. Hybrid
+        falls back to vector search without a keyword index.
+
+        Pass a dict as `timings` to receive each component's latency in
+        seconds; it is filled per call, so concurrent retrievals do not
+        overwrite each other's. `session_id` defaults to the current
+        session. time_filter may hold "since", "until" and "as_of"
+        (datetimes or ISO strings).
+        """
+        if mode not in ("vector", "keyword", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        store = self.vector_store
+        if mode == "hybrid" and not self.keyword_index:
+            mode = "vector"
+        if timings is None:
+            timings = {}
+        filters = {"session_id": self.session_id if session_id is None
+                   else session_id}
         if entity_filter:
             filters["entity"] = entity_filter
+        window = {key: value for key, value in (time_filter or {}).items()
+                  if key in ("since", "until", "as_of")}
+        # Fused rankings look deeper than the final limit
+        depth = limit if mode != "hybrid" else max(limit * 4, 20)
         
-        results = self.vector_store.search(query, limit=limit, filters=filters)
+        rankings = {}
+        if mode in ("vector", "hybrid"):
+            started = time.perf_counter()
+            rankings["vector"] = store.search(query, limit=depth,
+                                              filters=filters, **window)
+            timings["vector"] = time.perf_counter() - started
+        if mode in ("keyword", "hybrid"):
+            started = time.perf_counter()
+            rankings["keyword"] = store.keyword_search(
+                query, limit=depth, filters=filters, **window)
+            timings["keyword"] = time.perf_counter() - started
+        
+        if mode == "hybrid":
+            started = time.perf_counter()
+            fused: Dict[int, Dict] = {}
+            for name, ranking in rankings.items():
+                for rank, result in enumerate(ranking, start=1):
+                    entry = fused.setdefault(result["id"], {
+                        **result, "score": 0.0, "ranks": {}})
+                    entry["score"] += 1.0 / (rrf_k + rank)
+                    entry["ranks"][name] = rank
+            results = sorted(fused.values(), key=lambda r: -r["score"])[:limit]
+            timings["fusion"] = time.perf_counter() - started
+        else:
+            results = rankings[mode]
         
         # Enrich with graph relationships
+        started = time.perf_counter()
         for result in results:
             entity = result["metadata"].get("entity")
             if entity:
                 node_id = self.graph.entity_registry.get(entity)
                 if node_id:
                     result["relationships"] = self.graph.get_relationships(node_id)
+        timings["graph"] = time.perf_counter() - started
         
         return results
     
-    def retrieve_entity_context(self, entity: str) -> Dict:
-        """Retrieve complete context for an entity."""
+    def retrieve_entity_context(self, entity: str, max_hops: int = 1,
+                                edge_types: List[str] = None,
+                                at_time: datetime = None,
+                                max_nodes: int = 50,
+                                session_id: str = None,
+                                all_sessions: bool = False) -> Dict:
+        """Retrieve complete context for an entity.
+
+        "subgraph" holds the entity's `max_hops` neighbourhood (see
+        TemporalKnowledgeGraph.traverse), capped at `max_nodes` nodes.
+        With session partitions, "memories" come from the partition of
+        `session_id` (default: the current session); all_sessions=True
+        searches every partition, loading saved ones from disk.
+        """
         node_id = self.graph.entity_registry.get(entity)
 
         # Get entity node
@@ -396,19 +3078,324 @@ class IntegratedMemorySystem:
         # Get relationships
         relationships = self.graph.get_relationships(node_id) if node_id else []
 
+        # Get k-hop neighbourhood
+        subgraph = self.graph.traverse(
+            node_id, max_hops=max_hops, edge_types=edge_types,
+            max_nodes=max_nodes, at_time=at_time
+        ) if node_id else {"nodes": {}, "edges": {}, "depth": {}}
+
         # Get vector memories
-        memories = self.vector_store.search_by_entity(entity, limit=10)
+        store = self.vector_store
+        if isinstance(store, PartitionedVectorStore):
+            keys = store.keys() if all_sessions else [
+                self.session_id if session_id is None else session_id]
+            memories = store.search_by_entity(entity, limit=10, keys=keys)
+        else:
+            memories = store.search_by_entity(entity, limit=10)
 
         return {
             "entity": entity_node,
             "relationships": relationships,
+            "subgraph": subgraph,
             "memories": memories
         }
     
-    def consolidate(self):
-        """Consolidate memories and remove outdated information."""
-        # In production, implement actual consolidation logic
-        # - Merge related facts
-        # - Update validity periods
-        # - Archive obsolete facts
-        pass
+    def consolidate(self, max_rows: int = None,
+                    block_size: int = 4096) -> Dict[str, int]:
+        """Consolidate memories added since the last run.
+
+        1. Near-duplicate facts (same session and entity, cosine
+           similarity at or above duplicate_threshold) are merged: the
+           newest copy stays and counts the facts it absorbed in
+           "merged_count", older copies are archived. Similarities come
+           from blocked matrix products of the new rows against the rows
+           of the same session and entity.
+        2. Open edges of exclusive relationship types are closed
+           (valid_until set) when a newer edge from the same source
+           supersedes them. Invalidate, don't discard.
+        3. Archived rows are compacted out of the vector store.
+
+        Only rows and edges added since the previous call are examined
+        (at most `max_rows` rows per call and partition). Row indices
+        returned by earlier searches are invalidated by compaction;
+        document ids are not. With session partitions, only the resident
+        partitions are consolidated.
+        """
+        self._pending_facts = 0
+        if isinstance(self.vector_store, PartitionedVectorStore):
+            partitions = self.vector_store
+            stores = [(key, partitions.partition(key))
+                      for key in partitions.resident_keys()]
+        else:
+            partitions = None
+            stores = [(None, self.vector_store)]
+        merged = 0
+        for key, store in stores:
+            count = self._merge_duplicates(store, key, max_rows, block_size)
+            if count and partitions is not None:
+                partitions.mark_dirty(key)
+            merged += count
+        
+        # Close superseded edges of exclusive relationship types
+        closed = 0
+        for rel_type in self.exclusive_relationships:
+            edge_ids = self.graph.edge_index.get(rel_type, [])
+            for edge_id in edge_ids[self._consolidated_edges.get(rel_type, 0):]:
+                closed += self._close_superseded(edge_id)
+            self._consolidated_edges[rel_type] = len(edge_ids)
+        
+        return {
+            "merged": merged,
+            "archived": merged,
+            "closed_edges": closed,
+            "remaining": len(self.vector_store)
+        }
+    
+    def _merge_duplicates(self, store: VectorStore, key: Any,
+                          max_rows: Optional[int], block_size: int) -> int:
+        """Consolidation steps 1 and 3 for one store; returns rows merged."""
+        first = int(np.searchsorted(store.doc_ids[:store._count],
+                                    self._consolidated_ids.get(key, 0)))
+        end = store._count if max_rows is None else min(
+            store._count, first + max_rows)
+        
+        # Group new live rows by session and entity; facts are never
+        # merged across sessions
+        groups: Dict[Tuple[Any, Any], List[int]] = {}
+        for row in range(first, end):
+            if store._deleted[row]:
+                continue
+            metadata = store.metadata[row]
+            entity = metadata.get("entity")
+            if entity is not None:
+                groups.setdefault((metadata.get("session_id"), entity),
+                                  []).append(row)
+        
+        # 1. Near-duplicate detection, newest copy wins
+        superseded_by: Dict[int, int] = {}
+        for (session_id, entity), new_rows in groups.items():
+            new_rows = np.asarray(new_rows, dtype=np.int64)
+            new_vectors = store._row_vectors(new_rows)
+            members = store._posting_array("entity", entity)
+            if session_id is not None and "session_id" in store.postings:
+                members = np.intersect1d(
+                    members, store._posting_array("session_id", session_id),
+                    assume_unique=True)
+            else:
+                members = np.array(
+                    [row for row in members.tolist()
+                     if store.metadata[row].get("session_id") == session_id],
+                    dtype=np.int64)
+            members = members[~store._deleted[members]]
+            pairs = []
+            for start in range(0, len(members), block_size):
+                block = members[start:start + block_size]
+                sims = new_vectors @ store._row_vectors(block).T
+                i, j = np.nonzero(sims >= self.duplicate_threshold)
+                older = block[j] < new_rows[i]
+                pairs.extend(zip(new_rows[i][older].tolist(),
+                                 block[j][older].tolist()))
+            for newer, older in sorted(pairs):
+                if older in superseded_by or newer in superseded_by:
+                    continue
+                superseded_by[older] = newer
+                kept = store.metadata[newer]
+                kept["merged_count"] = (kept.get("merged_count", 1)
+                                        + store.metadata[older].get("merged_count", 1))
+        
+        archived_at = datetime.now().isoformat()
+        self.archive.archive([{
+            **store.metadata[older],
+            "archived_at": archived_at,
+            "reason": "near_duplicate",
+            "superseded_by": store.metadata[newer].get("text", "")
+        } for older, newer in superseded_by.items()])
+        
+        # 3. Compact the vector store, dropping tombstones as well
+        if end > first:
+            self._consolidated_ids[key] = int(store.doc_ids[end - 1]) + 1
+        if superseded_by:
+            store.compact(superseded_by)
+        return len(superseded_by)
+    
+    def _close_superseded(self, edge_id: str) -> int:
+        """Close open edges of the same type from the same source that
+        this edge supersedes, or this edge if a later one supersedes it
+        (facts can arrive out of order)."""
+        graph = self.graph
+        edge = graph.edges[edge_id]
+        start, _ = graph.validity[edge_id]
+        closed = 0
+        next_start, next_id = float("inf"), None
+        for other_id in graph.outgoing.get(edge["source"], []):
+            other = graph.edges[other_id]
+            if (other_id == edge_id or other["type"] != edge["type"]
+                    or other["target"] == edge["target"]):
+                continue
+            other_start, other_end = graph.validity[other_id]
+            if other_start > start:
+                if other_start < next_start:
+                    next_start, next_id = other_start, other_id
+            elif other_end == float("inf"):
+                graph.close_relationship(other_id, self._valid_from(edge))
+                closed += 1
+        if next_id is not None and graph.validity[edge_id][1] == float("inf"):
+            graph.close_relationship(edge_id,
+                                     self._valid_from(graph.edges[next_id]))
+            closed += 1
+        return closed
+    
+    @staticmethod
+    def _valid_from(edge: Dict) -> datetime:
+        return (datetime.fromisoformat(edge["valid_from"])
+                if edge.get("valid_from") else datetime(1970, 1, 1))
+
+
+# Concurrent Access
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer.
+
+    Writer-preferring: once a writer waits, new readers queue behind it,
+    so a steady stream of searches cannot starve appends.
+    """
+    
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+    
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class ConcurrentMemorySystem:
+    """Thread-safe front end to an IntegratedMemorySystem.
+
+    Every call names its session instead of relying on the shared
+    session_id. Retrievals hold a shared read lock and run in parallel;
+    writes hold the exclusive write lock, but embed their facts before
+    taking it, so readers are only blocked while rows are appended.
+    """
+    
+    def __init__(self, system: Optional[IntegratedMemorySystem] = None,
+                 **options):
+        self.system = system or IntegratedMemorySystem(**options)
+        self.lock = ReadWriteLock()
+    
+    def store_fact(self, session_id: str, fact: str, entity: str,
+                   timestamp: datetime = None,
+                   relationships: List[Dict] = None) -> int:
+        """Store a fact in `session_id`; returns its vector store id."""
+        return self.store_facts(session_id, [{
+            "fact": fact,
+            "entity": entity,
+            "timestamp": timestamp,
+            "relationships": relationships
+        }])[0]
+    
+    def store_facts(self, session_id: str, facts: List[Dict],
+                    batch_size: int = 1024) -> List[int]:
+        """Store many facts in `session_id` (see store_facts)."""
+        embeddings = self.system.vector_store.embedder.embed(
+            [item["fact"] for item in facts])
+        with self.lock.write():
+            return self.system.store_facts(facts, batch_size,
+                                           session_id=session_id,
+                                           embeddings=embeddings)
+    
+    def retrieve_memories(self, session_id: str, query: str,
+                          **options) -> List[Dict]:
+        """Retrieve memories of `session_id` matching query."""
+        with self.lock.read():
+            return self.system.retrieve_memories(query, session_id=session_id,
+                                                 **options)
+    
+    def retrieve_entity_context(self, entity: str, **options) -> Dict:
+        with self.lock.read():
+            return self.system.retrieve_entity_context(entity, **options)
+    
+    def consolidate(self, **options) -> Dict[str, int]:
+        with self.lock.write():
+            return self.system.consolidate(**options)
+    
+    def flush(self):
+        with self.lock.write():
+            self.system.flush()
+    
+    def close(self):
+        with self.lock.write():
+            self.system.close()
+
+
+class AsyncMemorySystem:
+    """asyncio facade: runs ConcurrentMemorySystem calls on an executor.
+
+    Calls never block the event loop; concurrent tasks get the same
+    reader/writer semantics as threads.
+    """
+    
+    def __init__(self, system: Optional[ConcurrentMemorySystem] = None,
+                 executor=None, **options):
+        self.system = system or ConcurrentMemorySystem(**options)
+        self.executor = executor  # None: the loop's default thread pool
+    
+    async def store_fact(self, session_id: str, fact: str, entity: str,
+                         **options) -> int:
+        return await self._run(self.system.store_fact, session_id, fact,
+                               entity, **options)
+    
+    async def store_facts(self, session_id: str, facts: List[Dict],
+                          **options) -> List[int]:
+        return await self._run(self.system.store_facts, session_id, facts,
+                               **options)
+    
+    async def retrieve_memories(self, session_id: str, query: str,
+                                **options) -> List[Dict]:
+        return await self._run(self.system.retrieve_memories, session_id,
+                               query, **options)
+    
+    async def retrieve_entity_context(self, entity: str, **options) -> Dict:
+        return await self._run(self.system.retrieve_entity_context, entity,
+                               **options)
+    
+    async def consolidate(self, **options) -> Dict[str, int]:
+        return await self._run(self.system.consolidate, **options)
+    
+    async def flush(self):
+        await self._run(self.system.flush)
+    
+    async def close(self):
+        await self._run(self.system.close)
+    
+    async def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
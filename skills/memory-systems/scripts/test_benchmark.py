@@ -0,0 +1,47 @@
+"""
+Tests for the memory store benchmarks.
+
+Run from this directory: python -m pytest -q test_benchmark.py
+"""
+
+import copy
+
+from benchmark import RSS_SLACK_MB, bench_scale, compare
+
+
+def small_run():
+    return bench_scale([200], dimension=16, queries=5, lookups=5)
+
+
+class TestCompare:
+    def test_identical_runs_do_not_regress(self):
+        run = small_run()
+        assert compare(run, run, tolerance=0.25) == []
+
+    def test_flags_slower_latency_lower_throughput_and_rss_growth(self):
+        baseline = small_run()
+        result = copy.deepcopy(baseline)
+        entry = result["results"][0]
+        entry["vector_store"]["search"]["p99_ms"] *= 2
+        entry["vector_store"]["ingest_docs_per_s"] /= 2
+        entry["graph"]["build_edges_per_s"] /= 2
+        entry["vector_store"]["search_many_queries_per_s"] *= 2  # faster
+        entry["graph"]["rss_delta_mb"] += 10 * RSS_SLACK_MB
+        regressions = [line.split(":")[0]
+                       for line in compare(result, baseline, tolerance=0.25)]
+        assert sorted(regressions) == [
+            "200.graph.build_edges_per_s", "200.graph.rss_delta_mb",
+            "200.vector_store.ingest_docs_per_s",
+            "200.vector_store.search.p99_ms"]
+
+    def test_small_rss_growth_is_noise(self):
+        baseline = small_run()
+        result = copy.deepcopy(baseline)
+        result["results"][0]["graph"]["rss_delta_mb"] += RSS_SLACK_MB / 2
+        assert compare(result, baseline, tolerance=0.25) == []
+
+    def test_reports_rss_per_section(self):
+        entry = small_run()["results"][0]
+        for section in ("vector_store", "graph"):
+            assert "rss_delta_mb" in entry[section]
+            assert "peak_rss_mb" not in entry[section]
@@ -0,0 +1,1049 @@
+"""
+Tests for the memory store.
+
+Run from this directory: python -m pytest -q test_memory_store.py
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from memory_store import (AsyncMemorySystem, BM25Index,
+                          CachedEmbeddingProvider, CompactGraph,
+                          ConcurrentMemorySystem, EmbeddingProvider,
+                          HashEmbeddingProvider, IntegratedMemorySystem,
+                          IntervalIndex, IVFIndex, PartitionedVectorStore,
+                          ProductQuantizer, PropertyGraph, ReadWriteLock,
+                          ScalarQuantizer, ShardedSearcher,
+                          TemporalKnowledgeGraph, VectorStore)
+
+DIMENSION = 32
+EPOCH = datetime(2024, 1, 1)
+
+
+def make_store(n=200, **options):
+    """A store of `n` facts over 10 entities and 3 sessions."""
+    store = VectorStore(DIMENSION, embedder=HashEmbeddingProvider(DIMENSION),
+                        **options)
+    store.add_many(*facts(n))
+    return store
+
+
+def facts(n, start=0):
+    texts = [f"fact {i} about entity-{i % 10}" for i in range(start, start + n)]
+    metadatas = [{"text": text, "entity": f"entity-{i % 10}",
+                  "session_id": f"s{i % 3}",
+                  "valid_from": (EPOCH + timedelta(days=3 * i)).isoformat()}
+                 for i, text in zip(range(start, start + n), texts)]
+    return texts, metadatas
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def exact_ids(store, query, limit, rows=None):
+    """Brute-force top ids: cosine against every live (or given) row."""
+    query_embedding = store._normalize(store._embed(query))
+    candidates = (np.arange(store._count) if rows is None
+                  else np.asarray(rows, dtype=np.int64))
+    candidates = candidates[~store._deleted[candidates]]
+    scores = store.vectors[candidates] @ query_embedding
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [int(store.doc_ids[row]) for row in candidates[order]
+            if scores[np.searchsorted(candidates, row)] > 0]
+
+
+class TestVectorSearch:
+    def test_stored_text_ranks_first(self):
+        store = make_store()
+        results = store.search("fact 42 about entity-2", limit=3)
+        assert results[0]["text"] == "fact 42 about entity-2"
+        assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+    def test_matches_brute_force(self):
+        store = make_store()
+        for query in ("fact 7 about entity-7", "unrelated words"):
+            assert ids(store.search(query, limit=10)) == exact_ids(
+                store, query, 10)
+
+    def test_matrix_grows_past_initial_capacity(self):
+        store = VectorStore(DIMENSION, initial_capacity=2,
+                            embedder=HashEmbeddingProvider(DIMENSION))
+        store.add_many(*facts(50))
+        assert len(store) == 50
+        assert store.vectors.shape == (50, DIMENSION)
+        assert np.allclose(np.linalg.norm(store.vectors, axis=1), 1, atol=1e-5)
+
+
+class TestIVFIndex:
+    def test_probing_every_cell_is_exact(self):
+        store = make_store(400, index=IVFIndex(n_lists=8, nprobe=8,
+                                               min_train_size=100))
+        assert store.index.is_trained
+        queries = [f"fact {i} about entity-{i % 10}" for i in range(0, 400, 40)]
+        assert store.recall_at_k(queries, k=10) == 1.0
+
+    def test_untrained_index_searches_exactly(self):
+        store = make_store(50, index=IVFIndex(n_lists=8, min_train_size=1000))
+        assert not store.index.is_trained
+        assert ids(store.search("fact 3 about entity-3", limit=10)) == \
+            exact_ids(store, "fact 3 about entity-3", 10)
+
+    def test_probes_only_nearest_cells(self):
+        store = make_store(400, index=IVFIndex(n_lists=8, nprobe=1,
+                                               min_train_size=100))
+        query = "fact 5 about entity-5"
+        results = store.search(query, limit=5)
+        candidates = set(store.index.candidates(
+            store._normalize(store._embed(query))).tolist())
+        assert {result["index"] for result in results} <= candidates
+        assert results[0]["text"] == query
+        assert ids(store.search(query, limit=5, exact=True)) == exact_ids(
+            store, query, 5)
+
+
+class TestMetadataFilters:
+    def test_filters_match_brute_force(self):
+        store = make_store()
+        for filters in ({"entity": "entity-3"},
+                        {"entity": "entity-3", "session_id": "s1"},
+                        {"entity": ["entity-1", "entity-2"]},
+                        {"text": "fact 12 about entity-2"}):
+            rows = [row for row in range(len(store))
+                    if store._matches_filters(store.metadata[row], filters)]
+            assert ids(store.search("fact about entity", limit=5,
+                                    filters=filters)) == exact_ids(
+                store, "fact about entity", 5, rows)
+
+    def test_no_match_returns_nothing(self):
+        store = make_store()
+        assert store.search("fact", filters={"entity": "nobody"}) == []
+        assert store.search("fact", filters={"entity": "entity-1",
+                                             "session_id": "none"}) == []
+
+
+def _plain():
+    return {}
+
+
+def _ivf():
+    return {"index": IVFIndex(n_lists=4, nprobe=4, min_train_size=100)}
+
+
+def _int8():
+    return {"quantizer": ScalarQuantizer(DIMENSION)}
+
+
+def _pq():
+    return {"quantizer": ProductQuantizer(DIMENSION, n_subvectors=4,
+                                          n_centroids=16, min_train_size=100),
+            "rerank": 4}
+
+
+def _bm25():
+    return {"keyword_index": BM25Index()}
+
+
+class TestPersistence:
+    @pytest.mark.parametrize("options", [_plain, _ivf, _int8, _pq, _bm25])
+    def test_mapped_store_saved_back_to_its_path(self, tmp_path, options):
+        path = str(tmp_path / "store")
+        store = make_store(**options())
+        store.delete(int(store.doc_ids[5]))
+        store.save(path)
+        loaded = VectorStore.load(path, mmap=True, embedder=store.embedder)
+
+        texts, metadatas = facts(20, start=200)
+        store.add_many(texts, metadatas)
+        loaded.add_many(texts, metadatas)
+        loaded.save(path)  # while its own vectors are still mapped from path
+        reloaded = VectorStore.load(path, mmap=True, embedder=store.embedder)
+
+        assert len(reloaded) == len(store) == 219
+        assert reloaded.doc_ids[:220].tolist() == store.doc_ids[:220].tolist()
+        assert reloaded.metadata[210] == store.metadata[210]
+        for query in ("fact 5 about entity-5", "fact 210 about entity-0",
+                      "entity-3"):
+            assert ids(reloaded.search(query, limit=10)) == ids(
+                store.search(query, limit=10))
+            assert ids(reloaded.search(query, limit=10,
+                                       filters={"entity": "entity-3"})) == ids(
+                store.search(query, limit=10, filters={"entity": "entity-3"}))
+            if store.keyword_index is not None:
+                assert ids(reloaded.keyword_search(query, limit=10)) == ids(
+                    store.keyword_search(query, limit=10))
+        if store.index is not None:
+            assert reloaded.index.cell_assignments(220).tolist() == \
+                store.index.cell_assignments(220).tolist()
+        if store.quantizer is not None:
+            assert np.array_equal(reloaded.quantizer.codes[:220],
+                                  store.quantizer.codes[:220])
+
+    def test_load_without_mmap(self, tmp_path):
+        store = make_store()
+        store.save(str(tmp_path / "store"))
+        loaded = VectorStore.load(str(tmp_path / "store"), mmap=False,
+                                  embedder=store.embedder)
+        assert isinstance(loaded.metadata, list)
+        assert ids(loaded.search("fact 1", limit=5)) == ids(
+            store.search("fact 1", limit=5))
+
+
+class TestQuantizers:
+    def test_int8_scores_approximate_exact(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((100, DIMENSION)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        quantizer = ScalarQuantizer(DIMENSION)
+        quantizer.add(vectors)
+        query = vectors[0]
+        assert np.allclose(quantizer.scores(query), vectors @ query, atol=0.02)
+        assert quantizer.nbytes == 100 * (DIMENSION + 4)
+
+    def test_pq_trains_once_enough_vectors_arrive(self):
+        quantizer = ProductQuantizer(DIMENSION, n_subvectors=4, n_centroids=16,
+                                     min_train_size=100)
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((150, DIMENSION)).astype(np.float32)
+        quantizer.add(vectors[:50])
+        assert not quantizer.is_trained
+        assert np.allclose(quantizer.scores(vectors[0]), vectors[:50] @ vectors[0])
+        quantizer.add(vectors[50:])
+        assert quantizer.is_trained
+        assert quantizer.codes.shape == (150, 4)
+        assert quantizer.nbytes < vectors.nbytes
+
+    @pytest.mark.parametrize("options", [_int8, _pq])
+    def test_quantized_store_finds_stored_text(self, options):
+        store = make_store(300, **options())
+        results = store.search("fact 123 about entity-3", limit=5)
+        assert results[0]["text"] == "fact 123 about entity-3"
+
+    def test_pq_without_rerank_drops_float_vectors(self):
+        quantizer = ProductQuantizer(DIMENSION, n_subvectors=4, n_centroids=16,
+                                     min_train_size=100)
+        store = make_store(300, quantizer=quantizer)
+        assert store._matrix.size == 0
+        assert store.vectors.shape == (300, DIMENSION)
+
+    def test_dimension_mismatch(self):
+        with pytest.raises(ValueError):
+            VectorStore(DIMENSION, quantizer=ScalarQuantizer(DIMENSION * 2))
+
+
+class CountingProvider(EmbeddingProvider):
+    def __init__(self):
+        self.inner = HashEmbeddingProvider(DIMENSION)
+        self.dimension = DIMENSION
+        self.name = self.inner.name
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return self.inner.embed(texts)
+
+
+class TestEmbeddingCache:
+    def test_memory_tier_skips_provider(self):
+        provider = CountingProvider()
+        cache = CachedEmbeddingProvider(provider)
+        first = cache.embed(["a", "b", "a"])
+        second = cache.embed(["b", "c"])
+        assert provider.calls == [["a", "b"], ["c"]]
+        assert np.array_equal(first[1], second[0])
+        assert np.array_equal(first[0], first[2])
+        assert cache.stats == {"memory_hits": 1, "disk_hits": 0, "misses": 3}
+
+    def test_memory_tier_is_bounded(self):
+        provider = CountingProvider()
+        cache = CachedEmbeddingProvider(provider, max_bytes=2 * DIMENSION * 4)
+        cache.embed(["a", "b", "c"])
+        assert len(cache._memory) == 2
+        cache.embed(["a"])
+        assert provider.calls[-1] == ["a"]
+
+    def test_disk_tier_shared_across_instances(self, tmp_path):
+        provider = CountingProvider()
+        vectors = CachedEmbeddingProvider(
+            provider, disk_path=str(tmp_path)).embed(["a", "b"])
+        cache = CachedEmbeddingProvider(provider, disk_path=str(tmp_path))
+        assert np.array_equal(cache.embed(["b", "a"]), vectors[::-1])
+        assert len(provider.calls) == 1
+        assert cache.stats["disk_hits"] == 2
+        assert not list(tmp_path.rglob("*.tmp"))
+
+    def test_concurrent_callers_get_provider_vectors(self, tmp_path):
+        provider = CountingProvider()
+        cache = CachedEmbeddingProvider(provider, max_bytes=8 * DIMENSION * 4,
+                                        disk_path=str(tmp_path))
+        texts = [f"text {i}" for i in range(40)]
+        expected = provider.inner.embed(texts)
+        errors = []
+
+        def worker(seed):
+            order = np.random.default_rng(seed).permutation(len(texts))
+            for i in order.tolist():
+                if not np.array_equal(cache.embed([texts[i]])[0], expected[i]):
+                    errors.append(i)
+
+        threads = [threading.Thread(target=worker, args=(s,)) for s in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert not list(tmp_path.rglob("*.tmp"))
+
+    def test_store_embeds_through_cache(self):
+        store = VectorStore(DIMENSION)
+        store.add("same text")
+        store.search("same text")
+        assert store.embedder.stats["memory_hits"] == 1
+
+
+class TestBulkIngestion:
+    def test_add_many_matches_repeated_add(self):
+        texts, metadatas = facts(100)
+        one_by_one = VectorStore(DIMENSION,
+                                 embedder=HashEmbeddingProvider(DIMENSION))
+        for text, metadata in zip(texts, metadatas):
+            one_by_one.add(text, metadata)
+        bulk = make_store(100)
+        assert np.array_equal(one_by_one.vectors, bulk.vectors)
+        assert one_by_one.postings == bulk.postings
+        assert ids(one_by_one.search("fact 9", limit=10)) == ids(
+            bulk.search("fact 9", limit=10))
+
+    def test_small_batches_and_precomputed_embeddings(self):
+        texts, metadatas = facts(100)
+        embeddings = HashEmbeddingProvider(DIMENSION).embed(texts)
+        store = VectorStore(DIMENSION, embedder=HashEmbeddingProvider(DIMENSION))
+        assert store.add_many(texts, metadatas, batch_size=7,
+                              embeddings=embeddings) == list(range(100))
+        assert np.array_equal(store.vectors, make_store(100).vectors)
+
+    def test_length_mismatch(self):
+        with pytest.raises(ValueError):
+            VectorStore(DIMENSION).add_many(["a", "b"], [{}])
+
+    def test_store_facts_resolves_each_entity_once(self):
+        memory = IntegratedMemorySystem()
+        memory.store_facts([
+            {"fact": "Alice works on Atlas", "entity": "Alice",
+             "relationships": [{"type": "WORKS_ON", "target": "Atlas"}]},
+            {"fact": "Alice knows Bob", "entity": "Alice",
+             "relationships": [{"type": "KNOWS", "target": "Bob"}]},
+        ], session_id="s")
+        assert sorted(memory.graph.entity_registry) == ["Alice", "Atlas", "Bob"]
+        assert len(memory.graph.edges) == 2
+        assert len(memory.vector_store.search_by_entity("Alice")) == 2
+
+
+def random_graph(n_nodes=50, n_edges=300, seed=0, graph=None):
+    rng = np.random.default_rng(seed)
+    graph = graph if graph is not None else PropertyGraph()
+    nodes = [graph.get_or_create_node(f"node-{i}") for i in range(n_nodes)]
+    for source, target, kind in zip(rng.integers(0, n_nodes, n_edges).tolist(),
+                                    rng.integers(0, n_nodes, n_edges).tolist(),
+                                    rng.integers(0, 3, n_edges).tolist()):
+        graph.create_relationship(nodes[source], f"TYPE_{kind}", nodes[target])
+    return graph, nodes
+
+
+class TestAdjacencyIndex:
+    def test_get_relationships_matches_edge_scan(self):
+        graph, nodes = random_graph()
+        for node_id in nodes[:10]:
+            relationships = graph.get_relationships(node_id)
+            outgoing = [r["edge"]["id"] for r in relationships
+                        if r["direction"] == "outgoing"]
+            incoming = [r["edge"]["id"] for r in relationships
+                        if r["direction"] == "incoming"]
+            assert outgoing == [e["id"] for e in graph.edges.values()
+                                if e["source"] == node_id]
+            assert incoming == [e["id"] for e in graph.edges.values()
+                                if e["target"] == node_id]
+            assert len(graph.get_relationships(node_id, "outgoing")) == \
+                len(outgoing)
+
+    def test_unknown_endpoint(self):
+        graph = PropertyGraph()
+        node = graph.get_or_create_node("a")
+        with pytest.raises(ValueError):
+            graph.create_relationship(node, "KNOWS", "missing")
+
+
+class TestIntervalIndex:
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        index = IntervalIndex(merge_threshold=16)
+        intervals = {}
+        for i in range(500):
+            start = float(rng.integers(0, 1000))
+            end = start + float(rng.integers(1, 200)) if i % 5 else float("inf")
+            index.add(f"e{i}", start, end)
+            intervals[f"e{i}"] = (start, end)
+        for i in range(0, 500, 7):  # close some, in the arrays and the tail
+            start = intervals[f"e{i}"][0]
+            index.set_end(f"e{i}", start, start + 5)
+            intervals[f"e{i}"] = (start, start + 5)
+        assert len(index) == 500
+        for t in rng.integers(-10, 1300, 50).tolist():
+            assert sorted(index.at(t)) == sorted(
+                e for e, (s, end) in intervals.items() if s <= t < end)
+            lo, hi = t, t + 30
+            assert sorted(index.overlapping(lo, hi)) == sorted(
+                e for e, (s, end) in intervals.items() if s <= hi and end >= lo)
+
+    def test_set_end_of_unknown_edge(self):
+        index = IntervalIndex(merge_threshold=1)
+        index.add("a", 0.0, 10.0)
+        with pytest.raises(KeyError):
+            index.set_end("b", 0.0, 5.0)
+
+    def test_temporal_queries(self):
+        graph = TemporalKnowledgeGraph()
+        alice, paris, rome = (graph.get_or_create_node(name)
+                              for name in ("Alice", "Paris", "Rome"))
+        graph.create_temporal_relationship(alice, "LIVES_IN", paris,
+                                           datetime(2020, 1, 1),
+                                           datetime(2022, 1, 1))
+        graph.create_temporal_relationship(alice, "LIVES_IN", rome,
+                                           datetime(2022, 1, 1))
+        at = graph.query_at_time({"type": "LIVES_IN"}, datetime(2021, 6, 1))
+        assert [r["target"]["properties"]["name"] for r in at] == ["Paris"]
+        span = graph.query_time_range({"type": "LIVES_IN"},
+                                      datetime(2021, 1, 1), datetime(2023, 1, 1))
+        assert len(span) == 2
+        assert graph.query_at_time({"type": "KNOWS"}, datetime(2021, 1, 1)) == []
+
+
+class TestTraversal:
+    def setup_method(self):
+        # a -> b -> c -> d, plus a -KNOWS-> e
+        self.graph = TemporalKnowledgeGraph()
+        self.ids = {name: self.graph.get_or_create_node(name) for name in "abcde"}
+        for source, target in ("ab", "bc", "cd"):
+            self.graph.create_temporal_relationship(
+                self.ids[source], "NEXT", self.ids[target], datetime(2020, 1, 1),
+                datetime(2021, 1, 1) if source == "c" else None)
+        self.graph.create_relationship(self.ids["a"], "KNOWS", self.ids["e"])
+
+    def names(self, result):
+        return {self.graph.nodes[node_id]["properties"]["name"]: depth
+                for node_id, depth in result["depth"].items()}
+
+    def test_hops_and_depth(self):
+        result = self.graph.traverse(self.ids["a"], max_hops=2)
+        assert self.names(result) == {"a": 0, "b": 1, "e": 1, "c": 2}
+        assert len(result["edges"]) == 3
+
+    def test_edge_types_direction_and_cap(self):
+        assert self.names(self.graph.traverse(
+            self.ids["a"], max_hops=5, edge_types=["NEXT"])) == {
+            "a": 0, "b": 1, "c": 2, "d": 3}
+        assert self.names(self.graph.traverse(
+            self.ids["c"], max_hops=5, direction="incoming")) == {
+            "c": 0, "b": 1, "a": 2}
+        assert len(self.graph.traverse(self.ids["a"], max_hops=5,
+                                       max_nodes=3)["nodes"]) == 3
+
+    def test_at_time_follows_only_valid_edges(self):
+        result = self.graph.traverse(self.ids["a"], max_hops=5,
+                                     edge_types=["NEXT"],
+                                     at_time=datetime(2022, 1, 1))
+        assert self.names(result) == {"a": 0, "b": 1, "c": 2}
+
+    def test_entity_context_includes_subgraph(self):
+        memory = IntegratedMemorySystem()
+        memory.store_fact("Alice works on Atlas", "Alice", relationships=[
+            {"type": "WORKS_ON", "target": "Atlas"}])
+        memory.store_fact("Atlas uses Postgres", "Atlas", relationships=[
+            {"type": "USES", "target": "Postgres"}])
+        context = memory.retrieve_entity_context("Alice", max_hops=2)
+        names = {node["properties"]["name"]
+                 for node in context["subgraph"]["nodes"].values()}
+        assert names == {"Alice", "Atlas", "Postgres"}
+        assert context["memories"][0]["metadata"]["text"] == "Alice works on Atlas"
+
+
+class TestGraphJournal:
+    def build(self, path, **options):
+        graph = TemporalKnowledgeGraph.open(path, **options)
+        alice = graph.get_or_create_node("Alice", properties={"role": "eng"})
+        paris = graph.get_or_create_node("Paris")
+        edge = graph.create_temporal_relationship(
+            alice, "LIVES_IN", paris, datetime(2020, 1, 1),
+            properties={"source": ("chat", 1)})
+        return graph, edge
+
+    def state(self, graph):
+        return (graph.nodes, graph.edges, graph.entity_registry,
+                graph.outgoing, graph.incoming, graph.validity)
+
+    def test_reopen_replays_log(self, tmp_path):
+        graph, edge = self.build(str(tmp_path))
+        graph.close_relationship(edge, datetime(2021, 1, 1))
+        graph.close()
+        reopened = TemporalKnowledgeGraph.open(str(tmp_path))
+        assert self.state(reopened) == self.state(graph)
+        assert reopened.query_at_time({"type": "LIVES_IN"},
+                                      datetime(2022, 1, 1)) == []
+
+    def test_same_state_with_or_without_checkpoint(self, tmp_path):
+        graph, _ = self.build(str(tmp_path / "log"))
+        graph.close()
+        checkpointed, _ = self.build(str(tmp_path / "snapshot"),
+                                     checkpoint_every=2)
+        checkpointed.close()
+        replayed = TemporalKnowledgeGraph.open(str(tmp_path / "log"))
+        restored = TemporalKnowledgeGraph.open(str(tmp_path / "snapshot"))
+        edge = next(iter(replayed.edges.values()))
+        assert edge["properties"]["source"] == ["chat", 1]
+        assert graph.edges[edge["id"]]["properties"]["source"] == ["chat", 1]
+        assert [e["properties"] for e in restored.edges.values()] == \
+            [edge["properties"]]
+        assert restored.entity_registry.keys() == replayed.entity_registry.keys()
+
+    def test_torn_tail_is_ignored_and_truncated(self, tmp_path):
+        graph, _ = self.build(str(tmp_path))
+        graph.close()
+        wal = tmp_path / "wal.jsonl"
+        intact = wal.read_bytes()
+        with open(wal, "ab") as f:
+            f.write(b'{"op": "add_node", "node": {"id": "x"')
+        recovered = TemporalKnowledgeGraph.open(str(tmp_path))
+        assert len(recovered.nodes) == 2 and len(recovered.edges) == 1
+        assert wal.read_bytes() == intact
+        bob = recovered.get_or_create_node("Bob")
+        recovered.close()
+        assert bob in TemporalKnowledgeGraph.open(str(tmp_path)).nodes
+
+    def test_checkpoint_truncates_log(self, tmp_path):
+        graph, _ = self.build(str(tmp_path))
+        graph.checkpoint()
+        assert (tmp_path / "wal.jsonl").read_bytes() == b""
+        graph.get_or_create_node("Bob")
+        graph.close()
+        lines = (tmp_path / "wal.jsonl").read_bytes().splitlines()
+        assert [json.loads(line)["lsn"] for line in lines] == [4]
+        assert len(TemporalKnowledgeGraph.open(str(tmp_path)).nodes) == 3
+
+    def test_rejects_records_json_cannot_encode(self, tmp_path):
+        graph = PropertyGraph.open(str(tmp_path))
+        with pytest.raises(ValueError):
+            graph.get_or_create_node("Alice", properties={"at": datetime.now()})
+        assert graph.nodes == {}
+
+
+class TestConsolidation:
+    def test_merges_duplicates_within_a_session(self):
+        memory = IntegratedMemorySystem()
+        memory.store_fact("Alice lives in Paris", "Alice", session_id="A")
+        memory.store_fact("Alice lives in Paris", "Alice", session_id="A")
+        stats = memory.consolidate()
+        assert stats["merged"] == 1
+        results = memory.retrieve_memories("Alice Paris", session_id="A")
+        assert len(results) == 1
+        assert results[0]["metadata"]["merged_count"] == 2
+        archived = list(memory.archive)
+        assert archived[0]["reason"] == "near_duplicate"
+
+    def test_does_not_merge_across_sessions(self):
+        memory = IntegratedMemorySystem()
+        memory.store_fact("Alice lives in Paris", "Alice", session_id="A")
+        memory.store_fact("Alice lives in Paris", "Alice", session_id="B")
+        stats = memory.consolidate()
+        assert stats["merged"] == 0
+        for session in ("A", "B"):
+            results = memory.retrieve_memories("Alice Paris",
+                                               session_id=session)
+            assert len(results) == 1
+            assert results[0]["metadata"]["session_id"] == session
+
+    def test_only_new_rows_are_examined(self):
+        memory = IntegratedMemorySystem()
+        memory.store_fact("Alice lives in Paris", "Alice", session_id="A")
+        assert memory.consolidate()["merged"] == 0
+        memory.store_fact("Alice lives in Paris", "Alice", session_id="A")
+        assert memory.consolidate()["merged"] == 1
+        assert memory.consolidate()["merged"] == 0
+
+    def lives_in(self, memory, when):
+        return [r["target"]["properties"]["name"] for r in
+                memory.graph.query_at_time({"type": "LIVES_IN"}, when)]
+
+    def test_newer_edge_closes_older_one(self):
+        memory = IntegratedMemorySystem(exclusive_relationships=("LIVES_IN",))
+        memory.store_fact("Alice moved to Oslo", "Alice",
+                          timestamp=datetime(2023, 1, 1),
+                          relationships=[{"type": "LIVES_IN", "target": "Oslo"}])
+        memory.store_fact("Alice moved to Rome", "Alice",
+                          timestamp=datetime(2024, 6, 1),
+                          relationships=[{"type": "LIVES_IN", "target": "Rome"}])
+        assert memory.consolidate()["closed_edges"] == 1
+        assert self.lives_in(memory, datetime(2025, 1, 1)) == ["Rome"]
+        assert self.lives_in(memory, datetime(2023, 6, 1)) == ["Oslo"]
+
+    def test_older_edge_arriving_later_is_closed(self):
+        memory = IntegratedMemorySystem(exclusive_relationships=("LIVES_IN",))
+        memory.store_fact("Alice moved to Rome", "Alice",
+                          timestamp=datetime(2024, 6, 1),
+                          relationships=[{"type": "LIVES_IN", "target": "Rome"}])
+        memory.consolidate()
+        memory.store_fact("Alice moved to Oslo", "Alice",
+                          timestamp=datetime(2023, 1, 1),
+                          relationships=[{"type": "LIVES_IN", "target": "Oslo"}])
+        assert memory.consolidate()["closed_edges"] == 1
+        assert self.lives_in(memory, datetime(2025, 1, 1)) == ["Rome"]
+        assert self.lives_in(memory, datetime(2023, 6, 1)) == ["Oslo"]
+
+
+class TestDeletion:
+    def test_deleted_documents_are_skipped(self):
+        store = make_store()
+        doc_id = store.search("fact 42 about entity-2", limit=1)[0]["id"]
+        store.delete(doc_id)
+        assert len(store) == 199
+        assert doc_id not in ids(store.search("fact 42 about entity-2", limit=10))
+        assert doc_id not in ids(store.search_by_entity("entity-2", limit=100))
+        with pytest.raises(KeyError):
+            store.get(doc_id)
+        with pytest.raises(KeyError):
+            store.delete(doc_id)
+
+    @pytest.mark.parametrize("options", [_plain, _ivf, _int8, _pq, _bm25])
+    def test_compact_keeps_doc_ids_and_results(self, options):
+        store = make_store(**options())
+        for doc_id in range(0, 200, 3):
+            store.delete(doc_id)
+        queries = ["fact 10 about entity-0", "entity-4", "fact 101"]
+        before = [ids(store.search(q, limit=10)) for q in queries]
+        filtered = ids(store.search("fact", limit=10,
+                                    filters={"entity": "entity-1"}))
+        remap = store.compact()
+        assert remap[0] == -1 and remap[1] == 0 and remap[2] == 1
+        assert len(store) == store._count == 133
+        assert store.doc_ids.tolist() == [i for i in range(200) if i % 3]
+        assert store.get(100)["text"] == "fact 100 about entity-0"
+        assert store.row_of(100) == 66
+        assert [ids(store.search(q, limit=10)) for q in queries] == before
+        assert ids(store.search("fact", limit=10,
+                                filters={"entity": "entity-1"})) == filtered
+        if store.keyword_index is not None:
+            assert len(store.keyword_index) == 133
+            assert all(i % 3 for i in ids(store.keyword_search("fact", 50)))
+        assert store.add("new fact") == 200
+
+    def test_get_returns_a_copy(self):
+        store = make_store()
+        metadata = store.get(7)
+        metadata["entity"] = "someone-else"
+        assert store.get(7)["entity"] == "entity-7"
+        assert 7 in ids(store.search("fact", limit=50,
+                                     filters={"entity": "entity-7"}))
+
+    def test_update_reindexes_postings(self):
+        store = make_store()
+        metadata = store.get(7)
+        metadata["entity"] = "someone-else"
+        store.update(7, metadata)
+        metadata["entity"] = "drifted"  # the store keeps its own copy
+        assert ids(store.search("fact", limit=50,
+                                filters={"entity": "someone-else"})) == [7]
+        assert 7 not in ids(store.search("fact", limit=50,
+                                         filters={"entity": "entity-7"}))
+        assert store.search("fact", filters={"entity": "drifted"}) == []
+        assert 7 not in store.postings["entity"]["entity-7"]
+        store.compact([store.row_of(0)])
+        assert store.postings["entity"]["someone-else"] == [store.row_of(7)]
+
+    def test_auto_compact(self):
+        store = make_store(20, auto_compact=0.25)
+        for doc_id in range(4):
+            store.delete(doc_id)
+        assert store._count == 20
+        store.delete(4)
+        assert store._count == 15 and store._n_deleted == 0
+
+
+class TestHybridRetrieval:
+    def test_bm25_ranks_rare_terms(self):
+        store = make_store(keyword_index=BM25Index())
+        store.add("deploy failed with ERR-4012 in payments/api.py",
+                  {"text": "deploy failed with ERR-4012 in payments/api.py"})
+        for query in ("ERR-4012", "api.py", "payments"):
+            assert store.keyword_search(query, limit=1)[0]["id"] == 200
+        assert store.keyword_search("nothing matches", limit=5) == []
+
+    def test_keyword_search_needs_an_index(self):
+        with pytest.raises(ValueError):
+            make_store(10).keyword_search("fact")
+
+    def test_vector_retrieval_is_the_default(self):
+        memory = IntegratedMemorySystem()
+        assert memory.vector_store.keyword_index is None
+        memory.store_fact("Alice ships ERR-4012 fixes", "Alice", session_id="s")
+        results = memory.retrieve_memories("Alice ships ERR-4012 fixes",
+                                           session_id="s", mode="hybrid")
+        assert "ranks" not in results[0]
+        with pytest.raises(ValueError):
+            memory.retrieve_memories("ERR-4012", session_id="s", mode="keyword")
+        with pytest.raises(ValueError):
+            memory.retrieve_memories("ERR-4012", mode="fuzzy")
+
+    def test_hybrid_fuses_keyword_hits(self):
+        memory = IntegratedMemorySystem(keyword_index=True)
+        memory.store_facts([{"fact": f"note {i} about the weather",
+                             "entity": "Weather"} for i in range(30)]
+                           + [{"fact": "ERR-4012 broke checkout",
+                               "entity": "Checkout"}], session_id="s")
+        keyword = memory.retrieve_memories("ERR-4012", session_id="s",
+                                           mode="keyword")
+        assert keyword[0]["metadata"]["entity"] == "Checkout"
+        hybrid = memory.retrieve_memories("ERR-4012", session_id="s",
+                                          mode="hybrid")
+        checkout = [r for r in hybrid if r["metadata"]["entity"] == "Checkout"]
+        assert checkout[0]["ranks"]["keyword"] == 1
+        assert checkout[0]["score"] == hybrid[0]["score"]
+
+
+class TestSearchMany:
+    queries = ["fact 1 about entity-1", "fact 150 about entity-0", "entity-9",
+               "something else"]
+
+    @pytest.mark.parametrize("options", [_plain, _ivf, _int8, _pq])
+    def test_matches_search(self, options):
+        store = make_store(**options())
+        store.delete(1)
+        for filters in (None, {"entity": "entity-1"}, {"session_id": "s2"}):
+            batched = store.search_many(self.queries, limit=7, filters=filters,
+                                        block_size=64)
+            single = [store.search(q, limit=7, filters=filters)
+                      for q in self.queries]
+            assert [ids(r) for r in batched] == [ids(r) for r in single]
+            for many, one in zip(batched, single):
+                assert [r["score"] for r in many] == pytest.approx(
+                    [r["score"] for r in one], abs=1e-5)
+
+    def test_edge_cases(self):
+        store = make_store(10)
+        assert store.search_many([]) == []
+        assert store.search_many(["a", "b"], limit=0) == [[], []]
+        assert store.search_many(["a"], filters={"entity": "none"}) == [[]]
+        assert store.search_many(["a"], limit=50)[0] == store.search("a", 50)
+
+
+class TestCompactGraph:
+    def test_matches_property_graph(self):
+        graph, nodes = random_graph(n_nodes=60, n_edges=400)
+        compact = CompactGraph.from_graph(graph)
+        compact.merge_threshold = 8
+        ids_of = {node_id: compact.entity_registry[
+            graph.nodes[node_id]["properties"]["name"]] for node_id in nodes}
+        names = {v: graph.nodes[k]["properties"]["name"]
+                 for k, v in ids_of.items()}
+        # Edges added after the CSR build land in the tail first
+        rng = np.random.default_rng(1)
+        for source, target in rng.integers(0, 60, (50, 2)).tolist():
+            graph.create_relationship(nodes[source], "TYPE_0", nodes[target])
+            compact.create_relationship(ids_of[nodes[source]], "TYPE_0",
+                                        ids_of[nodes[target]])
+
+        for node_id in nodes[:10]:
+            for direction in ("outgoing", "incoming"):
+                expected = sorted(
+                    (r["edge"]["type"],
+                     graph.nodes[r["edge"]["source"]]["properties"]["name"],
+                     graph.nodes[r["edge"]["target"]]["properties"]["name"])
+                    for r in graph.get_relationships(node_id, direction))
+                actual = sorted(
+                    (r["edge"]["type"], names[r["edge"]["source"]],
+                     names[r["edge"]["target"]])
+                    for r in compact.get_relationships(ids_of[node_id],
+                                                       direction))
+                assert actual == expected
+            for kwargs in ({"max_hops": 2, "max_nodes": 1000},
+                           {"max_hops": 2, "edge_types": ["TYPE_1"],
+                            "direction": "outgoing"}):
+                expected = graph.traverse(node_id, **kwargs)["depth"]
+                result = compact.traverse(ids_of[node_id], **kwargs)
+                actual = dict(zip(result["nodes"].tolist(),
+                                  result["depth"].tolist()))
+                assert {names[n]: d for n, d in actual.items()} == {
+                    graph.nodes[n]["properties"]["name"]: d
+                    for n, d in expected.items()}
+            # Under a node cap the admitted subset may differ, not the depths
+            capped = compact.traverse(ids_of[node_id], max_hops=3, max_nodes=20)
+            full = compact.traverse(ids_of[node_id], max_hops=3, max_nodes=1000)
+            depths = dict(zip(full["nodes"].tolist(), full["depth"].tolist()))
+            assert len(capped["nodes"]) == 20
+            assert all(depths[n] == d for n, d in zip(
+                capped["nodes"].tolist(), capped["depth"].tolist()))
+
+    def test_query_and_nodes(self):
+        compact = CompactGraph(initial_capacity=1)
+        alice = compact.get_or_create_node("Alice", label="Person")
+        atlas = compact.get_or_create_node("Atlas", label="Project")
+        edge = compact.create_relationship(alice, "WORKS_ON", atlas,
+                                           {"since": 2020})
+        assert compact.get_or_create_node("Alice") == alice
+        assert compact.query({"type": "WORKS_ON",
+                              "target_label": "Project"}).tolist() == [edge]
+        assert compact.query({"type": "WORKS_ON",
+                              "source_label": "Project"}).tolist() == []
+        assert compact.get_edge(edge)["properties"] == {"since": 2020}
+        assert compact.get_node(alice)["properties"] == {"name": "Alice"}
+        with pytest.raises(ValueError):
+            compact.create_relationship(alice, "KNOWS", 99)
+
+
+class TestPartitions:
+    def test_least_recently_used_partition_is_evicted(self, tmp_path):
+        store = PartitionedVectorStore(str(tmp_path), max_resident=2,
+                                       dimension=DIMENSION)
+        texts, metadatas = facts(30)
+        store.add_many(texts, metadatas)
+        assert store.resident_keys() == ["s1", "s2"]
+        assert store.keys() == ["s1", "s2", "s0"]
+        assert len(store) == 30
+
+        results = store.search("fact 3 about entity-3", limit=3,
+                               filters={"session_id": "s0"})
+        assert results[0]["text"] == "fact 3 about entity-3"
+        assert results[0]["partition"] == "s0"
+        assert store.resident_keys() == ["s2", "s0"]
+
+    def test_entity_search_stays_in_resident_partitions(self, tmp_path):
+        store = PartitionedVectorStore(str(tmp_path), max_resident=1,
+                                       dimension=DIMENSION)
+        store.add_many(*facts(30))
+        assert {r["partition"] for r in
+                store.search_by_entity("entity-1", limit=30)} == {"s2"}
+        assert store.resident_keys() == ["s2"]
+        assert len(store.search_by_entity("entity-1", limit=30,
+                                          keys=store.keys())) == 3
+
+    def test_unfiltered_search_merges_partitions(self):
+        store = PartitionedVectorStore(dimension=DIMENSION)
+        store.add_many(*facts(30))
+        flat = VectorStore(DIMENSION, embedder=store.embedder)
+        flat.add_many(*facts(30))
+        assert [r["text"] for r in store.search("entity-4", limit=5)] == \
+            [r["text"] for r in flat.search("entity-4", limit=5)]
+
+    def test_memory_survives_restart(self, tmp_path):
+        options = {"partition_path": str(tmp_path / "sessions"),
+                   "graph_path": str(tmp_path / "graph")}
+        memory = IntegratedMemorySystem(**options)
+        memory.store_fact("Alice lives in Paris", "Alice", session_id="A",
+                          relationships=[{"type": "LIVES_IN",
+                                          "target": "Paris"}])
+        memory.close()
+
+        reopened = IntegratedMemorySystem(**options)
+        assert reopened.vector_store.keys() == ["A"]
+        assert reopened.retrieve_memories("Alice lives in Paris",
+                                          session_id="A")[0]["id"] == 0
+        assert reopened.retrieve_entity_context("Alice", session_id="A")[
+            "relationships"][0]["target"]["properties"]["name"] == "Paris"
+
+
+class TestShardedSearcher:
+    def test_matches_exact_search(self):
+        store = make_store(300)
+        store.delete(5)
+        queries = ["fact 5 about entity-5", "fact 250 about entity-0",
+                   "entity-2"]
+        with ShardedSearcher(store, n_shards=3) as searcher:
+            for filters in (None, {"entity": "entity-5"}):
+                assert [ids(r) for r in searcher.search_many(
+                    queries, limit=8, filters=filters)] == [
+                    ids(store.search(q, limit=8, filters=filters))
+                    for q in queries]
+            store.delete(15)  # after the snapshot: dropped at merge time
+            assert 15 not in ids(searcher.search("fact 15 about entity-5", 5))
+            store.add("fact 999", {"entity": "late"})
+            assert searcher.search("fact 999", 1)[0]["text"] != "fact 999"
+            searcher.refresh()
+            assert searcher.search("fact 999", 1)[0]["id"] == 300
+
+    def test_needs_float_vectors(self):
+        store = make_store(10, quantizer=ScalarQuantizer(DIMENSION))
+        with pytest.raises(ValueError):
+            ShardedSearcher(store)
+
+
+class TestConcurrency:
+    def test_readers_share_writers_exclude(self):
+        lock = ReadWriteLock()
+        inside, peak, order = [], [0], []
+        guard = threading.Lock()
+
+        def read():
+            with lock.read():
+                with guard:
+                    inside.append(1)
+                    peak[0] = max(peak[0], len(inside))
+                time.sleep(0.05)
+                with guard:
+                    inside.pop()
+
+        def write():
+            with lock.write():
+                order.append(len(inside))
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for thread in readers:
+            thread.start()
+        writer = threading.Thread(target=write)
+        writer.start()
+        for thread in readers + [writer]:
+            thread.join()
+        assert peak[0] > 1
+        assert order == [0]
+
+    def test_waiting_writer_blocks_new_readers(self):
+        lock = ReadWriteLock()
+        events = []
+        release = threading.Event()
+
+        def write():
+            with lock.write():
+                events.append("w")
+                release.wait()
+
+        def read():
+            with lock.read():
+                events.append("r")
+
+        writer = threading.Thread(target=write)
+        reader = threading.Thread(target=read)
+        with lock.read():
+            writer.start()
+            while not lock._writers_waiting:
+                time.sleep(0.001)
+            reader.start()
+            time.sleep(0.05)
+            assert events == []
+        while not events:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        assert events == ["w"]
+        release.set()
+        writer.join()
+        reader.join()
+        assert events == ["w", "r"]
+
+    def test_threads_store_and_retrieve(self):
+        memory = ConcurrentMemorySystem()
+        errors = []
+
+        def session(name):
+            try:
+                for i in range(20):
+                    memory.store_fact(name, f"{name} fact {i}", f"{name}-entity")
+                    results = memory.retrieve_memories(name, f"{name} fact {i}")
+                    assert all(r["metadata"]["session_id"] == name
+                               for r in results)
+            except Exception as e:  # surfaced below
+                errors.append(e)
+
+        threads = [threading.Thread(target=session, args=(f"s{i}",))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert len(memory.system.vector_store) == 80
+
+    def test_timings_are_per_call(self):
+        memory = IntegratedMemorySystem()
+        memory.store_fact("Alice lives in Paris", "Alice")
+        timings = {}
+        memory.retrieve_memories("Alice", timings=timings)
+        assert set(timings) == {"vector", "graph"}
+        assert not hasattr(memory, "timings")
+
+    def test_async_front_end(self):
+        async def run():
+            memory = AsyncMemorySystem()
+            await asyncio.gather(*(
+                memory.store_fact("s", f"fact {i}", "entity") for i in range(10)))
+            results = await memory.retrieve_memories("s", "fact 3", limit=10)
+            return memory, results
+
+        memory, results = asyncio.run(run())
+        assert len(memory.system.system.vector_store) == 10
+        assert results[0]["text"] == "fact 3"
+
+
+class TestTimeWindows:
+    moments = [None, datetime.min, datetime.max, EPOCH,
+               EPOCH + timedelta(days=45), EPOCH + timedelta(days=200),
+               (EPOCH + timedelta(days=90)).isoformat()]
+
+    def expected(self, store, since, until, as_of, filters=None):
+        lo = store._to_epoch(since) if since is not None else -np.inf
+        hi = store._to_epoch(until) if until is not None else np.inf
+        rows = []
+        for row in range(store._count):
+            metadata = store.metadata[row]
+            start = store._to_epoch(metadata["valid_from"])
+            end = (store._to_epoch(metadata["valid_until"])
+                   if metadata.get("valid_until") else np.inf)
+            if not lo <= start <= hi:
+                continue
+            if as_of is not None and not start <= store._to_epoch(as_of) < end:
+                continue
+            if filters and not store._matches_filters(metadata, filters):
+                continue
+            rows.append(row)
+        return rows
+
+    def test_windows_match_brute_force(self):
+        store = make_store()
+        for row in range(0, 200, 4):  # some facts have ended
+            metadata = store.get(row)
+            metadata["valid_until"] = (datetime.fromisoformat(
+                metadata["valid_from"]) + timedelta(days=20)).isoformat()
+            store.update(row, metadata)
+        for since, until, as_of in itertools.product(self.moments, repeat=3):
+            for filters in (None, {"entity": "entity-2"}):
+                rows = self.expected(store, since, until, as_of, filters)
+                window = {"since": since, "until": until, "as_of": as_of}
+                assert ids(store.search("fact about entity", limit=15,
+                                        filters=filters, **window)) == \
+                    exact_ids(store, "fact about entity", 15, rows)
+                assert [ids(r) for r in store.search_many(
+                    ["fact about entity"], limit=15, filters=filters,
+                    **window)] == [exact_ids(store, "fact about entity",
+                                             15, rows)]
+
+    def test_unbounded_extremes_select_everything(self):
+        store = make_store()
+        assert len(store.search("fact", limit=500, since=datetime.min,
+                                until=datetime.max)) == len(exact_ids(
+            store, "fact", 500))
+        assert store.search("fact", since=datetime.max) == []
+        assert store.search("fact", until=datetime.min) == []
+
+    def test_time_filter_in_retrieve_memories(self):
+        memory = IntegratedMemorySystem()
+        for year in (2020, 2022, 2024):
+            memory.store_fact(f"Alice note from {year}", "Alice",
+                              timestamp=datetime(year, 6, 1), session_id="s")
+        results = memory.retrieve_memories(
+            "Alice note from 2022", session_id="s",
+            time_filter={"since": datetime(2021, 1, 1),
+                         "until": "2023-01-01T00:00:00"})
+        assert [r["metadata"]["text"] for r in results] == [
+            "Alice note from 2022"]